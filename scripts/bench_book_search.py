@@ -0,0 +1,92 @@
+"""
+Measure !search over a synthetic books directory: time to index it from
+scratch, time to re-sync it unchanged (as after a restart), and query latency.
+
+Run with: uv run python -m scripts.bench_book_search [megabytes]
+"""
+
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from src.book_search import BookSearchIndex
+
+BOOK_BYTES = 1024 * 1024
+QUERIES = [
+    "whale harpoon",
+    "captain",
+    "the storm at sea",
+    "who wrote the letter",
+    "zeppelin",
+    # in most passages, so every one of them matches
+    "w0 w1",
+]
+ITERATIONS = 50
+
+
+def write_corpus(directory: Path, megabytes: int) -> list[str]:
+    rng = random.Random(0)
+    # a Zipf-ish vocabulary, so common and rare terms behave as in prose
+    vocabulary = (
+        ["the", "of", "and", "a", "to", "in", "at", "who"]
+        + [f"w{i}" for i in range(20_000)]
+        + [
+            "whale",
+            "harpoon",
+            "captain",
+            "storm",
+            "sea",
+            "letter",
+            "london",
+        ]
+    )
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    files = []
+    for n in range(megabytes):
+        words = rng.choices(vocabulary, weights, k=BOOK_BYTES // 6)
+        lines = [" ".join(words[i : i + 12]) for i in range(0, len(words), 12)]
+        paragraphs = ["\n".join(lines[i : i + 8]) for i in range(0, len(lines), 8)]
+        name = f"book{n:04d}.txt"
+        (directory / name).write_text("\n\n".join(paragraphs))
+        files.append(name)
+    return files
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.TemporaryDirectory() as tmp:
+        books = Path(tmp) / "books"
+        books.mkdir()
+        files = write_corpus(books, megabytes)
+        db_path = str(Path(tmp) / "index.sqlite3")
+
+        index = BookSearchIndex(str(books), db_path)
+        started = time.perf_counter()
+        index.sync(files)
+        print(f"indexed {megabytes} MB in {time.perf_counter() - started:.1f}s")
+        index.close()
+
+        index = BookSearchIndex(str(books), db_path)
+        started = time.perf_counter()
+        index.sync(files)
+        print(f"re-synced unchanged corpus in {time.perf_counter() - started:.3f}s")
+
+        for query in QUERIES:
+            timings = []
+            for _ in range(ITERATIONS):
+                started = time.perf_counter()
+                hits = index.search(query)
+                timings.append((time.perf_counter() - started) * 1000)
+            print(
+                f"{query!r:>22}: {len(hits)} hits, "
+                f"median {statistics.median(timings):.2f} ms, "
+                f"max {max(timings):.2f} ms"
+            )
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measure fuzzy book-title resolution over a large synthetic catalog: time to
+build the trigram index, lookup latency for near-miss titles, and the cost of
+resolving a whole "!book <title> <question>" command, first time and repeated.
+
+Run with: uv run python -m scripts.bench_book_titles [titles]
+"""
+
+import random
+import statistics
+import string
+import sys
+import time
+
+from src.book_catalog import BookCatalog
+from src.clients.bang_command_handler_client import BangCommandHandlerClient
+
+QUERIES = ["war peace", "war and paece", "the grate gatsby", "moby dik", "the of and"]
+ITERATIONS = 200
+COMMAND = (
+    "war and paece who does Natasha dance with at her first ball and what does "
+    "Andrei think of her when he sees her there"
+).split()
+
+
+def make_titles(count: int) -> list[str]:
+    rng = random.Random(0)
+    words = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+        for _ in range(5000)
+    ] + ["the", "of", "and", "a"] * 50
+    titles = [
+        " ".join(rng.choices(words, k=rng.randint(2, 5))).title() + ".txt"
+        for _ in range(count)
+    ]
+    return titles + ["War and Peace.txt", "The Great Gatsby.txt", "Moby Dick.txt"]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    titles = make_titles(count)
+    catalog = BookCatalog("unused")
+
+    started = time.perf_counter()
+    catalog.replace(titles)
+    print(f"indexed {len(titles)} titles in {time.perf_counter() - started:.2f}s")
+    started = time.perf_counter()
+    catalog.replace(titles + ["One More Book.txt"])
+    print(f"re-indexed with one new title in {time.perf_counter() - started:.2f}s")
+
+    for query in QUERIES:
+        timings = []
+        for _ in range(ITERATIONS):
+            catalog._snapshot.resolved.clear()  # time the lookup, not the memo
+            started = time.perf_counter()
+            match = catalog.fuzzy_resolve(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        print(
+            f"{query!r:>20} -> {match.file if match else None}: "
+            f"median {statistics.median(timings):.3f} ms, max {max(timings):.3f} ms"
+        )
+
+    client = BangCommandHandlerClient()
+    client.book_catalog = catalog
+    started = time.perf_counter()
+    book_file, question = client._resolve_book_args(COMMAND)
+    first = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    client._resolve_book_args(COMMAND)
+    again = (time.perf_counter() - started) * 1000
+    print(
+        f"{len(COMMAND)}-word command -> {book_file} + {len(question)} words: "
+        f"{first:.2f} ms first, {again:.3f} ms repeated"
+    )
+
+
+if __name__ == "__main__":
+    main()
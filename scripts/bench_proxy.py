@@ -0,0 +1,127 @@
+"""
+Compare the per-request overhead of the old `@app.middleware("http")` proxy
+against the pure ASGI `ProxyApp`.
+
+Both apps forward to an in-process mock upstream, so the numbers only measure
+proxy overhead (routing, middleware wrapping, body relay).
+
+Run with: uv run python -m scripts.bench_proxy
+"""
+
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from starlette.background import BackgroundTask
+
+from src.proxy import ProxyApp
+
+REQUESTS = 2000
+CONCURRENCY = 32
+SSE_BODY = b"".join(f'data: {{"i": {i}}}\n\n'.encode() for i in range(20))
+
+
+async def upstream_handler(request: httpx.Request) -> httpx.Response:
+    if request.url.path.endswith("/chat/completions"):
+        return httpx.Response(
+            200, headers={"content-type": "text/event-stream"}, content=SSE_BODY
+        )
+    return httpx.Response(200, json={"data": []})
+
+
+class PassthroughHydrator:
+    async def get_hydrated_body(self, body, deadline_seconds=None):
+        return body
+
+
+def build_middleware_app(client: httpx.AsyncClient) -> FastAPI:
+    """The proxy as it was before ProxyApp: a catch-all http middleware."""
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def proxy_middleware(request: Request, call_next):
+        body = None
+        if request.method != "GET":
+            body = await request.body()
+        headers = dict(request.headers)
+        headers.pop("content-length", None)
+        headers.pop("host", None)
+        upstream_request = client.build_request(
+            request.method,
+            f"http://upstream{request.url.path}",
+            headers=headers,
+            content=body,
+        )
+        response = await client.send(upstream_request, stream=True)
+        final_headers = dict(response.headers)
+        for name in ("content-encoding", "content-length", "transfer-encoding"):
+            final_headers.pop(name, None)
+        return StreamingResponse(
+            content=response.aiter_bytes(),
+            status_code=response.status_code,
+            headers=final_headers,
+            background=BackgroundTask(response.aclose),
+        )
+
+    return app
+
+
+def build_asgi_app(client: httpx.AsyncClient) -> FastAPI:
+    proxy = ProxyApp(base_url="http://upstream", hydrator=PassthroughHydrator())
+    proxy.client = client
+    app = FastAPI()
+    app.mount("/", proxy)
+    return app
+
+
+async def run(name: str, app, method: str, path: str, body: bytes | None):
+    latencies: list[float] = []
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(REQUESTS):
+        queue.put_nowait(i)
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://proxy"
+    ) as client:
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.request(method, path, content=body)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+        elapsed = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:<28} {REQUESTS / elapsed:>9.0f} req/s   "
+        f"p50 {quantiles[49] * 1000:>6.2f} ms   p99 {quantiles[98] * 1000:>6.2f} ms"
+    )
+
+
+async def main():
+    # logging would dominate the measurement
+    logger.remove()
+    upstream = httpx.AsyncClient(transport=httpx.MockTransport(upstream_handler))
+    chat_body = b'{"messages": [{"role": "user", "content": "hi"}], "stream": true}'
+    scenarios = [
+        ("GET /v1/models", "GET", "/v1/models", None),
+        ("POST /v1/chat/completions", "POST", "/v1/chat/completions", chat_body),
+    ]
+    for label, method, path, body in scenarios:
+        print(f"--- {label} ({REQUESTS} requests, concurrency {CONCURRENCY}) ---")
+        await run("middleware", build_middleware_app(upstream), method, path, body)
+        await run("asgi ProxyApp", build_asgi_app(upstream), method, path, body)
+    await upstream.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Compare ContextSnippet.to_xml against the ElementTree + minidom rendering it
+replaced, on small website snippets and on book-sized command results.
+
+Run with: uv run python -m scripts.bench_to_xml
+"""
+
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+
+from src.models.context import (
+    CommandContextSnippet,
+    ContextSnippet,
+    WebsiteContextSnippet,
+)
+
+PARAGRAPH = (
+    "It was the best of times, it was the worst of times & the <age> of "
+    '"wisdom", it was the age of foolishness.\n'
+)
+
+
+def minidom_to_xml(snippet: ContextSnippet) -> str:
+    """The previous to_xml: build a tree, serialize, re-parse, pretty-print."""
+    root = ET.Element("context-snippet")
+    root.set("type", snippet.type.value)
+    for key, value in snippet.content.items():
+        if value is not None:
+            elem = ET.SubElement(root, key.replace("_", "-"))
+            elem.text = str(value)
+    xml_str = ET.tostring(root, encoding="unicode")
+    pretty_xml = minidom.parseString(xml_str).toprettyxml(indent="  ")
+    lines = pretty_xml.split("\n")
+    if lines[0].startswith("<?xml"):
+        pretty_xml = "\n".join(lines[1:])
+    return pretty_xml
+
+
+def run(name: str, render, snippet: ContextSnippet, iterations: int):
+    render(snippet)  # warm up
+    started = time.perf_counter()
+    for _ in range(iterations):
+        render(snippet)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    render(snippet)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"  {name:<16} {elapsed / iterations * 1000:9.3f} ms/render  "
+        f"peak {peak / 1024 / 1024:7.2f} MiB"
+    )
+
+
+def main():
+    cases = [
+        (
+            "small website snippet",
+            WebsiteContextSnippet(
+                url="https://example.com/article",
+                text_content=PARAGRAPH * 20,
+                title="An article",
+            ),
+            2000,
+        ),
+        (
+            "book (~5 MB)",
+            CommandContextSnippet(
+                command_query="books detail tale-of-two-cities",
+                result_text=PARAGRAPH * 40_000,
+                source="Local Book Collection",
+            ),
+            5,
+        ),
+    ]
+    for label, snippet, iterations in cases:
+        assert snippet.to_xml() == minidom_to_xml(snippet)
+        print(label)
+        run("minidom", minidom_to_xml, snippet, iterations)
+        run("template", ContextSnippet.to_xml, snippet, iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import lru_cache
+from itertools import chain
+from typing import Iterable, NamedTuple
+
+import loguru
+
+logger = loguru.logger
+
+# how often a lookup may stat the books directory to notice added or removed
+# books; 0 checks on every lookup
+BOOK_CATALOG_POLL_SECONDS = float(os.getenv("BOOK_CATALOG_POLL_SECONDS", 1))
+# least trigram similarity (0-1) for a fuzzy title match to be used on its own
+BOOK_FUZZY_MATCH_THRESHOLD = float(os.getenv("BOOK_FUZZY_MATCH_THRESHOLD", 0.5))
+# how far ahead of the runner-up a fuzzy match must be to not be ambiguous
+FUZZY_MATCH_MARGIN = 0.1
+# trigrams in more than this share of titles ("the"), and more than
+# COMMON_TRIGRAM_MIN_TITLES, are too common to narrow down candidates; they
+# still count when candidates are scored
+COMMON_TRIGRAM_SHARE = 0.01
+COMMON_TRIGRAM_MIN_TITLES = 64
+FUZZY_CANDIDATES = 20
+# fuzzy resolutions remembered per catalog snapshot, so the several lookups a
+# command makes on its way through the hydrator score it once
+FUZZY_RESOLVE_CACHE_SIZE = 4096
+NON_ALPHANUMERIC = re.compile(r"[\W_]+")
+# a directory modified this recently may change again within the same mtime
+# tick, so it is rescanned until its mtime settles
+_MTIME_SETTLE_SECONDS = 2.0
+
+
+def normalize_book_name(name: str) -> str:
+    """Name a book is looked up by: lowercase, without the .txt extension."""
+    normalized = name.lower()
+    if normalized.endswith(".txt"):
+        normalized = normalized[:-4]
+    return normalized
+
+
+def title_words(name: str) -> list[str]:
+    return NON_ALPHANUMERIC.sub(" ", normalize_book_name(name)).split()
+
+
+def title_trigrams(name: str) -> frozenset[str]:
+    """
+    Trigrams of each word of a book name, padded as in pg_trgm, so word order
+    and punctuation ("war_and_peace", "War & Peace") matter little.
+    """
+    return frozenset().union(*map(_word_trigrams, title_words(name)))
+
+
+@lru_cache(maxsize=65536)
+def _word_trigrams(word: str) -> frozenset[str]:
+    # titles share most of their words, so each word is split once
+    padded = f"  {word} "
+    return frozenset(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+class _Snapshot(NamedTuple):
+    files: tuple[str, ...]
+    index: dict[str, str]  # normalized name -> filename
+    trigrams: list[frozenset[str]]  # per file
+    postings: dict[str, list[int]]  # trigram -> positions in files
+    max_title_words: int
+    resolved: dict[str, "FuzzyMatch | None"]  # fuzzy_resolve results so far
+
+
+def _snapshot(files: Iterable[str], previous: _Snapshot | None = None) -> _Snapshot:
+    files = tuple(files)
+    index: dict[str, str] = {}
+    for filename in files:
+        # the first spelling listed wins, as with a linear scan
+        index.setdefault(normalize_book_name(filename), filename)
+    # titles already in the previous snapshot keep their trigrams
+    known = dict(zip(previous.files, previous.trigrams)) if previous else {}
+    trigrams = [known.get(filename) or title_trigrams(filename) for filename in files]
+    postings: dict[str, list[int]] = defaultdict(list)
+    for position, title in enumerate(trigrams):
+        for trigram in title:
+            postings[trigram].append(position)
+    max_title_words = max((len(title_words(filename)) for filename in files), default=0)
+    return _Snapshot(files, index, trigrams, dict(postings), max_title_words, {})
+
+
+class FuzzyMatch(NamedTuple):
+    file: str
+    score: float  # Jaccard similarity of title trigrams, 0-1
+
+
+def _fuzzy_match(snapshot: _Snapshot, name: str, limit: int) -> list[FuzzyMatch]:
+    query = title_trigrams(name)
+    if not query or not snapshot.files:
+        return []
+    common = max(
+        COMMON_TRIGRAM_MIN_TITLES, int(len(snapshot.files) * COMMON_TRIGRAM_SHARE)
+    )
+    postings = [snapshot.postings.get(trigram, ()) for trigram in query]
+    # a title made only of common words falls back to its rarest trigrams
+    selective = [p for p in postings if len(p) <= common] or sorted(postings, key=len)[
+        :3
+    ]
+    candidates = Counter(chain.from_iterable(selective)).most_common(FUZZY_CANDIDATES)
+
+    matches = []
+    for position, _ in candidates:
+        trigrams = snapshot.trigrams[position]
+        shared = len(query & trigrams)
+        score = shared / (len(query) + len(trigrams) - shared)
+        matches.append(FuzzyMatch(snapshot.files[position], score))
+    matches.sort(key=lambda match: match.score, reverse=True)
+    return matches[:limit]
+
+
+class BookCatalog:
+    """
+    The .txt books in a directory, indexed by normalized name.
+
+    Lookups are O(1) against an immutable snapshot that scans replace whole, so
+    concurrent requests always see a consistent catalog. refresh() rescans only
+    when the directory's mtime says books were added, removed or renamed, and
+    stats the directory at most once per poll interval. Both are blocking file
+    work: async callers run refresh() in a thread when refresh_due says so.
+    """
+
+    def __init__(self, books_dir: str, poll_seconds: float = BOOK_CATALOG_POLL_SECONDS):
+        self.books_dir = books_dir
+        self.poll_seconds = poll_seconds
+        self._snapshot = _snapshot(())
+        self._scan_lock = threading.Lock()
+        self._signature: tuple[int, int] | None = None  # (st_ino, st_mtime_ns)
+        # whether the directory's mtime was old enough to trust at the last scan
+        self._settled = False
+        self._checked_at = float("-inf")
+
+    @property
+    def files(self) -> tuple[str, ...]:
+        return self._snapshot.files
+
+    def replace(self, files: Iterable[str]):
+        """Set the catalog's books directly, without touching the filesystem."""
+        self._snapshot = _snapshot(files, self._snapshot)
+
+    def match(self, name: str) -> str | None:
+        """Filename of the book called name, ignoring case and .txt."""
+        normalized = normalize_book_name(name)
+        return self._snapshot.index.get(normalized) if normalized else None
+
+    @property
+    def max_title_words(self) -> int:
+        """Words in the longest title, as title_words splits them."""
+        return self._snapshot.max_title_words
+
+    def fuzzy_match(self, name: str, limit: int = 5) -> list[FuzzyMatch]:
+        """
+        Books whose titles are most similar to name, best first. Candidates
+        come from the trigram postings (skipping trigrams common to many
+        titles), so a lookup touches a few short lists, not every title.
+        """
+        return _fuzzy_match(self._snapshot, name, limit)
+
+    def fuzzy_resolve(self, name: str) -> FuzzyMatch | None:
+        """The fuzzy match for name if it is good enough and clearly the best."""
+        snapshot = self._snapshot
+        key = " ".join(title_words(name))
+        if key in snapshot.resolved:
+            return snapshot.resolved[key]
+        matches = _fuzzy_match(snapshot, name, limit=2)
+        if not matches or matches[0].score < BOOK_FUZZY_MATCH_THRESHOLD:
+            match = None
+        elif (
+            len(matches) > 1
+            and matches[0].score - matches[1].score < FUZZY_MATCH_MARGIN
+        ):
+            match = None  # ambiguous, let the user pick from a shortlist
+        else:
+            match = matches[0]
+        if len(snapshot.resolved) >= FUZZY_RESOLVE_CACHE_SIZE:
+            snapshot.resolved.clear()
+        snapshot.resolved[key] = match
+        return match
+
+    @property
+    def refresh_due(self) -> bool:
+        """Whether the poll interval has passed, so refresh() would stat."""
+        return time.monotonic() - self._checked_at >= self.poll_seconds
+
+    def refresh(self):
+        """Rescan if the directory changed since the last scan."""
+        if not self.refresh_due:
+            return
+        self._checked_at = time.monotonic()
+        if self._stat()[0] != self._signature or not self._settled:
+            self.scan()
+
+    def scan(self):
+        """List the directory again and rebuild the index."""
+        with self._scan_lock:
+            logger.info(f"Scanning for book files in: {self.books_dir}")
+            # stat before listing, so a change made meanwhile is seen next time
+            self._signature, self._settled = self._stat()
+
+            if not os.path.isdir(self.books_dir):
+                logger.warning(
+                    f"Books directory '{self.books_dir}' not found. No books will be available."
+                )
+                self._snapshot = _snapshot(())
+                return
+
+            try:
+                files = [
+                    filename
+                    for filename in os.listdir(self.books_dir)
+                    if filename.endswith(".txt")
+                    and os.path.isfile(os.path.join(self.books_dir, filename))
+                ]
+            except Exception as e:
+                logger.error(f"Error scanning book directory '{self.books_dir}': {e}")
+                self._snapshot = _snapshot(())
+                self._settled = False  # try again at the next poll
+                return
+
+            if files:
+                logger.info(f"Found {len(files)} book(s)")
+            else:
+                logger.warning(f"No .txt files found in '{self.books_dir}'.")
+            self._snapshot = _snapshot(files, self._snapshot)
+
+    def _stat(self) -> tuple[tuple[int, int] | None, bool]:
+        """The directory's signature, and whether its mtime can be trusted."""
+        try:
+            stat = os.stat(self.books_dir)
+        except OSError:
+            return None, True  # a missing directory is rescanned once it appears
+        settled = time.time() - stat.st_mtime >= _MTIME_SETTLE_SECONDS
+        return (stat.st_ino, stat.st_mtime_ns), settled
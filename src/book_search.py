@@ -0,0 +1,466 @@
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator, NamedTuple
+
+import loguru
+
+from src.book_sections import read_range
+from src.stopwords import STOPWORDS
+
+logger = loguru.logger
+
+# where the full-text index of the books directory is kept between restarts
+BOOK_SEARCH_INDEX_PATH = os.getenv(
+    "BOOK_SEARCH_INDEX_PATH", "./context/book_search.sqlite3"
+)
+# how often a search checks indexed books for edits; added and removed books
+# are noticed through the book catalog as soon as it sees them
+BOOK_SEARCH_SYNC_SECONDS = float(os.getenv("BOOK_SEARCH_SYNC_SECONDS", 30))
+# passages end at the first paragraph break after this many bytes, or at the
+# first line break after PASSAGE_MAX_BYTES
+PASSAGE_TARGET_BYTES = 1024
+PASSAGE_MAX_BYTES = 4 * PASSAGE_TARGET_BYTES
+# a query word found in more passages than this is left out of a query that
+# has rarer words: it adds little to the ranking, but every passage holding it
+# would be scored
+BOOK_SEARCH_COMMON_TERM_PASSAGES = int(
+    os.getenv("BOOK_SEARCH_COMMON_TERM_PASSAGES", 5000)
+)
+# passages are indexed in batches, and the indexing thread yields the GIL to
+# the event loop after each one
+INDEX_BATCH_PASSAGES = 256
+# the index only holds terms, not text, so it cannot unindex the old text of
+# an edited or removed book; its passages stay behind, unreachable, and the
+# index is rebuilt once they outnumber this share of the live ones
+DEAD_PASSAGE_SHARE = 0.25
+EXCERPT_WORDS = 32
+
+TOKENIZE = "porter unicode61 remove_diacritics 2"
+# bump when the schema or passage splitting changes; older indexes are rebuilt
+SCHEMA_VERSION = 2
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+-- AUTOINCREMENT: ids of dead passages, still in passage_text, are never reused
+CREATE TABLE IF NOT EXISTS passages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_id INTEGER NOT NULL,
+    start_offset INTEGER NOT NULL,
+    end_offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS passages_by_book ON passages (book_id);
+CREATE TABLE IF NOT EXISTS index_state (dead_passages INTEGER NOT NULL);
+-- contentless: passage text is read back from the book by its byte range
+CREATE VIRTUAL TABLE IF NOT EXISTS passage_text USING fts5(
+    text, content = '', tokenize = '{TOKENIZE}'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS passage_terms USING fts5vocab(passage_text, row);
+"""
+# per search connection: what the tokenizer makes of each query word
+QUERY_SCHEMA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS temp.query_text USING fts5(
+    text, content = '', tokenize = '{TOKENIZE}'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS temp.query_terms USING fts5vocab(
+    temp, query_text, instance
+);
+"""
+# ranked inside the full-text table first, so only the best rows are joined;
+# dead passages among them drop out at the join, which the caller allows for
+SEARCH_QUERY = """
+SELECT books.file, passages.start_offset, passages.end_offset, ranked.rank
+FROM (
+    SELECT rowid, rank FROM passage_text
+    WHERE passage_text MATCH ?
+    ORDER BY rank
+    LIMIT ?
+) AS ranked
+JOIN passages ON passages.id = ranked.rowid
+JOIN books ON books.id = passages.book_id
+ORDER BY ranked.rank
+LIMIT ?
+"""
+TERM = re.compile(r"\w+")
+# a line holding nothing but whitespace, from its start to its line break
+BLANK_LINE = re.compile(rb"^[ \t\r\x0b\x0c]*\n", re.MULTILINE)
+
+
+class SearchHit(NamedTuple):
+    file: str
+    start: int  # byte range of the passage in the book
+    end: int
+    score: float  # BM25, higher is better
+    excerpt: str
+
+
+def split_passages(data: bytes | mmap.mmap) -> Iterator[tuple[int, int]]:
+    """
+    Byte ranges of the passages of a book: each ends at the first blank line
+    ending PASSAGE_TARGET_BYTES or more in, or else at the first line break
+    PASSAGE_MAX_BYTES or more in. Breaks are found by searching, not by
+    walking the book line by line in Python.
+    """
+    size = len(data)
+    start = 0
+    while start < size:
+        longest = data.find(b"\n", start + PASSAGE_MAX_BYTES - 1)
+        longest = size if longest < 0 else longest + 1
+        # a blank line ending past the target begins on the line holding it
+        target = start + PASSAGE_TARGET_BYTES
+        line_start = max(start, data.rfind(b"\n", start, target - 1) + 1)
+        blank = BLANK_LINE.search(data, line_start, longest)
+        end = blank.end() if blank is not None else longest
+        yield start, end
+        start = end
+
+
+def query_words(terms: str) -> list[str]:
+    """The words of terms to search for: stopwords only when there is nothing else."""
+    words = TERM.findall(terms)
+    return [word for word in words if word.lower() not in STOPWORDS] or words
+
+
+def to_match_query(terms: str) -> str | None:
+    """FTS5 query ranking passages by any of the words in terms."""
+    return _match_query(query_words(terms))
+
+
+def _match_query(words: list[str]) -> str | None:
+    return " OR ".join(f'"{word}"' for word in words) or None
+
+
+def excerpt(text: str, stems: Iterable[str]) -> str:
+    """About EXCERPT_WORDS words of text, from just before the first word
+    starting with one of stems (the indexed forms of the query words)."""
+    stems = tuple(stems)
+    words = text.split()
+    first = next(
+        (
+            i
+            for i, word in enumerate(words)
+            if any(token.startswith(stems) for token in TERM.findall(word.lower()))
+        ),
+        0,
+    )
+    begin = max(0, first - EXCERPT_WORDS // 4)
+    end = begin + EXCERPT_WORDS
+    return (
+        ("..." if begin else "")
+        + " ".join(words[begin:end])
+        + ("..." if end < len(words) else "")
+    )
+
+
+class BookSearchIndex:
+    """
+    BM25 full-text search over the books directory, backed by an SQLite FTS5
+    index on disk.
+
+    Books are split into passages of about a kilobyte and indexed with their
+    byte ranges, so hits can be read back with "!book <title> bytes a-b". The
+    index holds terms only; excerpts are read from the books. sync()
+    re-indexes only books whose mtime or size changed and drops books that
+    are gone, one transaction per book, so a restart or a single edited book
+    does not re-index the corpus. sync_in_background() runs it on a worker
+    thread. Searches use their own connection and answer from the index as it
+    stands while a sync is under way.
+
+    Words in more than BOOK_SEARCH_COMMON_TERM_PASSAGES passages are dropped
+    from queries that have rarer ones. A query made only of such words still
+    scores every passage holding them, so it slows down as the corpus grows.
+    """
+
+    def __init__(self, books_dir: str, db_path: str = BOOK_SEARCH_INDEX_PATH):
+        self.books_dir = books_dir
+        self.db_path = db_path
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._writer: sqlite3.Connection | None = None
+        self._reader: sqlite3.Connection | None = None
+        self._synced_files: tuple[str, ...] | None = None
+        self._synced_at = float("-inf")
+        # background sync: the newest file list waiting for the worker thread
+        self._pending_lock = threading.Lock()
+        self._pending_files: tuple[str, ...] | None = None
+        self._sync_thread: threading.Thread | None = None
+        self._closing = threading.Event()
+
+    def _make_parent_dir(self):
+        if os.path.dirname(self.db_path):
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+    def _connect(self):
+        if self._writer is not None:
+            return
+        self._make_parent_dir()
+        writer = sqlite3.connect(self.db_path, check_same_thread=False)
+        writer.execute("PRAGMA journal_mode = WAL")
+        if writer.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            logger.info(f"Creating book search index at {self.db_path}")
+            writer.executescript(
+                "DROP TABLE IF EXISTS books; DROP TABLE IF EXISTS passages;"
+                "DROP TABLE IF EXISTS passage_terms;"
+                "DROP TABLE IF EXISTS passage_text;"
+                "DROP TABLE IF EXISTS index_state;"
+            )
+            writer.executescript(SCHEMA)
+            writer.execute("INSERT INTO index_state (dead_passages) VALUES (0)")
+            writer.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            writer.commit()
+        self._writer = writer
+
+    def _is_current(self, files: tuple[str, ...]) -> bool:
+        return (
+            files == self._synced_files
+            and time.monotonic() - self._synced_at < BOOK_SEARCH_SYNC_SECONDS
+        )
+
+    def sync(self, files: Iterable[str], force: bool = False):
+        """
+        Bring the index in line with files (names in the books directory).
+        Without force, indexed books are only checked for edits once per
+        BOOK_SEARCH_SYNC_SECONDS unless the set of files changed.
+        """
+        files = tuple(sorted(files))
+        if not force and self._is_current(files):
+            return
+        now = time.monotonic()
+
+        with self._write_lock:
+            self._connect()
+            self._compact_if_needed()
+            indexed = {
+                file: (book_id, mtime_ns, size)
+                for book_id, file, mtime_ns, size in self._writer.execute(
+                    "SELECT id, file, mtime_ns, size FROM books"
+                )
+            }
+            for file in set(indexed) - set(files):
+                self._remove_book(indexed[file][0])
+            for file in files:
+                if self._closing.is_set():
+                    return  # picked up where it left off on the next sync
+                try:
+                    stat = os.stat(os.path.join(self.books_dir, file))
+                except OSError:
+                    continue
+                current = indexed.get(file)
+                if current is None or current[1:] != (stat.st_mtime_ns, stat.st_size):
+                    try:
+                        self._index_book(file, stat, current[0] if current else None)
+                    except (OSError, ValueError) as e:
+                        # rolled back; tried again on the next sync
+                        logger.error(f"Error indexing book file '{file}': {e}")
+            self._synced_files = files
+            self._synced_at = now
+
+    def sync_in_background(self, files: Iterable[str]):
+        """
+        Like sync(), on a worker thread. Returns at once; a call made while a
+        sync runs is folded into one more sync with the newest file list.
+        """
+        files = tuple(sorted(files))
+        with self._pending_lock:
+            if self._closing.is_set() or (
+                self._sync_thread is None and self._is_current(files)
+            ):
+                return
+            self._pending_files = files
+            if self._sync_thread is None:
+                self._sync_thread = threading.Thread(
+                    target=self._sync_pending, name="book-search-sync", daemon=True
+                )
+                self._sync_thread.start()
+
+    def _sync_pending(self):
+        while True:
+            with self._pending_lock:
+                files = self._pending_files
+                self._pending_files = None
+                if files is None or self._closing.is_set():
+                    self._sync_thread = None
+                    return
+            try:
+                self.sync(files)
+            except Exception as e:
+                logger.error(f"Error syncing book search index: {e}")
+
+    @property
+    def indexing(self) -> bool:
+        """Whether a background sync is running, so searches may miss books."""
+        return self._sync_thread is not None
+
+    def _compact_if_needed(self):
+        """Start the index afresh once dead passages make up too much of it."""
+        dead, live = self._writer.execute(
+            "SELECT dead_passages, (SELECT count(*) FROM passages) FROM index_state"
+        ).fetchone()
+        if dead <= DEAD_PASSAGE_SHARE * live:
+            return
+        logger.info(f"Rebuilding book search index: {dead} dead passage(s)")
+        with self._writer:
+            self._writer.execute(
+                "INSERT INTO passage_text (passage_text) VALUES ('delete-all')"
+            )
+            self._writer.execute("DELETE FROM passages")
+            self._writer.execute("DELETE FROM books")
+            self._writer.execute("UPDATE index_state SET dead_passages = 0")
+
+    def _remove_book(self, book_id: int):
+        with self._writer:
+            self._delete_passages(book_id)
+            self._writer.execute("DELETE FROM books WHERE id = ?", (book_id,))
+
+    def _delete_passages(self, book_id: int):
+        # their terms stay in passage_text, see DEAD_PASSAGE_SHARE
+        removed = self._writer.execute(
+            "DELETE FROM passages WHERE book_id = ?", (book_id,)
+        ).rowcount
+        self._writer.execute(
+            "UPDATE index_state SET dead_passages = dead_passages + ?", (removed,)
+        )
+
+    def _index_book(self, file: str, stat: os.stat_result, book_id: int | None):
+        logger.info(f"Indexing {file} for search")
+        started = time.perf_counter()
+        with self._writer:
+            if book_id is not None:
+                self._delete_passages(book_id)
+                self._writer.execute(
+                    "UPDATE books SET mtime_ns = ?, size = ? WHERE id = ?",
+                    (stat.st_mtime_ns, stat.st_size, book_id),
+                )
+            else:
+                book_id = self._writer.execute(
+                    "INSERT INTO books (file, mtime_ns, size) VALUES (?, ?, ?)",
+                    (file, stat.st_mtime_ns, stat.st_size),
+                ).lastrowid
+            count = 0
+            if stat.st_size:
+                with (
+                    open(os.path.join(self.books_dir, file), "rb") as f,
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data,
+                ):
+                    # streamed from the mapping, so a large book is never
+                    # held in memory as a whole
+                    batch = []
+                    for start, end in split_passages(data):
+                        passage_id = self._writer.execute(
+                            "INSERT INTO passages (book_id, start_offset, end_offset) "
+                            "VALUES (?, ?, ?)",
+                            (book_id, start, end),
+                        ).lastrowid
+                        batch.append(
+                            (
+                                passage_id,
+                                data[start:end].decode("utf-8", errors="replace"),
+                            )
+                        )
+                        if len(batch) == INDEX_BATCH_PASSAGES:
+                            count += self._index_passages(batch)
+                            batch = []
+                    count += self._index_passages(batch)
+        logger.info(
+            f"Indexed {count} passage(s) of {file} "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+    def _index_passages(self, batch: list[tuple[int, str]]) -> int:
+        # tokenizing runs inside SQLite, which releases the GIL while it works
+        self._writer.executemany(
+            "INSERT INTO passage_text (rowid, text) VALUES (?, ?)", batch
+        )
+        time.sleep(0)  # and the event loop gets it back between batches
+        return len(batch)
+
+    def search(self, terms: str, limit: int = 5) -> list[SearchHit]:
+        """The limit best passages for terms, by BM25."""
+        words = query_words(terms)
+        if not words:
+            return []
+        with self._read_lock:
+            if self._reader is None:
+                self._make_parent_dir()
+                # autocommit, so no open transaction pins an old snapshot
+                self._reader = sqlite3.connect(
+                    self.db_path, check_same_thread=False, isolation_level=None
+                )
+                self._reader.executescript(QUERY_SCHEMA)
+            try:
+                stems = self._stems(words)
+                words = self._drop_common_words(words, stems)
+                (dead,) = self._reader.execute(
+                    "SELECT dead_passages FROM index_state"
+                ).fetchone()
+                rows = self._reader.execute(
+                    SEARCH_QUERY, (_match_query(words), limit + dead, limit)
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                # nothing indexed yet, or the schema is being rebuilt
+                logger.warning(f"Book search index not ready: {e}")
+                return []
+        stems = [stems[word] for word in words if word in stems]
+        # FTS5 ranks by negated BM25 so that ascending order is best first
+        return [
+            SearchHit(file, start, end, -rank, self._excerpt(file, start, end, stems))
+            for file, start, end, rank in rows
+        ]
+
+    def _stems(self, words: list[str]) -> dict[str, str]:
+        """Each word as the index stores it (lowercase, stemmed)."""
+        self._reader.execute(
+            "INSERT INTO query_text (query_text) VALUES ('delete-all')"
+        )
+        self._reader.executemany(
+            "INSERT INTO query_text (rowid, text) VALUES (?, ?)", enumerate(words)
+        )
+        return {
+            words[row]: term
+            for term, row in self._reader.execute(
+                "SELECT term, doc FROM query_terms WHERE offset = 0"
+            )
+        }
+
+    def _drop_common_words(self, words: list[str], stems: dict[str, str]) -> list[str]:
+        terms = list(dict.fromkeys(stems.values()))
+        passages = dict(
+            self._reader.execute(
+                "SELECT term, doc FROM passage_terms WHERE term IN "
+                f"({', '.join('?' * len(terms))})",
+                terms,
+            )
+        )
+        rare = [
+            word
+            for word in words
+            if passages.get(stems.get(word), 0) <= BOOK_SEARCH_COMMON_TERM_PASSAGES
+        ]
+        return rare or words
+
+    def _excerpt(self, file: str, start: int, end: int, stems: list[str]) -> str:
+        try:
+            text = read_range(os.path.join(self.books_dir, file), start, end)
+        except OSError as e:
+            logger.warning(f"Cannot read an excerpt of {file}: {e}")
+            return ""
+        return excerpt(text, stems)
+
+    def close(self):
+        """Stop any background sync after the book it is on, and disconnect."""
+        self._closing.set()
+        thread = self._sync_thread
+        if thread is not None:
+            thread.join()
+        with self._write_lock, self._read_lock:
+            for connection in (self._reader, self._writer):
+                if connection is not None:
+                    connection.close()
+            self._reader = self._writer = None
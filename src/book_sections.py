@@ -0,0 +1,311 @@
+import mmap
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import NamedTuple
+
+# how many books keep their offset index in memory
+BOOK_INDEX_CACHE_SIZE = int(os.getenv("BOOK_INDEX_CACHE_SIZE", 64))
+
+_NUMBER = (
+    rb"(?P<number>[0-9]+|[ivxlcdm]+|one|two|three|four|five|six|seven|eight|nine|ten"
+    rb"|eleven|twelve|first|second|third|fourth|fifth|sixth|seventh|eighth"
+    rb"|ninth|tenth|last)"
+)
+# chapter-like headings on a line of their own: "CHAPTER XII.", "Book 2: The
+# Return", "# Markdown heading"; prose that happens to start with "Part" does
+# not match because the numeral must end the line or be followed by . : or -
+HEADING_PATTERN = re.compile(
+    rb"^[ \t]*(?:"
+    rb"(?P<kind>chapter|book|part|volume|act|scene)[ \t]+" + _NUMBER + rb"\b"
+    rb"[ \t]*(?:[.:\-][^\r\n]{0,100})?"
+    rb"|#{1,6}[ \t]+\S[^\r\n]{0,100}"
+    rb")\r?$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# headings of one kind closer together than this are a table of contents, not
+# sections of the book
+MIN_SECTION_BYTES = 200
+NEWLINE = re.compile(rb"\n")
+NON_SPACE = re.compile(rb"\S")
+_NUMBER_WORDS = dict(
+    zip(
+        "one two three four five six seven eight nine ten eleven twelve".split(),
+        range(1, 13),
+    )
+) | dict(
+    zip(
+        "first second third fourth fifth sixth seventh eighth ninth tenth".split(),
+        range(1, 11),
+    )
+)
+_ROMAN = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+
+
+class BookSectionError(ValueError):
+    """Raised when a requested section does not exist in a book."""
+
+
+class SectionRequest(NamedTuple):
+    kind: str  # "toc", "chapter", "lines" or "bytes"
+    first: int = 0
+    last: int = 0
+
+    def describe(self) -> str:
+        if self.kind == "toc":
+            return "table of contents"
+        if self.kind == "chapter":
+            return f"chapter {self.first}"
+        return f"{self.kind} {self.first}-{self.last}"
+
+
+_RANGE = re.compile(r"^(\d+)(?:-(\d+))?$")
+
+
+def parse_section_request(args: list[str]) -> tuple[list[str], SectionRequest | None]:
+    """
+    Split a trailing section selector off book command arguments:
+    "<title> toc", "<title> ch 3", "<title> lines 10-20", "<title> bytes 0-4095".
+    """
+    if len(args) >= 2 and args[-1].lower() in ("toc", "contents"):
+        return args[:-1], SectionRequest("toc")
+    if len(args) >= 3:
+        selector = args[-2].lower()
+        match = _RANGE.match(args[-1])
+        if match is not None:
+            first = int(match.group(1))
+            last = int(match.group(2) or first)
+            if selector in ("ch", "chapter") and match.group(2) is None:
+                return args[:-2], SectionRequest("chapter", first, first)
+            if selector in ("line", "lines"):
+                return args[:-2], SectionRequest("lines", first, last)
+            if selector in ("byte", "bytes"):
+                return args[:-2], SectionRequest("bytes", first, last)
+    return args, None
+
+
+class Heading(NamedTuple):
+    kind: str  # chapter, book, part, ... or "heading" for markdown
+    title: str
+    offset: int  # byte offset of the heading line
+
+
+@dataclass(frozen=True)
+class BookIndex:
+    """Byte offsets of a book's lines and headings, for one version of the file."""
+
+    version: tuple[int, int]  # (st_mtime_ns, st_size)
+    size: int
+    line_offsets: array  # byte offset of the start of each line
+    headings: list[Heading]
+
+    @property
+    def line_count(self) -> int:
+        return len(self.line_offsets)
+
+    def line_of(self, offset: int) -> int:
+        """1-based line number of the line containing offset."""
+        return bisect_right(self.line_offsets, offset)
+
+    def chapters(self) -> list[Heading]:
+        chapters = [h for h in self.headings if h.kind == "chapter"]
+        return chapters or self.headings
+
+    def chapter_range(self, number: int) -> tuple[Heading, int, int]:
+        """The number-th chapter (1-based) and its byte range, up to the next heading."""
+        chapters = self.chapters()
+        if not 1 <= number <= len(chapters):
+            raise BookSectionError(
+                f"Chapter {number} not found; the book has {len(chapters)} chapter(s)."
+            )
+        heading = chapters[number - 1]
+        following = [h.offset for h in self.headings if h.offset > heading.offset]
+        return heading, heading.offset, following[0] if following else self.size
+
+    def line_range(self, first: int, last: int) -> tuple[int, int]:
+        """Byte range of lines first..last (1-based, inclusive)."""
+        if not 1 <= first <= self.line_count or last < first:
+            raise BookSectionError(
+                f"Lines {first}-{last} not found; the book has {self.line_count} line(s)."
+            )
+        end = self.line_offsets[last] if last < self.line_count else self.size
+        return self.line_offsets[first - 1], end
+
+    def byte_range(self, first: int, last: int) -> tuple[int, int]:
+        """Byte range first..last (inclusive, as in an HTTP Range header)."""
+        if not 0 <= first < self.size or last < first:
+            raise BookSectionError(
+                f"Bytes {first}-{last} not found; the book has {self.size} byte(s)."
+            )
+        return first, min(last + 1, self.size)
+
+
+def _number_value(number: str) -> int | str:
+    """Value of a heading numeral, so "XII", "12" and "twelve" compare equal."""
+    if number.isdigit():
+        return int(number)
+    if number in _NUMBER_WORDS:
+        return _NUMBER_WORDS[number]
+    if all(c in _ROMAN for c in number):
+        values = [_ROMAN[c] for c in number]
+        return sum(
+            -value if value < following else value
+            for value, following in zip(values, values[1:] + [0])
+        )
+    return number  # "last"
+
+
+def _heading_keys(heading: Heading, number: bytes | None) -> set[tuple]:
+    """What a later heading repeats when this one is its table of contents entry."""
+    keys = {(heading.kind, "title", " ".join(heading.title.lower().split()))}
+    if number is not None:
+        keys.add((heading.kind, "number", _number_value(number.decode().lower())))
+    return keys
+
+
+def _drop_tables_of_contents(
+    data: bytes | mmap.mmap,
+    headings: list[Heading],
+    line_ends: list[int],
+    numbers: list[bytes | None],
+) -> list[Heading]:
+    """
+    Headings without table-of-contents entries. A heading is a listing entry
+    when the next heading is of the same kind and follows with no text in
+    between, or closer than MIN_SECTION_BYTES. The last entry of such a run
+    is usually separated from the book proper by a preface, so it is dropped
+    too when a later heading of its kind repeats its numbering or title.
+    """
+    count = len(headings)
+    listed = [False] * count
+    for i in range(count - 1):
+        heading, following = headings[i], headings[i + 1]
+        listed[i] = following.kind == heading.kind and (
+            following.offset - heading.offset < MIN_SECTION_BYTES
+            or NON_SPACE.search(data, line_ends[i], following.offset) is None
+        )
+
+    keys = [_heading_keys(h, number) for h, number in zip(headings, numbers)]
+    last_seen = {key: i for i, heading_keys in enumerate(keys) for key in heading_keys}
+    run_keys: set[tuple] = set()
+    for i in range(count):
+        if i and listed[i - 1] and not listed[i]:
+            # the end of a run is the first real section when it repeats an
+            # entry of the run, and the run's last entry when the book
+            # repeats it further on
+            listed[i] = keys[i].isdisjoint(run_keys) and any(
+                last_seen[key] > i for key in keys[i]
+            )
+        if listed[i]:
+            run_keys |= keys[i]
+        else:
+            run_keys = set()
+    return [heading for heading, skip in zip(headings, listed) if not skip]
+
+
+def build_index(data: bytes | mmap.mmap, version: tuple[int, int]) -> BookIndex:
+    line_offsets = array("Q", [0])
+    line_offsets.extend(match.end() for match in NEWLINE.finditer(data))
+    if len(data) and line_offsets[-1] == len(data):
+        line_offsets.pop()  # a trailing newline does not start another line
+
+    matches = list(HEADING_PATTERN.finditer(data))
+    headings = [
+        Heading(
+            (match.group("kind") or b"heading").decode("ascii").lower(),
+            match.group(0).strip().lstrip(b"#").strip().decode("utf-8", "replace"),
+            match.start(),
+        )
+        for match in matches
+    ]
+    headings = _drop_tables_of_contents(
+        data,
+        headings,
+        [match.end() for match in matches],
+        [match.group("number") for match in matches],
+    )
+    return BookIndex(version, len(data), line_offsets, headings)
+
+
+_indexes: "OrderedDict[str, BookIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_book_index(path: str) -> BookIndex:
+    """The offset index of path, built once per version (mtime and size) of the file."""
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is not None and index.version == version:
+            _indexes.move_to_end(path)
+            return index
+
+    with open(path, "rb") as f:
+        if stat.st_size == 0:
+            index = build_index(b"", version)
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                index = build_index(mapped, version)
+
+    with _indexes_lock:
+        _indexes[path] = index
+        _indexes.move_to_end(path)
+        while len(_indexes) > BOOK_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def read_range(path: str, start: int, end: int | None = None) -> str:
+    """
+    Decode bytes start..end (or to the end of the file) of path, copying only
+    that slice out of the page cache. Boundaries inside a UTF-8 sequence move
+    to the next character.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if start >= end:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            while start < end and mapped[start] & 0xC0 == 0x80:
+                start += 1
+            while end < size and mapped[end] & 0xC0 == 0x80:
+                end += 1
+            return mapped[start:end].decode("utf-8", errors="replace")
+
+
+def format_toc(index: BookIndex) -> str:
+    if not index.headings:
+        return "No chapters or headings found."
+    chapter_numbers = {h.offset: n for n, h in enumerate(index.chapters(), start=1)}
+    lines = []
+    for heading in index.headings:
+        number = chapter_numbers.get(heading.offset)
+        prefix = f"ch {number}: " if number is not None else ""
+        lines.append(
+            f"- {prefix}{heading.title} (line {index.line_of(heading.offset)})"
+        )
+    return "\n".join(lines)
+
+
+def read_section(path: str, request: SectionRequest) -> tuple[str, str]:
+    """
+    (label, text) of the requested section of the book at path. Only the
+    section's bytes are read; the offset index is built once per file version.
+    """
+    index = get_book_index(path)
+    if request.kind == "toc":
+        return request.describe(), format_toc(index)
+    if request.kind == "chapter":
+        heading, start, end = index.chapter_range(request.first)
+        return f"{request.describe()}, {heading.title}", read_range(path, start, end)
+    if request.kind == "lines":
+        start, end = index.line_range(request.first, request.last)
+    else:
+        start, end = index.byte_range(request.first, request.last)
+    return request.describe(), read_range(path, start, end)
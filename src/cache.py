@@ -1,59 +1,465 @@
-import json
+import asyncio
+import math
 import os
-from typing import Any, Dict, List, Optional
+import time
+import uuid
+from typing import Mapping, Sequence
 
-import redis
+import redis.asyncio as redis
 from loguru import logger
 
+from src.cache_codec import (
+    BLOB_KEY_PREFIX,
+    BLOB_REFS_KEY_PREFIX,
+    CodecError,
+    blob_key,
+    compress,
+    content_digest,
+    decode_entry,
+    decode_fields,
+    decode_ref,
+    decompress,
+    encode_fields,
+    encode_ref,
+    split_entry,
+)
+from src.memory_cache import MemoryCache
+from src.models.cache_entry import CacheEntry
+from src.models.context import ContextSnippet
+from src.models.stats import CacheCodecStats, CacheStats, CacheTierStats
+
+# size of each CacheWrapper's Redis connection pool
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+# byte budget of each CacheWrapper's in-process L1 tier
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", 64 * 1024 * 1024))
+# entries at least this large are zlib-compressed in Redis; 0 disables
+CACHE_COMPRESSION_MIN_BYTES = int(os.getenv("CACHE_COMPRESSION_MIN_BYTES", 4096))
+CACHE_COMPRESSION_LEVEL = int(os.getenv("CACHE_COMPRESSION_LEVEL", 6))
+# text fields at least this large are stored once per distinct text, shared
+# by every key holding it; 0 disables
+CACHE_DEDUPE_MIN_BYTES = int(os.getenv("CACHE_DEDUPE_MIN_BYTES", 4096))
+# entries that never go stale (keyed by their content version) are dropped
+# this long after they were last written, so superseded versions do not pile up
+CACHE_NO_EXPIRY_RETENTION_SECONDS = int(
+    os.getenv("CACHE_NO_EXPIRY_RETENTION_SECONDS", 7 * 24 * 3600)
+)
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Point an index key at a content-addressed blob. The blob is written if it is
+# new, and its expiry extended so it outlives every index entry pointing at
+# it. A reference count per blob lets an overwritten key release its old blob
+# straight away; blobs whose keys simply expired go with the last of them.
+# Returns 1 if the blob was already stored.
+STORE_BLOB_SCRIPT = """
+local record, ttl, digest, blob = ARGV[1], tonumber(ARGV[2]), ARGV[3], ARGV[4]
+local blob_prefix, refs_prefix = ARGV[5], ARGV[6]
+local old = redis.call("get", KEYS[1])
+redis.call("set", KEYS[1], record, "EX", ttl)
+
+local old_digest = false
+if old and string.byte(old, 1) == 3 then
+    old_digest = string.sub(old, 2, 65)
+end
+if old_digest ~= digest then
+    redis.call("incr", refs_prefix .. digest)
+    if old_digest and redis.call("decr", refs_prefix .. old_digest) <= 0 then
+        redis.call("del", blob_prefix .. old_digest, refs_prefix .. old_digest)
+    end
+end
+
+local reused = 0
+if redis.call("exists", blob_prefix .. digest) == 1 then
+    reused = 1
+    if redis.call("ttl", blob_prefix .. digest) < ttl then
+        redis.call("expire", blob_prefix .. digest, ttl)
+    end
+else
+    redis.call("set", blob_prefix .. digest, blob, "EX", ttl)
+end
+redis.call("expire", refs_prefix .. digest, redis.call("ttl", blob_prefix .. digest))
+return reused
+"""
+
 
 class CacheWrapper:
-    def __init__(self, ttl_seconds: int = 300):  # 5 minutes default
+    """
+    Two-tier async cache: a byte-bounded in-process LRU (L1) in front of Redis
+    (L2, redis.asyncio with a connection pool). When Redis is unreachable the
+    L1 tier is the whole cache. Batch reads and writes take one pipelined
+    round trip to Redis, plus one more for reads that hit large entries.
+    Large texts are content-addressed in Redis: each key holds a small index
+    record, and identical texts are stored once as a shared blob.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = 300,  # 5 minutes default
+        l1_max_bytes: int = CACHE_L1_MAX_BYTES,
+        grace_seconds: int = 0,
+        compression_min_bytes: int = CACHE_COMPRESSION_MIN_BYTES,
+        dedupe_min_bytes: int = CACHE_DEDUPE_MIN_BYTES,
+    ):
         self.ttl_seconds = ttl_seconds
+        # how long entries are kept (and served as stale) after they stop being fresh
+        self.grace_seconds = grace_seconds
         self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-        self._client: Optional[redis.Redis] = None
+        self._client: redis.Redis | None = None
         self._connected = False
-        self._connect()
+        # the first connection attempt, which every caller waits on
+        self._connect_task: asyncio.Future | None = None
+        self._l1: MemoryCache[CacheEntry] = MemoryCache(l1_max_bytes)
+        self._l2_stats = CacheTierStats()
+        self.compression_min_bytes = compression_min_bytes
+        self.dedupe_min_bytes = dedupe_min_bytes
+        self._codec_stats = CacheCodecStats()
 
-    def _connect(self):
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(l1=self._l1.stats, l2=self._l2_stats, codec=self._codec_stats)
+
+    async def _connect(self):
+        # connect lazily: the pool must be created on the running event loop.
+        # Callers that arrive while the first attempt is under way wait for
+        # it, rather than skipping Redis because it is not connected yet
+        if self._connected:
+            return
+        if self._connect_task is None:
+            self._connect_task = asyncio.ensure_future(self._open_connection())
+        # shielded: a cancelled caller must not cancel it for the others
+        await asyncio.shield(self._connect_task)
+
+    async def _open_connection(self):
         try:
-            self._client = redis.from_url(self.redis_url, decode_responses=True)
-            self._client.ping()
+            pool = redis.ConnectionPool.from_url(
+                self.redis_url,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                decode_responses=False,  # entries are binary
+            )
+            self._client = redis.Redis(connection_pool=pool)
+            await self._client.ping()
             self._connected = True
             logger.info(f"Connected to Redis at {self.redis_url}")
         except Exception as e:
-            logger.warning(f"Failed to connect to Redis: {e}. Using in-memory fallback.")
+            logger.warning(
+                f"Failed to connect to Redis: {e}. Using in-memory fallback."
+            )
             self._connected = False
-            self._fallback_cache: Dict[str, List[str]] = {}
 
-    def get(self, key: str) -> Optional[List[str]]:
-        if self._connected:
+    def make_entry(
+        self,
+        value: list[str | ContextSnippet],
+        compute_seconds: float = 0.0,
+        failed: bool = False,
+        ttl_seconds: float | None = None,
+        etag: str | None = None,
+    ) -> CacheEntry:
+        """
+        Build an entry fresh for ttl_seconds (default: the cache's TTL;
+        math.inf: until its key changes; 0: not cached at all).
+        """
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        return CacheEntry(
+            value=value,
+            fresh_until=time.time() + ttl_seconds,
+            compute_seconds=compute_seconds,
+            failed=failed,
+            etag=etag,
+            no_store=ttl_seconds <= 0,
+        )
+
+    async def get(self, key: str) -> list[str] | None:
+        return (await self.get_many([key]))[key]
+
+    async def get_many(self, keys: Sequence[str]) -> dict[str, list[str] | None]:
+        """Look up the fresh values of several keys; stale entries count as misses."""
+        entries = await self.get_entries(keys)
+        now = time.time()
+        return {
+            key: entry.value if entry is not None and entry.is_fresh(now) else None
+            for key, entry in entries.items()
+        }
+
+    async def set(self, key: str, value: list[str]):
+        await self.set_many({key: value})
+
+    async def set_many(self, items: Mapping[str, list[str]]):
+        await self.set_entries(
+            {key: self.make_entry(value) for key, value in items.items()}
+        )
+
+    async def get_entries(self, keys: Sequence[str]) -> dict[str, CacheEntry | None]:
+        """
+        Look up several entries, fresh or stale, going to Redis once for all L1
+        misses. Entries past their grace period are gone from both tiers.
+        """
+        results: dict[str, CacheEntry | None] = {}
+        l1_misses = []
+        for key in keys:
+            entry = self._l1.get(key)
+            results[key] = entry
+            if entry is None:
+                l1_misses.append(key)
+        if not l1_misses:
+            return results
+
+        await self._connect()
+        if not self._connected:
+            return results
+        try:
+            async with self._client.pipeline(transaction=False) as pipe:
+                for key in l1_misses:
+                    pipe.get(key)
+                    pipe.pttl(key)
+                replies = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis get error: {e}")
+            self._l2_stats.errors += 1
+            return results
+
+        # index records name a shared blob, fetched in a second round trip
+        refs: dict[str, tuple[str, bytes, int]] = {}
+        for key, raw, ttl_ms in zip(l1_misses, replies[0::2], replies[1::2]):
+            if not raw:
+                self._l2_stats.misses += 1
+                continue
             try:
-                value = self._client.get(key)
-                if value:
-                    return json.loads(value)
-            except Exception as e:
-                logger.error(f"Redis get error: {e}")
-        else:
-            return self._fallback_cache.get(key)
-        return None
+                ref = decode_ref(raw)
+            except CodecError as e:
+                logger.error(f"Dropping undecodable cache entry '{key}': {e}")
+                self._l2_stats.errors += 1
+                continue
+            if ref is not None:
+                refs[key] = (*ref, ttl_ms)
+                continue
+            decoded = self._decode(key, raw, ttl_ms)
+            if decoded is not None:
+                self._promote(key, *decoded, ttl_ms, results)
 
-    def set(self, key: str, value: List[str]):
-        if self._connected:
+        if refs:
+            await self._get_blobs(refs, results)
+        return results
+
+    async def _get_blobs(
+        self,
+        refs: Mapping[str, tuple[str, bytes, int]],
+        results: dict[str, CacheEntry | None],
+    ):
+        digests = list(dict.fromkeys(digest for digest, _, _ in refs.values()))
+        try:
+            async with self._client.pipeline(transaction=False) as pipe:
+                for digest in digests:
+                    pipe.get(blob_key(digest))
+                blobs = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis get error: {e}")
+            self._l2_stats.errors += len(refs)
+            return
+
+        # decode each distinct blob once, however many keys share it
+        values = {}
+        for digest, raw in zip(digests, blobs):
+            if raw:
+                values[digest] = self._decode_blob(blob_key(digest), raw)
+        for key, (digest, payload, ttl_ms) in refs.items():
+            blob = values.get(digest)
+            if blob is None:
+                # blob evicted or unreadable: the key is a miss
+                self._l2_stats.misses += 1
+                continue
+            fields, size = blob
             try:
-                self._client.setex(key, self.ttl_seconds, json.dumps(value))
-            except Exception as e:
-                logger.error(f"Redis set error: {e}")
-                self._fallback_cache[key] = value
-        else:
-            self._fallback_cache[key] = value
+                entry = decode_entry(payload, ttl_ms, fields)
+            except CodecError as e:
+                logger.error(f"Dropping undecodable cache entry '{key}': {e}")
+                self._l2_stats.errors += 1
+                continue
+            self._promote(key, entry, len(payload) + size, ttl_ms, results)
+
+    def _decode_blob(self, key: str, raw: bytes) -> tuple[list[str], int] | None:
+        """Decode a stored blob, returning its texts and their decoded size."""
+        started = time.perf_counter()
+        try:
+            payload = decompress(raw)
+            fields = decode_fields(payload)
+        except CodecError as e:
+            logger.error(f"Dropping undecodable cache blob '{key}': {e}")
+            self._l2_stats.errors += 1
+            return None
+        self._codec_stats.decoded += 1
+        self._codec_stats.decode_seconds += time.perf_counter() - started
+        return fields, len(payload)
+
+    def _decode(
+        self, key: str, raw: bytes, ttl_ms: int | None
+    ) -> tuple[CacheEntry, int] | None:
+        """Decode a stored payload, returning the entry and its decoded size."""
+        started = time.perf_counter()
+        try:
+            payload = decompress(raw)
+            entry = decode_entry(payload, ttl_ms)
+        except CodecError as e:
+            logger.error(f"Dropping undecodable cache entry '{key}': {e}")
+            self._l2_stats.errors += 1
+            return None
+        self._codec_stats.decoded += 1
+        self._codec_stats.decode_seconds += time.perf_counter() - started
+        return entry, len(payload)
+
+    def _promote(
+        self,
+        key: str,
+        entry: CacheEntry,
+        size: int,
+        ttl_ms: int | None,
+        results: dict[str, CacheEntry | None],
+    ):
+        self._l2_stats.hits += 1
+        results[key] = entry
+        # promote into L1 for whatever TTL the entry has left in Redis
+        if ttl_ms and ttl_ms > 0:
+            self._l1.set(key, entry, size, ttl_ms / 1000)
+
+    async def set_entries(self, entries: Mapping[str, CacheEntry]):
+        """Write several entries to L1 and, in one pipeline, to Redis."""
+        if not entries:
+            return
+        await self._connect()
+        now = time.time()
+        payloads = {}
+        for key, entry in entries.items():
+            if entry.no_store:
+                continue
+            if math.isinf(entry.fresh_until):
+                storage_ttl = CACHE_NO_EXPIRY_RETENTION_SECONDS
+            else:
+                # keep the entry around for the grace period after it goes stale;
+                # failed entries are dropped as soon as their retry-after passes
+                grace_seconds = 0 if entry.failed else self.grace_seconds
+                storage_ttl = max(1, round(entry.fresh_until - now) + grace_seconds)
+            started = time.perf_counter()
+            payload, fields = split_entry(
+                entry, self.dedupe_min_bytes if self._connected else 0
+            )
+            size = len(payload)
+            if self._connected and fields:
+                # the large texts go to a blob shared by every key holding them
+                blob = encode_fields(fields)
+                size += len(blob)
+                stored = compress(
+                    blob, self.compression_min_bytes, CACHE_COMPRESSION_LEVEL
+                )
+                digest = content_digest(blob)
+                self._record_encode(blob, stored, time.perf_counter() - started)
+                payloads[key] = (
+                    encode_ref(payload, digest),
+                    storage_ttl,
+                    digest,
+                    stored,
+                )
+            elif self._connected:
+                # only what crosses the wire to Redis is worth compressing
+                stored = compress(
+                    payload, self.compression_min_bytes, CACHE_COMPRESSION_LEVEL
+                )
+                self._record_encode(payload, stored, time.perf_counter() - started)
+                payloads[key] = (stored, storage_ttl, None, None)
+            # L1 holds decoded entries, so account for them uncompressed
+            self._l1.set(key, entry, size, storage_ttl)
+
+        if not payloads:
+            return
+        try:
+            async with self._client.pipeline(transaction=False) as pipe:
+                for key, (record, storage_ttl, digest, blob) in payloads.items():
+                    if digest is None:
+                        pipe.setex(key, storage_ttl, record)
+                        continue
+                    pipe.eval(
+                        STORE_BLOB_SCRIPT,
+                        1,
+                        key,
+                        record,
+                        storage_ttl,
+                        digest,
+                        blob,
+                        BLOB_KEY_PREFIX,
+                        BLOB_REFS_KEY_PREFIX,
+                    )
+                replies = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis set error: {e}")
+            self._l2_stats.errors += 1
+            return
+
+        for (_, _, digest, _), reply in zip(payloads.values(), replies):
+            if digest is not None:
+                self._codec_stats.blob_writes += 1
+                self._codec_stats.blobs_reused += reply == 1
 
-    def clear(self):
+    def _record_encode(self, payload: bytes, stored: bytes, seconds: float):
+        stats = self._codec_stats
+        stats.encoded += 1
+        stats.compressed += stored is not payload
+        stats.encoded_bytes += len(payload)
+        stats.stored_bytes += len(stored)
+        stats.encode_seconds += seconds
+
+    async def acquire_lock(self, name: str, ttl_ms: int) -> str | None:
+        """
+        Try to take a short-lived lock shared by every worker using this Redis.
+        Returns a token to release it with, or None if another holder has it.
+        Without Redis there is nobody to share with, so the lock always succeeds.
+        """
+        token = uuid.uuid4().hex
+        await self._connect()
+        if not self._connected:
+            return token
+        try:
+            if await self._client.set(f"lock:{name}", token, nx=True, px=ttl_ms):
+                return token
+            return None
+        except Exception as e:
+            logger.error(f"Redis lock error: {e}")
+            return token
+
+    async def release_lock(self, name: str, token: str):
+        if not self._connected:
+            return
+        try:
+            # only delete the lock if we still own it
+            await self._client.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{name}", token)
+        except Exception as e:
+            logger.error(f"Redis unlock error: {e}")
+
+    async def is_locked(self, name: str) -> bool:
+        if not self._connected:
+            return False
+        try:
+            return bool(await self._client.exists(f"lock:{name}"))
+        except Exception as e:
+            logger.error(f"Redis lock check error: {e}")
+            return False
+
+    async def clear(self):
+        self._l1.clear()
+        logger.info("In-memory cache cleared")
+        await self._connect()
         if self._connected:
             try:
-                self._client.flushdb()
+                await self._client.flushdb()
                 logger.info("Redis cache cleared")
             except Exception as e:
                 logger.error(f"Redis clear error: {e}")
-        else:
-            self._fallback_cache.clear()
-            logger.info("In-memory cache cleared")
\ No newline at end of file
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._connected = False
+        self._connect_task = None
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import struct
+import time
+import zlib
+from typing import Any, Sequence
+
+from src.models.cache_entry import CacheEntry
+from src.models.context import ContextSnippet, ContextType
+
+# First byte of every encoded entry. Values written by the plain cache before
+# the binary codec are JSON lists of strings, starting with "[", and are still
+# read. A binary entry ends with a trailer: its ETag, then the ETag's length
+CODEC_BINARY = 0x01
+# a zlib-compressed payload (itself starting with a codec byte) follows
+CODEC_ZLIB = 0x02
+# an index record: the content hash of a blob, then the entry with its large
+# text fields replaced by references into that blob. The blob holds only the
+# text, so every key whose text is the same shares it, whatever the small
+# per-key fields (a command's spelling, a URL) say
+CODEC_REF = 0x03
+# a blob: the large text fields of one or more entries
+CODEC_FIELDS = 0x04
+
+_HEADER = struct.Struct("<BddBI")  # codec, fresh_until, compute_seconds, failed, items
+_DIGEST_SIZE = 64  # hex sha256
+_LENGTH = struct.Struct("<I")
+_COUNT = struct.Struct("<H")
+
+# item and field tags
+_ITEM_TEXT = 0  # a pre-rendered string
+_ITEM_SNIPPET = 1  # a structured ContextSnippet
+_ITEM_BLOB_TEXT = 2  # a string kept in the blob, by position
+_FIELD_NONE = 0
+_FIELD_TEXT = 1
+_FIELD_JSON = 2  # nested dicts and lists, rare
+_FIELD_BLOB_TEXT = 3  # a text field kept in the blob, by position
+
+
+class CodecError(ValueError):
+    """Raised when a cached payload cannot be decoded."""
+
+
+def encode_entry(entry: CacheEntry) -> bytes:
+    """
+    Encode an entry compactly: a fixed header, then each value as either a
+    length-prefixed string or a snippet's type and content fields, then the
+    ETag trailer. Snippets are stored unrendered, so changing how they are
+    rendered never invalidates the cache.
+    """
+    return split_entry(entry, 0)[0]
+
+
+def split_entry(entry: CacheEntry, min_bytes: int) -> tuple[bytes, list[str]]:
+    """
+    Encode an entry with every string or text field of at least min_bytes
+    characters (0 for none) left out, and return those texts separately.
+    The encoding refers to them by position, for decode_entry's fields.
+    """
+    fields: list[str] = []
+    parts = [
+        _HEADER.pack(
+            CODEC_BINARY,
+            entry.fresh_until,
+            entry.compute_seconds,
+            entry.failed,
+            len(entry.value),
+        )
+    ]
+    for item in entry.value:
+        if isinstance(item, str):
+            if min_bytes and len(item) >= min_bytes:
+                parts.append(bytes([_ITEM_BLOB_TEXT]))
+                parts.append(_LENGTH.pack(len(fields)))
+                fields.append(item)
+            else:
+                parts.append(bytes([_ITEM_TEXT]))
+                _pack_str(parts, item)
+            continue
+        parts.append(bytes([_ITEM_SNIPPET]))
+        _pack_str(parts, item.type.value)
+        parts.append(_COUNT.pack(len(item.content)))
+        for key, value in item.content.items():
+            _pack_str(parts, key)
+            if value is None:
+                parts.append(bytes([_FIELD_NONE]))
+            elif isinstance(value, str) and min_bytes and len(value) >= min_bytes:
+                parts.append(bytes([_FIELD_BLOB_TEXT]))
+                parts.append(_LENGTH.pack(len(fields)))
+                fields.append(value)
+            elif isinstance(value, str):
+                parts.append(bytes([_FIELD_TEXT]))
+                _pack_str(parts, value)
+            else:
+                parts.append(bytes([_FIELD_JSON]))
+                _pack_str(parts, json.dumps(value))
+    etag = (entry.etag or "").encode("utf-8")
+    parts.append(etag)
+    parts.append(_LENGTH.pack(len(etag)))
+    return b"".join(parts), fields
+
+
+def encode_fields(fields: Sequence[str]) -> bytes:
+    """A blob of the texts split_entry left out of an entry."""
+    parts = [bytes([CODEC_FIELDS]), _LENGTH.pack(len(fields))]
+    for text in fields:
+        _pack_str(parts, text)
+    return b"".join(parts)
+
+
+def decode_fields(raw: bytes) -> list[str]:
+    if raw[:1] != bytes([CODEC_FIELDS]):
+        raise CodecError("Not a cache blob")
+    try:
+        (count,) = _LENGTH.unpack_from(raw, 1)
+        view = memoryview(raw)
+        offset = 1 + _LENGTH.size
+        fields = []
+        for _ in range(count):
+            text, offset = _unpack_str(view, offset)
+            fields.append(text)
+    except (struct.error, ValueError) as e:
+        raise CodecError(f"Corrupt cache blob: {e}") from e
+    return fields
+
+
+def content_digest(blob: bytes) -> str:
+    """Content hash of a blob from encode_fields, which names it in Redis."""
+    return hashlib.sha256(blob).hexdigest()
+
+
+BLOB_KEY_PREFIX = "blob:"
+BLOB_REFS_KEY_PREFIX = "blobrefs:"
+
+
+def blob_key(digest: str) -> str:
+    return f"{BLOB_KEY_PREFIX}{digest}"
+
+
+def encode_ref(payload: bytes, digest: str) -> bytes:
+    """An index record: the blob's digest, then the entry split_entry encoded."""
+    return bytes([CODEC_REF]) + digest.encode("ascii") + payload
+
+
+def decode_ref(raw: bytes) -> tuple[str, bytes] | None:
+    """
+    The blob digest of an index record and the encoded entry that refers into
+    the blob, or None if raw holds an entry inline.
+    """
+    if raw[:1] != bytes([CODEC_REF]):
+        return None
+    if len(raw) < 1 + _DIGEST_SIZE + _HEADER.size:
+        raise CodecError("Truncated cache index record")
+    digest = raw[1 : 1 + _DIGEST_SIZE]
+    try:
+        return digest.decode("ascii"), raw[1 + _DIGEST_SIZE :]
+    except UnicodeDecodeError as e:
+        raise CodecError(f"Corrupt cache index record: {e}") from e
+
+
+def compress(payload: bytes, min_bytes: int, level: int = 6) -> bytes:
+    """
+    zlib-compress payloads of at least min_bytes (0 disables compression),
+    behind a CODEC_ZLIB header byte. Payloads that would not shrink are kept.
+    """
+    if not min_bytes or len(payload) < min_bytes:
+        return payload
+    compressed = bytes([CODEC_ZLIB]) + zlib.compress(payload, level)
+    return compressed if len(compressed) < len(payload) else payload
+
+
+def decompress(raw: bytes) -> bytes:
+    """Undo compress(); anything without the CODEC_ZLIB header is returned as is."""
+    if raw[:1] != bytes([CODEC_ZLIB]):
+        return raw
+    try:
+        return zlib.decompress(memoryview(raw)[1:])
+    except zlib.error as e:
+        raise CodecError(f"Corrupt compressed cache entry: {e}") from e
+
+
+def decode_entry(
+    raw: bytes, ttl_ms: int | None = None, blob_fields: Sequence[str] = ()
+) -> CacheEntry:
+    """
+    Decode a binary entry, or a JSON list of strings written before it.
+    blob_fields are the texts split_entry left out, read back from their blob.
+    """
+    if raw[:1] == b"[":
+        return _decode_json(raw, ttl_ms)
+    if raw[0] != CODEC_BINARY:
+        raise CodecError(f"Unknown cache codec {raw[0]:#x}")
+
+    try:
+        _, fresh_until, compute_seconds, failed, items = _HEADER.unpack_from(raw)
+        view = memoryview(raw)
+        (etag_length,) = _LENGTH.unpack_from(raw, len(raw) - _LENGTH.size)
+        etag_start = len(raw) - _LENGTH.size - etag_length
+        if etag_start < _HEADER.size:
+            raise CodecError("Truncated cache entry")
+        etag = str(view[etag_start : len(raw) - _LENGTH.size], "utf-8") or None
+        view = view[:etag_start]
+        offset = _HEADER.size
+        value: list[str | ContextSnippet] = []
+        for _ in range(items):
+            tag = view[offset]
+            offset += 1
+            if tag == _ITEM_TEXT:
+                text, offset = _unpack_str(view, offset)
+                value.append(text)
+                continue
+            if tag == _ITEM_BLOB_TEXT:
+                text, offset = _blob_field(view, offset, blob_fields)
+                value.append(text)
+                continue
+            type_value, offset = _unpack_str(view, offset)
+            (fields,) = _COUNT.unpack_from(view, offset)
+            offset += _COUNT.size
+            content: dict[str, Any] = {}
+            for _ in range(fields):
+                key, offset = _unpack_str(view, offset)
+                field_tag = view[offset]
+                offset += 1
+                if field_tag == _FIELD_NONE:
+                    content[key] = None
+                    continue
+                if field_tag == _FIELD_BLOB_TEXT:
+                    content[key], offset = _blob_field(view, offset, blob_fields)
+                    continue
+                text, offset = _unpack_str(view, offset)
+                content[key] = text if field_tag == _FIELD_TEXT else json.loads(text)
+            value.append(ContextSnippet(type=ContextType(type_value), content=content))
+    except (struct.error, IndexError, ValueError) as e:
+        raise CodecError(f"Corrupt cache entry: {e}") from e
+
+    return CacheEntry(
+        value=value,
+        fresh_until=fresh_until,
+        compute_seconds=compute_seconds,
+        failed=bool(failed),
+        etag=etag,
+    )
+
+
+def _decode_json(raw: bytes, ttl_ms: int | None) -> CacheEntry:
+    try:
+        value = json.loads(raw)
+    except ValueError as e:
+        raise CodecError(f"Corrupt cache entry: {e}") from e
+    if not isinstance(value, list):
+        raise CodecError("Unknown JSON cache entry")
+    # written before entries carried metadata: fresh for its remaining TTL
+    remaining = ttl_ms / 1000 if ttl_ms and ttl_ms > 0 else 0
+    return CacheEntry(value=value, fresh_until=time.time() + remaining)
+
+
+def _pack_str(parts: list[bytes], text: str):
+    data = text.encode("utf-8")
+    parts.append(_LENGTH.pack(len(data)))
+    parts.append(data)
+
+
+def _unpack_str(view: memoryview, offset: int) -> tuple[str, int]:
+    (length,) = _LENGTH.unpack_from(view, offset)
+    start = offset + _LENGTH.size
+    end = start + length
+    if end > len(view):
+        raise CodecError("Truncated cache entry")
+    return str(view[start:end], "utf-8"), end
+
+
+def _blob_field(
+    view: memoryview, offset: int, fields: Sequence[str]
+) -> tuple[str, int]:
+    (position,) = _LENGTH.unpack_from(view, offset)
+    if position >= len(fields):
+        raise CodecError("Cache entry refers to a missing blob field")
+    return fields[position], offset + _LENGTH.size
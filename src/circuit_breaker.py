@@ -0,0 +1,160 @@
+import os
+import time
+from collections import deque
+from enum import StrEnum
+from typing import NamedTuple
+
+from loguru import logger
+
+from src.models.stats import CircuitBreakerStats
+
+# fraction of failed or slow calls in the window that opens the breaker
+CIRCUIT_BREAKER_FAILURE_RATIO = float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATIO", 0.5))
+# calls slower than this count against the breaker even when they succeed
+CIRCUIT_BREAKER_SLOW_CALL_SECONDS = float(
+    os.getenv("CIRCUIT_BREAKER_SLOW_CALL_SECONDS", 20)
+)
+# fewest calls in the window before the ratio is trusted
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", 5))
+# length of the rolling window of recent calls
+CIRCUIT_BREAKER_WINDOW_SECONDS = float(os.getenv("CIRCUIT_BREAKER_WINDOW_SECONDS", 60))
+# how long the breaker stays open before letting a probe through
+CIRCUIT_BREAKER_OPEN_SECONDS = float(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", 30))
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CallPermit(NamedTuple):
+    """A call let through by allow(), handed back to record() with its outcome."""
+
+    probe: bool  # the half-open probe, whose outcome decides the state
+    generation: int  # breaker generation the call started in
+
+
+class CircuitBreaker:
+    """
+    Rolling-window circuit breaker for a remote dependency.
+
+    Closed, every call goes through and its outcome and latency are recorded.
+    When enough recent calls failed or were slow the breaker opens and calls
+    are rejected outright. After open_seconds one probe call is let through
+    (half-open): its success closes the breaker, its failure opens it again.
+    Calls that started before the breaker last opened or closed may finish
+    long after (up to their timeout); they are counted in the stats but say
+    nothing about the current state, so they never change it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_ratio: float = CIRCUIT_BREAKER_FAILURE_RATIO,
+        slow_call_seconds: float = CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+        min_calls: int = CIRCUIT_BREAKER_MIN_CALLS,
+        window_seconds: float = CIRCUIT_BREAKER_WINDOW_SECONDS,
+        open_seconds: float = CIRCUIT_BREAKER_OPEN_SECONDS,
+    ):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self._stats = CircuitBreakerStats()
+        # (finished_at, bad) for each call in the window; bad = failed or slow
+        self._calls: deque[tuple[float, bool]] = deque()
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # bumped whenever the breaker opens or closes
+        self._generation = 0
+
+    @property
+    def state(self) -> CircuitState:
+        if (
+            self._state == CircuitState.OPEN
+            and time.monotonic() - self._opened_at >= self.open_seconds
+        ):
+            self._state = CircuitState.HALF_OPEN
+        return self._state
+
+    @property
+    def stats(self) -> CircuitBreakerStats:
+        self._prune(time.monotonic())
+        self._stats.state = self.state
+        self._stats.window_calls = len(self._calls)
+        self._stats.window_bad_calls = sum(bad for _, bad in self._calls)
+        return self._stats
+
+    def retry_after(self) -> float | None:
+        """Seconds until the breaker lets a probe through, if it is open."""
+        if self.state != CircuitState.OPEN:
+            return None
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def allow(self) -> CallPermit | None:
+        """
+        A permit if a call may go through now, None if it is rejected. Every
+        permitted call must be recorded with its permit.
+        """
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return CallPermit(probe=False, generation=self._generation)
+        if state == CircuitState.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            self._stats.probes += 1
+            return CallPermit(probe=True, generation=self._generation)
+        self._stats.rejected += 1
+        return None
+
+    def record(
+        self, success: bool, duration_seconds: float, permit: CallPermit | None = None
+    ):
+        now = time.monotonic()
+        slow = duration_seconds >= self.slow_call_seconds
+        self._stats.calls += 1
+        self._stats.failures += not success
+        self._stats.slow_calls += slow
+        bad = not success or slow
+
+        if permit is not None and permit.probe:
+            self._probe_in_flight = False
+            if bad:
+                self._open(now, "probe failed")
+            else:
+                logger.info(f"Circuit breaker '{self.name}' closed, probe succeeded")
+                self._state = CircuitState.CLOSED
+                self._generation += 1
+                self._calls.clear()
+            return
+        if permit is not None and permit.generation != self._generation:
+            return  # started under an earlier state
+        if self._state != CircuitState.CLOSED:
+            return
+
+        self._calls.append((now, bad))
+        self._prune(now)
+        if len(self._calls) >= self.min_calls:
+            bad_calls = sum(bad for _, bad in self._calls)
+            if bad_calls / len(self._calls) >= self.failure_ratio:
+                self._open(
+                    now,
+                    f"{bad_calls}/{len(self._calls)} recent calls failed or were slow",
+                )
+
+    def _open(self, now: float, reason: str):
+        logger.warning(
+            f"Circuit breaker '{self.name}' opened for {self.open_seconds}s: {reason}"
+        )
+        self._state = CircuitState.OPEN
+        self._opened_at = now
+        self._generation += 1
+        self._stats.trips += 1
+        self._calls.clear()
+
+    def _prune(self, now: float):
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
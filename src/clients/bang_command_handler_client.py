@@ -1,4 +1,5 @@
 import asyncio
+import math
 import os
 import shlex  # For robust command string parsing
 from typing import (  # Keep Any for now if truly needed, otherwise try to be more specific
@@ -11,68 +12,118 @@ from typing import (  # Keep Any for now if truly needed, otherwise try to be mo
 import loguru
 
 # import litellm # Removed for deterministic matching
+from src.book_catalog import BookCatalog
+from src.book_search import BookSearchIndex
+from src.book_sections import (
+    BookSectionError,
+    parse_section_request,
+    read_range,
+    read_section,
+)
 from src.clients.context_client_p import ContextClientP
 from src.models.context import (  # ContextType not used, can be removed later if still unused
     CommandContextSnippet,
+    ContextResult,
     ContextType,
+    render_snippets,
 )
+from src.passage_selection import select_passages
 
 logger = loguru.logger
 
+# how long a !books listing stays cached; book files themselves are keyed by
+# their mtime and size so they never need to expire
+BANG_BOOKS_LIST_TTL_SECONDS = float(os.getenv("BANG_BOOKS_LIST_TTL_SECONDS", 30))
+
+# how long !search results stay cached, and how many passages it returns
+BANG_SEARCH_TTL_SECONDS = float(os.getenv("BANG_SEARCH_TTL_SECONDS", 30))
+BANG_SEARCH_RESULTS = int(os.getenv("BANG_SEARCH_RESULTS", 5))
+
+BOOK_COMMANDS = ("books", "book", "b")
+# least title similarity for a book to be suggested when none matches
+BOOK_SHORTLIST_MIN_SIMILARITY = 0.2
+
+# bump when what a book command returns for the same file changes, since those
+# results never expire on their own
+BOOK_RESULT_VERSION = 3
+
 # Type for a handler function
 CommandHandler = Callable[[list[str]], Awaitable[CommandContextSnippet]]
 
 
+class CommandFailed(Exception):
+    """
+    Raised by a handler that could not do its work (e.g. a book it could not
+    read). Its snippet is still returned, but as a failed result, so it is
+    only negatively cached instead of standing in for real content.
+    """
+
+    def __init__(self, snippet: CommandContextSnippet):
+        super().__init__(snippet.content["result_text"])
+        self.snippet = snippet
+
+
+def _select_book_passages(path: str, question: str) -> str:
+    """The passages of the book at path most relevant to question (blocking)."""
+    return select_passages(read_range(path, 0), question)
+
+
 class BangCommandHandlerClient(ContextClientP):
     def __init__(self):
         self.command_handlers: dict[str, CommandHandler] = {}
+        # per-command freshness; commands not listed use the cache default
+        self.command_ttls: dict[str, float | None] = {}
         self.books_dir_path: str = os.getenv("BOOKS_DIR_PATH", "./context/books/")
-        self.available_book_files: List[str] = []
+        self.book_catalog = BookCatalog(self.books_dir_path)
+        self.book_search = BookSearchIndex(self.books_dir_path)
         self._scan_book_directory()
         self._register_handlers()
 
+    @property
+    def available_book_files(self) -> List[str]:
+        return list(self.book_catalog.files)
+
+    @available_book_files.setter
+    def available_book_files(self, files: List[str]):
+        self.book_catalog.replace(files)
+
     def _scan_book_directory(self):
         """Scans the configured directory for .txt book files."""
-        logger.info(f"Scanning for book files in: {self.books_dir_path}")
-        self.available_book_files = [] # Reset the list before scanning
-
-        if not os.path.isdir(self.books_dir_path):
-            logger.warning(
-                f"Books directory '{self.books_dir_path}' not found. No books will be available."
-            )
-            # self.available_book_files is already [], so just return
-            return
+        self.book_catalog.scan()
 
-        try:
-            for filename in os.listdir(self.books_dir_path):
-                if filename.endswith(".txt") and os.path.isfile(
-                    os.path.join(self.books_dir_path, filename)
-                ):
-                    self.available_book_files.append(filename)
-            if self.available_book_files:
-                logger.info(
-                    f"Found {len(self.available_book_files)} book(s): {self.available_book_files}"
-                )
-            else:
-                logger.warning(f"No .txt files found in '{self.books_dir_path}'.")
-        except Exception as e:
-            logger.error(f"Error scanning book directory '{self.books_dir_path}': {e}")
-            self.available_book_files = [] # Ensure it's empty on error too
+    async def _refresh_book_directory(self):
+        """Rescans only if books were added, removed or renamed since the last scan."""
+        # the directory stat and any rescan are blocking file work
+        if self.book_catalog.refresh_due:
+            await asyncio.to_thread(self.book_catalog.refresh)
 
     def _register_handlers(self):
         self.register_command("testcmd", self._handle_test_command)
-        self.register_command("books", self._handle_list_books_command)
+        self.register_command(
+            "books",
+            self._handle_list_books_command,
+            ttl_seconds=BANG_BOOKS_LIST_TTL_SECONDS,
+        )
         self.register_command("book", self._handle_get_book_detail_command)
         self.register_command(
             "b", self._handle_get_book_detail_command
         )  # Alias for !book
+        self.register_command(
+            "search", self._handle_search_command, ttl_seconds=BANG_SEARCH_TTL_SECONDS
+        )
 
-    def register_command(self, command_name: str, handler: CommandHandler):
+    def register_command(
+        self,
+        command_name: str,
+        handler: CommandHandler,
+        ttl_seconds: float | None = None,
+    ):
         if command_name in self.command_handlers:
             logger.warning(
                 f"Command '{command_name}' is already registered. Overwriting."
             )
         self.command_handlers[command_name] = handler
+        self.command_ttls[command_name] = ttl_seconds
         logger.info(f"Registered bang command: !{command_name}")
 
     async def _parse_command_string(
@@ -83,6 +134,9 @@ class BangCommandHandlerClient(ContextClientP):
         Example: "weather London" -> ("weather", ["London"])
                  "books" -> ("books", [])
         """
+        return self._split_command(command_query)
+
+    def _split_command(self, command_query: str) -> tuple[str | None, list[str]]:
         try:
             parts = shlex.split(command_query)
             if not parts:
@@ -94,6 +148,71 @@ class BangCommandHandlerClient(ContextClientP):
             logger.error(f"Error parsing command string '{command_query}': {e}")
             return None, []
 
+    async def cache_key(self, key: str) -> str | None:
+        """
+        Key commands that read a book file by the file's mtime and size, so an
+        edited book is fetched afresh while an unchanged one is never refetched.
+        """
+        command_name, args = self._split_command(key)
+        if command_name not in BOOK_COMMANDS:
+            return None
+        await self._refresh_book_directory()
+        book_file = self._book_file_for_command(command_name, args)
+        if book_file is None:
+            return None
+        try:
+            stat = await asyncio.to_thread(
+                os.stat, os.path.join(self.books_dir_path, book_file)
+            )
+        except OSError:
+            return None
+        return (
+            f"!{key}|{book_file}:{stat.st_mtime_ns}:{stat.st_size}"
+            f"|v{BOOK_RESULT_VERSION}"
+        )
+
+    def _book_file_for_command(self, command_name: str, args: list[str]) -> str | None:
+        """The book file a book command resolves to, if any."""
+        if command_name == "books":
+            return self._resolve_book_args(args)[0]
+        if command_name in ("book", "b"):
+            title_args, _ = parse_section_request(args)
+            return self._resolve_book_args(title_args)[0]
+        return None
+
+    def _resolve_book_args(self, args: list[str]) -> tuple[str | None, list[str]]:
+        """
+        Split command arguments into the book they name and the question that
+        follows it ("war_and_peace who is Natasha"), matching the longest
+        leading run of arguments that is a book title. Failing an exact title,
+        the run most similar to a title wins ("war peace", "moby dik"), if the
+        match is confident.
+        """
+        for end in range(len(args), 0, -1):
+            matched = self._match_book_file(" ".join(args[:end]))
+            if matched:
+                return matched, args[end:]
+
+        # titles are a few words long, so only short leading runs can be one;
+        # one spare word covers a title word split in two by a typo
+        longest = min(len(args), self.book_catalog.max_title_words + 1)
+        best, best_end = None, 0
+        for end in range(longest, 0, -1):
+            match = self.book_catalog.fuzzy_resolve(" ".join(args[:end]))
+            if match is not None and (best is None or match.score > best.score):
+                best, best_end = match, end
+        if best is not None:
+            logger.info(
+                f"Fuzzy matched '{' '.join(args[:best_end])}' to '{best.file}' "
+                f"(similarity {best.score:.2f})"
+            )
+            return best.file, args[best_end:]
+        return None, args
+
+    def _match_book_file(self, query: str) -> str | None:
+        """Available book file whose name matches query, ignoring case and .txt."""
+        return self.book_catalog.match(query)
+
     async def get_context(
         self, key: str
     ) -> list[str]:  # Changed 'command_query' to 'key'
@@ -102,6 +221,10 @@ class BangCommandHandlerClient(ContextClientP):
         parses it, dispatches to the appropriate handler, and returns
         the XML representation of the CommandContextSnippet.
         """
+        return render_snippets((await self.fetch(key)).snippets)
+
+    async def fetch(self, key: str) -> ContextResult:
+        """Like get_context, but returns the CommandContextSnippet unrendered."""
         logger.info(f"BangCommandHandlerClient received command query (key): '{key}'")
 
         command_name, args = await self._parse_command_string(key)  # Use 'key' here
@@ -112,19 +235,31 @@ class BangCommandHandlerClient(ContextClientP):
                 result_text="Error: Could not parse command.",
                 source="BangCommandHandlerClient",
             )
-            return [error_snippet.to_xml()]
+            return ContextResult(snippets=[error_snippet])
 
         handler = self.command_handlers.get(command_name)
 
         if handler:
             # Scan books directory if the command is book-related
-            if command_name in ["books", "book", "b"]:
-                logger.info(f"Command '{command_name}' triggered book directory scan.")
-                self._scan_book_directory()  # Rescan for books
+            if command_name in BOOK_COMMANDS:
+                await self._refresh_book_directory()
+
+            ttl_seconds = self.command_ttls.get(command_name)
+            if (
+                command_name in BOOK_COMMANDS
+                and self._book_file_for_command(command_name, args) is not None
+            ):
+                # cache_key changes with the file, so what was read from it never goes
+                # stale; a failed read is returned without this TTL below
+                ttl_seconds = math.inf
 
             try:
                 snippet = await handler(args)
-                return [snippet.to_xml()]
+                if command_name == "search" and self.book_search.indexing:
+                    ttl_seconds = 0  # answered from a partial index
+                return ContextResult(snippets=[snippet], ttl_seconds=ttl_seconds)
+            except CommandFailed as e:
+                return ContextResult(snippets=[e.snippet], failed=True)
             except Exception as e:
                 logger.error(
                     f"Error executing handler for command '{command_name}' with args '{args}': {e}"
@@ -134,7 +269,7 @@ class BangCommandHandlerClient(ContextClientP):
                     result_text=f"Error executing command '{command_name}': {str(e)}",
                     source="BangCommandHandlerClient",
                 )
-                return [error_snippet.to_xml()]
+                return ContextResult(snippets=[error_snippet], failed=True)
         else:
             logger.warning(f"No handler found for command: {command_name}")
             not_found_snippet = CommandContextSnippet(
@@ -142,7 +277,7 @@ class BangCommandHandlerClient(ContextClientP):
                 result_text=f"Error: Command '!{command_name}' not found.",
                 source="BangCommandHandlerClient",
             )
-            return [not_found_snippet.to_xml()]
+            return ContextResult(snippets=[not_found_snippet])
 
     # --- Example/Placeholder Handler ---
     async def _handle_test_command(self, args: list[str]) -> CommandContextSnippet:
@@ -161,31 +296,20 @@ class BangCommandHandlerClient(ContextClientP):
         logger.info(f"Executing _handle_list_books_command with args: {args}")
 
         if args:
-            potential_book_file_arg = args[0]
-            # Normalize the first argument (potential book file) for matching
-            normalized_query_arg = potential_book_file_arg.lower()
-            if normalized_query_arg.endswith(".txt"):
-                normalized_query_arg = normalized_query_arg[:-4]
-
-            matched_filename_for_delegation = None
-            for book_file_in_list in self.available_book_files:
-                normalized_book_file_in_list = book_file_in_list.lower()
-                if normalized_book_file_in_list.endswith(".txt"):
-                    normalized_book_file_in_list = normalized_book_file_in_list[:-4]
-
-                if normalized_query_arg == normalized_book_file_in_list:
-                    matched_filename_for_delegation = book_file_in_list  # Use original filename
-                    break
+            matched_filename_for_delegation, question_args = self._resolve_book_args(
+                args
+            )
 
             if matched_filename_for_delegation:
                 logger.info(
-                    f"Command '!books {potential_book_file_arg}...' matches book '{matched_filename_for_delegation}'. "
+                    f"Command '!books {' '.join(args)}' matches book '{matched_filename_for_delegation}'. "
                     f"Delegating to _handle_get_book_detail_command for this book."
                 )
-                # Delegate to the handler that gets book details.
-                # The rest of `args` (e.g., "what is this about") are not used for book retrieval itself
-                # but will be part of the overall prompt to the LLM.
-                return await self._handle_get_book_detail_command([matched_filename_for_delegation])
+                # Delegate to the handler that gets book details. The rest of
+                # `args` (e.g., "what is this about") picks the passages it returns.
+                return await self._handle_get_book_detail_command(
+                    [matched_filename_for_delegation, *question_args]
+                )
 
         # Original behavior: list all books if no specific book identified in args[0] or no args
         if not self.available_book_files:
@@ -209,6 +333,8 @@ class BangCommandHandlerClient(ContextClientP):
     ) -> CommandContextSnippet:
         user_query = " ".join(args).strip()
         command_query_str = f"!book {user_query}" if user_query else "!book"
+        title_args, section = parse_section_request(args)
+        title_query = " ".join(title_args).strip()
         logger.info(
             f"Executing _handle_get_book_detail_command with query: '{user_query}'"
         )
@@ -216,7 +342,10 @@ class BangCommandHandlerClient(ContextClientP):
         if not user_query:
             return CommandContextSnippet(
                 command_query=command_query_str,
-                result_text="Usage: !book <query> or !b <query>. Please provide a search query for the book title.",
+                result_text=(
+                    "Usage: !book <query> [toc | ch <n> | lines <a-b> | bytes <a-b>] "
+                    "or !b <query>. Please provide a search query for the book title."
+                ),
                 source="BangCommandHandlerClient",
             )
 
@@ -227,36 +356,35 @@ class BangCommandHandlerClient(ContextClientP):
                 source="LocalBookDirectory",
             )
 
-        # Deterministic filename matching
-        normalized_user_query = user_query.lower()
-        if normalized_user_query.endswith(".txt"):
-            normalized_user_query = normalized_user_query[:-4]
-
-        matched_filename = None
-        for book_file in self.available_book_files:
-            normalized_book_file = book_file.lower()
-            if normalized_book_file.endswith(".txt"):
-                normalized_book_file = normalized_book_file[:-4]
+        # Deterministic filename matching; whatever follows the title is a question
+        matched_filename, question_args = self._resolve_book_args(title_args)
+        question = " ".join(question_args)
 
-            if normalized_user_query == normalized_book_file:
-                matched_filename = (
-                    book_file  # Use the original filename with case and extension
-                )
-                break
-
-        logger.info(
-            f"Normalized query: '{normalized_user_query}', Matched filename: {matched_filename}"
-        )
+        logger.info(f"Query: '{user_query}', Matched filename: {matched_filename}")
 
         if matched_filename:
             try:
                 book_file_path = os.path.join(self.books_dir_path, matched_filename)
-                with open(book_file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-
+                if section is not None:
+                    # indexing and slicing a large book is blocking file work
+                    label, content = await asyncio.to_thread(
+                        read_section, book_file_path, section
+                    )
+                    return CommandContextSnippet(
+                        command_query=command_query_str,
+                        result_text=f"Content for {matched_filename} ({label}):\n\n{content}",
+                        source=f"LocalBookFile:{matched_filename}",
+                    )
+                # only the passages relevant to the question, within the size
+                # cap; reading and ranking a whole book is blocking work too
+                passages = await asyncio.to_thread(
+                    _select_book_passages, book_file_path, question
+                )
+                label = f" (passages relevant to '{question}')" if question else ""
                 return CommandContextSnippet(
                     command_query=command_query_str,
-                    result_text=f"Content for {matched_filename}:\n\n{content}",
+                    result_text=f"Content for {matched_filename}{label}:\n\n"
+                    + passages,
                     source=f"LocalBookFile:{matched_filename}",
                 )
             except (
@@ -265,26 +393,95 @@ class BangCommandHandlerClient(ContextClientP):
                 logger.error(
                     f"Book file '{matched_filename}' (matched deterministically) not found at path: {book_file_path}"
                 )
+                raise CommandFailed(
+                    CommandContextSnippet(
+                        command_query=command_query_str,
+                        result_text=f"Error: Book file '{matched_filename}' was matched but could not be found on disk.",
+                        source="LocalBookFile",
+                    )
+                )
+            except BookSectionError as e:
                 return CommandContextSnippet(
                     command_query=command_query_str,
-                    result_text=f"Error: Book file '{matched_filename}' was matched but could not be found on disk.",
-                    source="LocalBookFile",
+                    result_text=f"Error: {e} Try '!book {title_query} toc' to see its sections.",
+                    source=f"LocalBookFile:{matched_filename}",
                 )
             except Exception as e:
                 logger.error(f"Error reading book file '{matched_filename}': {e}")
-                return CommandContextSnippet(
-                    command_query=command_query_str,
-                    result_text=f"Error reading content for book '{matched_filename}': {str(e)}",
-                    source=f"LocalBookFile:{matched_filename}",
+                raise CommandFailed(
+                    CommandContextSnippet(
+                        command_query=command_query_str,
+                        result_text=f"Error reading content for book '{matched_filename}': {str(e)}",
+                        source=f"LocalBookFile:{matched_filename}",
+                    )
                 )
         else:
             logger.info(f"No matching book found for query '{user_query}'.")
+            shortlist = self.book_catalog.fuzzy_match(title_query)
+            suggestions = "".join(
+                f"\n- {match.file}"
+                for match in shortlist
+                if match.score >= BOOK_SHORTLIST_MIN_SIMILARITY
+            )
             return CommandContextSnippet(
                 command_query=command_query_str,
-                result_text=f"Book matching query '{user_query}' not found. Try '!books' to see available titles.",
+                result_text=f"Book matching query '{user_query}' not found. "
+                + (
+                    f"Did you mean one of these?{suggestions}"
+                    if suggestions
+                    else "Try '!books' to see available titles."
+                ),
                 source="LocalBookDirectory",
             )
 
+    async def _handle_search_command(self, args: list[str]) -> CommandContextSnippet:
+        terms = " ".join(args).strip()
+        command_query_str = f"!search {terms}" if terms else "!search"
+        logger.info(f"Executing _handle_search_command with terms: '{terms}'")
+
+        if not terms:
+            return CommandContextSnippet(
+                command_query=command_query_str,
+                result_text="Usage: !search <terms>. Searches the text of every book.",
+                source="BangCommandHandlerClient",
+            )
+
+        await self.start_search_indexing()
+        # the query is blocking SQLite work; indexing runs on its own thread
+        hits = await asyncio.to_thread(
+            self.book_search.search, terms, BANG_SEARCH_RESULTS
+        )
+
+        if not hits:
+            still_indexing = (
+                " Books are still being indexed, so try again shortly."
+                if self.book_search.indexing
+                else ""
+            )
+            return CommandContextSnippet(
+                command_query=command_query_str,
+                result_text=f"No passages found for '{terms}'.{still_indexing}",
+                source="LocalBookSearch",
+            )
+        results = "\n\n".join(
+            f"{rank}. {hit.file} bytes {hit.start}-{hit.end - 1} "
+            f"(score {hit.score:.2f}):\n{hit.excerpt}"
+            for rank, hit in enumerate(hits, start=1)
+        )
+        return CommandContextSnippet(
+            command_query=command_query_str,
+            result_text=(
+                f"Top passages for '{terms}' (read one with "
+                f"'!book <title> bytes <a-b>'):\n\n{results}"
+            ),
+            source="LocalBookSearch",
+        )
+
+    async def start_search_indexing(self):
+        """Bring the search index up to date with the books on a worker thread."""
+        await self._refresh_book_directory()
+        self.book_search.sync_in_background(self.available_book_files)
+
 
 # Example of how it might be instantiated and used (for testing purposes)
 async def main():
@@ -1,6 +1,25 @@
 from typing import Protocol
 
+from src.models.context import ContextResult
+
 
 class ContextClientP(Protocol):
     async def get_context(self, key: str) -> list[str]:
         return []  # Default empty implementation
+
+    async def fetch(self, key: str, etag: str | None = None) -> ContextResult:
+        """
+        Like get_context, but also reports whether the fetch failed and how
+        long the result may be cached, and may return structured
+        ContextSnippets for the hydrator to render. Clients that support
+        revalidation answer not_modified when etag is still current.
+        """
+        return ContextResult(snippets=await self.get_context(key))
+
+    async def cache_key(self, key: str) -> str | None:
+        """
+        Cache key for key's context, if the client knows a better one than the
+        hydrator's default (e.g. one that changes whenever the content does).
+        Async, since finding out may mean blocking file work.
+        """
+        return None
@@ -1,12 +1,19 @@
 import logging
 import os
+import time
 from typing import List
 
 import httpx
 from loguru import logger
 
+from src.circuit_breaker import CircuitBreaker
 from src.clients.context_client_p import ContextClientP
-from src.models.context import WebsiteContextSnippet
+from src.models.context import (
+    ContextResult,
+    ContextSnippet,
+    WebsiteContextSnippet,
+    render_snippets,
+)
 from src.models.resource import ContentType, ResourceSubmission
 
 API_BASE_URL = os.environ.get("CONTEXT_KILLER_API_BASE_URL", "http://127.0.0.1:8000")
@@ -15,16 +22,66 @@ API_BASE_URL = os.environ.get("CONTEXT_KILLER_API_BASE_URL", "http://127.0.0.1:8
 class MultiClient(ContextClientP):
     """Client that uses the Context Killer API to create and retrieve resources."""
 
-    def __init__(self, base_url: str = API_BASE_URL):
+    def __init__(
+        self, base_url: str = API_BASE_URL, breaker: CircuitBreaker | None = None
+    ):
         self.base_url = base_url
+        # while the API is failing or slow, skip straight to the fallback content
+        self.breaker = breaker or CircuitBreaker("context_killer")
 
     async def get_context(self, key: str) -> List[str]:  # Changed 'url' to 'key'
         """
         Post a URL (passed as 'key') to the API and retrieve the processed content.
         Implements the ContextClient protocol.
         """
+        return render_snippets((await self.fetch(key)).snippets)
+
+    async def fetch(self, key: str, etag: str | None = None) -> ContextResult:
+        """
+        Like get_context, but failures are reported explicitly: the fallback
+        snippets come back with failed=True so they are never cached as content.
+        Freshness comes from the API's Cache-Control and ETag headers; with etag
+        set, a 304 comes back as not_modified.
+        """
         logger.info(f"Getting context via API for URL (key): {key}")
 
+        permit = self.breaker.allow()
+        if permit is None:
+            logger.warning(f"Context Killer API circuit is open, degrading {key}")
+            return ContextResult(
+                snippets=await self._mock_fallback(key),
+                failed=True,
+                retry_after_seconds=self.breaker.retry_after(),
+            )
+
+        started = time.monotonic()
+        healthy = False
+        try:
+            result = await self._create_resource(key, etag)
+            healthy = True
+            return result
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Error creating resource: {e}")
+            # a 4xx means the API is up and rejected this URL
+            status_code = e.response.status_code
+            healthy = status_code < 500 and status_code != 429
+            return ContextResult(
+                snippets=await self._mock_fallback(key),
+                failed=True,
+                retry_after_seconds=_parse_retry_after(
+                    e.response.headers.get("retry-after")
+                ),
+            )
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            logger.error(f"Error creating resource: {e}")
+            # Fall back to mock implementation if API fails
+            return ContextResult(snippets=await self._mock_fallback(key), failed=True)
+        finally:
+            self.breaker.record(healthy, time.monotonic() - started, permit)
+
+    async def _create_resource(
+        self, key: str, etag: str | None = None
+    ) -> ContextResult:
         # Create a resource via the API
         async with httpx.AsyncClient() as client:
             # Create the resource submission
@@ -34,41 +91,50 @@ class MultiClient(ContextClientP):
             )
 
             # Post to create resource
-            try:
-                logger.info(
-                    f"POST {self.base_url}/api/v1/resources {submission.model_dump()}"
-                )
+            logger.info(
+                f"POST {self.base_url}/api/v1/resources {submission.model_dump()}"
+            )
 
-                response = await client.post(
-                    f"{self.base_url}/api/v1/resources",
-                    json=submission.model_dump(),
-                    timeout=180.0,
+            response = await client.post(
+                f"{self.base_url}/api/v1/resources",
+                json=submission.model_dump(),
+                headers={"If-None-Match": etag} if etag else None,
+                timeout=180.0,
+            )
+            ttl_seconds = _parse_cache_control(response.headers)
+            if response.status_code == 304:
+                return ContextResult(
+                    snippets=[],
+                    ttl_seconds=ttl_seconds,
+                    etag=response.headers.get("etag", etag),
+                    not_modified=True,
                 )
+            response.raise_for_status()
 
-                resource = response.json()
-
-                logger.debug(f"Resource: {resource}")
-                logger.debug(f"Resource response metadata: {response.headers}")
-                logger.debug(f"Resource response status code: {response.status_code}")
-
-                # Create a context snippet from the resource
-                snippet = WebsiteContextSnippet(
-                    url=resource["url"],
-                    text_content=resource["content"],
-                    title=resource["title"],
-                )
+            resource = response.json()
 
-                logger.info(f"Snippet: {snippet}")
+            logger.debug(f"Resource: {resource}")
+            logger.debug(f"Resource response metadata: {response.headers}")
+            logger.debug(f"Resource response status code: {response.status_code}")
 
-                # Convert to XML and return
-                return [snippet.to_xml()]
+            # Create a context snippet from the resource
+            snippet = WebsiteContextSnippet(
+                url=resource["url"],
+                text_content=resource["content"],
+                title=resource["title"],
+            )
 
-            except httpx.HTTPError as e:
-                logger.error(f"Error creating resource: {e}")
-                # Fall back to mock implementation if API fails
-                return await self._mock_fallback(key)  # Pass 'key'
+            logger.info(f"Snippet: {snippet}")
+            # rendered by the hydrator, in whatever format it is configured for
+            return ContextResult(
+                snippets=[snippet],
+                ttl_seconds=ttl_seconds,
+                etag=response.headers.get("etag"),
+            )
 
-    async def _mock_fallback(self, key: str) -> List[str]:  # Changed 'url' to 'key'
+    async def _mock_fallback(
+        self, key: str
+    ) -> List[ContextSnippet]:  # Changed 'url' to 'key'
         """Fallback method if the API request fails."""
         logger.info(f"Using fallback mock for URL (key): {key}")
         content = f"API request failed. This is fallback content for {key}"  # Use 'key'
@@ -79,4 +145,41 @@ class MultiClient(ContextClientP):
             title=f"Fallback content for {key}",  # Use 'key'
         )
 
-        return [snippet.to_xml()]
+        return [snippet]
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    """Seconds from a Retry-After header; HTTP-date values are ignored."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _parse_cache_control(headers: httpx.Headers) -> float | None:
+    """
+    Freshness lifetime in seconds from Cache-Control (s-maxage, then max-age,
+    less Age), 0 for no-store/no-cache, None when the API gives no lifetime.
+    """
+    directives = {}
+    for part in headers.get("cache-control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip().strip('"')
+
+    if "no-store" in directives or "no-cache" in directives:
+        return 0.0
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                max_age = float(directives[name])
+            except ValueError:
+                continue
+            try:
+                age = float(headers.get("age", 0))
+            except ValueError:
+                age = 0.0
+            return max(0.0, max_age - age)
+    return None
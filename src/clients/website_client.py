@@ -4,7 +4,7 @@ from typing import List
 import httpx
 
 from src.clients.context_client_p import ContextClientP
-from src.models.context import WebsiteContextSnippet
+from src.models.context import ContextResult, WebsiteContextSnippet, render_snippets
 from src.models.resource import ContentType, ResourceSubmission
 
 logger = logging.getLogger(__name__)
@@ -15,6 +15,9 @@ API_BASE_URL = "http://127.0.0.1:8000"
 
 class WebsiteContextClient(ContextClientP):
     async def get_context(self, url: str) -> List[str]:
+        return render_snippets((await self.fetch(url)).snippets)
+
+    async def fetch(self, url: str) -> ContextResult:
         logger.info(f"Getting context from website: {url}")
 
         # In the future, this would use a real scraper
@@ -28,8 +31,7 @@ class WebsiteContextClient(ContextClientP):
 
         logger.info(f"Snippet: {snippet}")
 
-        # Convert to XML and return
-        return [snippet.to_xml()]
+        return ContextResult(snippets=[snippet])
 
     async def _mock_scrape_url(self, url: str) -> str:
         logger.info(f"Mock scraping URL: {url}")
@@ -1,7 +1,13 @@
 import asyncio
+import hashlib
+import json
+import os
 import re
+import time
+from dataclasses import dataclass
 from enum import StrEnum, auto
 from typing import Any, Callable, Dict, List, Mapping, Optional, Protocol, Union
+from xml.sax.saxutils import quoteattr
 
 import loguru
 
@@ -9,8 +15,26 @@ from src.cache import CacheWrapper
 from src.clients.bang_command_handler_client import (
     BangCommandHandlerClient,  # Added import
 )
+from src.clients.context_client_p import ContextClientP
 from src.clients.multi_client import MultiClient
 from src.clients.website_client import WebsiteContextClient
+from src.memory_cache import MemoryCache
+from src.models.cache_entry import CacheEntry
+from src.models.context import (
+    SNIPPET_FORMAT_VERSIONS,
+    ContextResult,
+    ContextSnippet,
+    ContextType,
+    SnippetFormat,
+)
+from src.models.stats import HydrationStats
+from src.passage_selection import (
+    PASSAGE_SELECTION_MAX_CHARS,
+    query_terms,
+    select_passages,
+)
+from src.single_flight import CONTEXT_FETCH_LOCK_ENABLED, SingleFlight
+from src.url_canonicalizer import canonicalize_url
 
 logger = loguru.logger
 
@@ -20,21 +44,142 @@ class ContextCommand(StrEnum):
     BANG_COMMAND = auto()
 
 
+# after the TTL, snippets are still served (stale) for this long while a
+# background task refreshes them
+CONTEXT_CACHE_STALE_GRACE_SECONDS = int(
+    os.getenv("CONTEXT_CACHE_STALE_GRACE_SECONDS", 300)
+)
+# how long a failed fetch is remembered (and its source left alone) when the
+# source did not send its own Retry-After
+CONTEXT_CACHE_NEGATIVE_TTL_SECONDS = float(
+    os.getenv("CONTEXT_CACHE_NEGATIVE_TTL_SECONDS", 30)
+)
+# > 0 enables probabilistic early refresh of hot keys before they go stale
+CONTEXT_CACHE_EARLY_REFRESH_BETA = float(
+    os.getenv("CONTEXT_CACHE_EARLY_REFRESH_BETA", 0)
+)
+
 # cache of context snippets
-context_cache = CacheWrapper(ttl_seconds=300)  # 5 minute TTL
+context_cache = CacheWrapper(
+    ttl_seconds=300,  # 5 minute TTL
+    grace_seconds=CONTEXT_CACHE_STALE_GRACE_SECONDS,
+)
+
+# concurrent misses for the same cache key share one fetch
+context_single_flight = SingleFlight(
+    lock_cache=context_cache if CONTEXT_FETCH_LOCK_ENABLED else None
+)
+
+# cache of fully hydrated user turns, keyed by a hash of the original content
+turn_cache = CacheWrapper(
+    ttl_seconds=int(os.getenv("HYDRATOR_TURN_CACHE_TTL_SECONDS", 300))
+)
+# bump when the hydrated output format changes so stale turns are not reused
+# (snippet rendering changes are covered by SNIPPET_FORMAT_VERSIONS)
+TURN_CACHE_VERSION = "v2"
+# how cached context snippets are rendered into user turns: xml (compact),
+# pretty_xml or markdown
+CONTEXT_SNIPPET_FORMAT = SnippetFormat(
+    os.getenv("CONTEXT_SNIPPET_FORMAT", "pretty_xml")
+)
+# byte budget of the rendered snippets kept for reuse across requests; they are
+# kept apart from the snippets cached in L1 so that tier's budget holds
+HYDRATOR_RENDER_CACHE_MAX_BYTES = int(
+    os.getenv("HYDRATOR_RENDER_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+)
+# reuse previously hydrated turns instead of re-resolving the whole history
+HYDRATOR_INCREMENTAL = os.getenv("HYDRATOR_INCREMENTAL", "true").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
+
+# URLs in user turns, as extracted before canonicalization
+URL_PATTERN = re.compile(r"https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+(?:/[^\s]*)?")
+
+# Byte sequences that must be present in a raw request body for a URL
+# ("://", possibly JSON-escaped as ":\/") or a bang command ("!" followed by
+# a command character) to exist. JSON-escaped ASCII (e.g. "\u0021") can hide
+# either, so its presence also forces the full parse.
+DIRECTIVE_TRIGGER_PATTERN = re.compile(rb"![a-zA-Z0-9_.-]|:\\?/|\\u00[2-7][0-9a-fA-F]")
+
+
+# overall time budget for resolving a chat's directives; whatever is not ready
+# by then is replaced by PENDING_CONTEXT_SNIPPET and keeps loading in the
+# background. 0 disables the deadline. Requests can set their own budget with
+# the X-Hydration-Deadline header.
+HYDRATION_DEADLINE_SECONDS = float(os.getenv("HYDRATION_DEADLINE_SECONDS", 0))
+PENDING_CONTEXT_SNIPPET = (
+    "<pending_context source={source}>Context for this reference was still "
+    "loading when the request was sent.</pending_context>"
+)
+# stands in for a directive whose fetch raised, so the rest of the turn is kept
+FAILED_CONTEXT_SNIPPET = (
+    "<failed_context source={source}>Context for this reference could not be "
+    "loaded.</failed_context>"
+)
+
+# maximum number of context fetches in flight at once, across all clients
+HYDRATOR_MAX_CONCURRENCY = int(os.getenv("HYDRATOR_MAX_CONCURRENCY", 8))
+# default per-client limit; override with HYDRATOR_<COMMAND>_CONCURRENCY,
+# e.g. HYDRATOR_WEBSITE_CONCURRENCY=4
+HYDRATOR_CLIENT_CONCURRENCY = int(os.getenv("HYDRATOR_CLIENT_CONCURRENCY", 4))
+
+
+@dataclass(frozen=True)
+class Directive:
+    """A single URL or bang command found in a user turn."""
+
+    command: ContextCommand
+    key: str  # what the context client receives
+    cache_key: str  # where its snippets live in context_cache
 
 
-class ContextClient(Protocol):
+class ContextClient(ContextClientP, Protocol):
     async def get_context(self, key: str) -> List[str]:
         return []  # Default empty implementation
 
 
 class ChatHydrator:
-    def __init__(self, clients: Mapping[ContextCommand, ContextClient]):
+    def __init__(
+        self,
+        clients: Mapping[ContextCommand, ContextClient],
+        incremental: bool = HYDRATOR_INCREMENTAL,
+        max_concurrency: int = HYDRATOR_MAX_CONCURRENCY,
+        client_concurrency: Mapping[ContextCommand, int] | None = None,
+        early_refresh_beta: float = CONTEXT_CACHE_EARLY_REFRESH_BETA,
+        deadline_seconds: float = HYDRATION_DEADLINE_SECONDS,
+        snippet_format: SnippetFormat = CONTEXT_SNIPPET_FORMAT,
+        render_cache_max_bytes: int = HYDRATOR_RENDER_CACHE_MAX_BYTES,
+    ):
         self.clients: Mapping[ContextCommand, ContextClient] = clients
-        self.url_pattern = re.compile(
-            r"https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+(?:/[^\s]*)?"
-        )
+        self.incremental = incremental
+        self.early_refresh_beta = early_refresh_beta
+        self.deadline_seconds = deadline_seconds
+        self.snippet_format = snippet_format
+        # rendered snippets by context cache key, entry version and format
+        self._rendered: MemoryCache[str] = MemoryCache(render_cache_max_bytes)
+        # strong references so background refreshes are not garbage collected
+        self._background_tasks: set[asyncio.Task] = set()
+        # bounded fan-out: one limit shared by all fetches, plus one per client
+        self._concurrency_limit = asyncio.Semaphore(max_concurrency)
+        client_concurrency = client_concurrency or {}
+        self._client_limits = {
+            command: asyncio.Semaphore(
+                client_concurrency.get(
+                    command,
+                    int(
+                        os.getenv(
+                            f"HYDRATOR_{command.name}_CONCURRENCY",
+                            HYDRATOR_CLIENT_CONCURRENCY,
+                        )
+                    ),
+                )
+            )
+            for command in ContextCommand
+        }
+        self.url_pattern = URL_PATTERN
         # Pattern for bang commands: !command <arguments up to newline/end of string>
         # Captures the command and its arguments (e.g., "books" or "weather London today")
         # The command name is group 1: alphanumeric + _.-
@@ -42,6 +187,31 @@ class ChatHydrator:
         self.bang_command_pattern = re.compile(
             r"!([a-zA-Z0-9_.-]+)((?:\s+[a-zA-Z0-9_.-]+)*)"
         )
+        self.stats = HydrationStats()
+
+    def may_need_hydration(self, body: bytes) -> bool:
+        """Cheap pre-scan: False means no URL or bang command can be in the body."""
+        return DIRECTIVE_TRIGGER_PATTERN.search(body) is not None
+
+    async def get_hydrated_body(
+        self, body: bytes, deadline_seconds: float | None = None
+    ) -> bytes:
+        """
+        Hydrate a raw chat completion request body.
+        Bodies without any directive trigger are returned unchanged, skipping
+        the JSON decode, message copies and re-encode entirely.
+        """
+        self.stats.requests += 1
+        if not self.may_need_hydration(body):
+            self.stats.fast_path += 1
+            logger.info("No directives in chat body, forwarding raw bytes")
+            return body
+
+        self.stats.hydrated += 1
+        hydrated_chat = await self.get_hydrated_chat(
+            json.loads(body), deadline_seconds=deadline_seconds
+        )
+        return json.dumps(hydrated_chat).encode("utf-8")
 
     def _extract_urls(self, text: str) -> List[str]:
         if not text:
@@ -62,8 +232,17 @@ class ChatHydrator:
                 extracted_commands.append(full_command)
         return extracted_commands
 
-    async def get_hydrated_chat(self, chat: Dict[str, Any]) -> Dict[str, Any]:
+    async def get_hydrated_chat(
+        self, chat: Dict[str, Any], deadline_seconds: float | None = None
+    ) -> Dict[str, Any]:
+        """
+        Hydrate every user turn of a chat. deadline_seconds (default: the
+        hydrator's own) bounds how long we wait for context; 0 waits for all.
+        """
         logger.debug(f"Hydrating chat: {chat}")
+        if deadline_seconds is None:
+            deadline_seconds = self.deadline_seconds
+        deadline = time.monotonic() + deadline_seconds if deadline_seconds > 0 else None
         if not chat or "messages" not in chat:
             logger.warning("No valid chat object provided to hydrate")
             return chat
@@ -74,101 +253,431 @@ class ChatHydrator:
                 print(f"System prompt: {message.get('content')}")
                 break
 
+        messages = chat.get("messages", [])
+        user_turns = [
+            message["content"]
+            for message in messages
+            if message.get("role") == "user"
+            and isinstance(message.get("content", ""), str)
+        ]
+        hydrated_turns = await self._hydrate_turns(user_turns, deadline)
+
         # Create a new chat object with the same structure
         hydrated_chat = dict(chat)
         hydrated_chat["messages"] = []
 
-        for message in chat.get("messages", []):
+        for message in messages:
             # Create a copy of the message
             hydrated_message = dict(message)
             logger.info(f"Inspecting message: {hydrated_message['content'][:100]}")
 
             # Process user messages
             if message.get("role") == "user":
-                # Check for URLs in content
                 original_content = message.get("content", "")
                 if isinstance(original_content, str):
-                    # Extract URLs
-                    urls = self._extract_urls(original_content)
-
-                    if urls:
-                        logger.info(f"Found {len(urls)} URLs: {urls}")
-                    else:
-                        logger.info("No URLs found")
-
-                    context_snippets = []  # Combined snippets from all sources
-
-                    # Process URLs
-                    if urls and ContextCommand.WEBSITE in self.clients:
-                        url_snippets_to_add = []
-                        for url in urls:
-                            cached_snippets = context_cache.get(url)
-                            if cached_snippets is not None:
-                                url_snippets_to_add.extend(cached_snippets)
-                            else:
-                                new_snippets = await self.clients[
-                                    ContextCommand.WEBSITE
-                                ].get_context(url)
-                                context_cache.set(url, new_snippets)  # Cache for URLs
-                                url_snippets_to_add.extend(new_snippets)
-                        if url_snippets_to_add:
-                            context_snippets.extend(url_snippets_to_add)
-                            logger.info(
-                                f"Collected {len(url_snippets_to_add)} context snippets for URLs"
-                            )
-
-                    # Extract Bang Commands
-                    bang_commands = self._extract_bang_commands(original_content)
-                    if bang_commands:
-                        logger.info(
-                            f"Found {len(bang_commands)} bang commands: {bang_commands}"
-                        )
-                    else:
-                        logger.info("No bang commands found")
-
-                    # Process Bang Commands
-                    if bang_commands and ContextCommand.BANG_COMMAND in self.clients:
-                        bang_snippets_to_add = []
-                        for command_str in bang_commands:
-                            cache_key = f"!{command_str}"  # Cache key for bang commands
-                            cached_snippets = context_cache.get(cache_key)
-                            if cached_snippets is not None:
-                                bang_snippets_to_add.extend(cached_snippets)
-                            else:
-                                # The command_str (e.g., "books" or "weather London") is the key for the client
-                                new_snippets = await self.clients[
-                                    ContextCommand.BANG_COMMAND
-                                ].get_context(command_str)
-                                context_cache.set(cache_key, new_snippets)
-                                bang_snippets_to_add.extend(new_snippets)
-                        if bang_snippets_to_add:
-                            context_snippets.extend(bang_snippets_to_add)
-                            logger.info(
-                                f"Collected {len(bang_snippets_to_add)} context snippets for bang commands"
-                            )
-
-                    # Append all collected snippets to the message content
-                    if context_snippets:
-                        # Ensure original content ends with a newline if it doesn't already, before appending snippets
-                        current_content = hydrated_message.get(
-                            "content", ""
-                        )  # Get potentially already modified content
-                        if current_content and not current_content.endswith("\n"):
-                            hydrated_message["content"] = current_content + "\n"
-                        # else: # content already has newline or is empty
-                        # hydrated_message["content"] = current_content
-
-                        hydrated_message["content"] += "\n" + "\n\n".join(
-                            context_snippets
-                        )
-                        logger.info(
-                            f"Appended a total of {len(context_snippets)} context snippets to the message"
-                        )
+                    hydrated_message["content"] = hydrated_turns[original_content]
 
             hydrated_chat["messages"].append(hydrated_message)
 
         return hydrated_chat
 
+    async def _hydrate_turns(
+        self, turns: List[str], deadline: float | None = None
+    ) -> Dict[str, str]:
+        """
+        Hydrate user turns, returning original content -> hydrated content.
+
+        In incremental mode, turns we have already hydrated are recognised by a
+        hash of their content and served from the turn cache in one lookup, so
+        only new turns reach the context clients. The directives of all new
+        turns are then resolved concurrently, until the deadline (a
+        time.monotonic() timestamp) if there is one.
+        """
+        hydrated_turns: Dict[str, str] = {}
+        pending_turns = list(dict.fromkeys(turns))  # dedupe, keep order
+
+        if self.incremental and pending_turns:
+            cached_turns = await turn_cache.get_many(
+                [self._turn_cache_key(content) for content in pending_turns]
+            )
+            for content in pending_turns:
+                cached_turn = cached_turns[self._turn_cache_key(content)]
+                if cached_turn is not None:
+                    hydrated_turns[content] = cached_turn[0]
+            if hydrated_turns:
+                logger.info(f"Reusing {len(hydrated_turns)} already hydrated turn(s)")
+            pending_turns = [c for c in pending_turns if c not in hydrated_turns]
+
+        plans = {
+            content: await self._plan_directives(content) for content in pending_turns
+        }
+        entries_by_directive = await self._resolve_directives(
+            [directive for plan in plans.values() for directive in plan], deadline
+        )
+
+        new_turns: Dict[str, CacheEntry] = {}
+        now = time.time()
+        for content, plan in plans.items():
+            question = self._question(content)
+            # snippets are appended in directive order, whatever order they resolved in
+            # snippets are cached structured and only rendered here
+            context_snippets = [
+                snippet
+                for directive in plan
+                for snippet in await self._render(
+                    directive, entries_by_directive[directive], question
+                )
+            ]
+            hydrated_content = self._append_snippets(content, context_snippets)
+            hydrated_turns[content] = hydrated_content
+            # a turn with degraded or missing context must be hydrated again next time
+            if not any(entries_by_directive[d].failed for d in plan):
+                # nor may it outlive the freshest of the context it embeds
+                ttl_seconds = min(
+                    [turn_cache.ttl_seconds]
+                    + [entries_by_directive[d].fresh_until - now for d in plan]
+                )
+                new_turns[self._turn_cache_key(content)] = turn_cache.make_entry(
+                    [hydrated_content], ttl_seconds=ttl_seconds
+                )
+
+        if self.incremental:
+            await turn_cache.set_entries(new_turns)
+
+        return hydrated_turns
+
+    async def _render(
+        self, directive: Directive, entry: CacheEntry, question: str
+    ) -> List[str]:
+        """
+        Render the snippets of a directive's entry for one turn. Snippets used
+        whole are rendered once per entry and format and kept in a bounded
+        cache of their own; passages selected for a question are rendered anew.
+        """
+        fmt = self.snippet_format
+        # fresh_until changes whenever the entry is written again
+        prefix = (
+            f"{directive.cache_key}:{entry.fresh_until!r}:"
+            f"{fmt.value}{SNIPPET_FORMAT_VERSIONS[fmt]}"
+        )
+        ttl_seconds = (
+            entry.fresh_until - time.time() + CONTEXT_CACHE_STALE_GRACE_SECONDS
+        )
+        rendered = []
+        selected = await self._select_relevant(entry.value, question)
+        for index, (original, snippet) in enumerate(zip(entry.value, selected)):
+            if isinstance(snippet, str):
+                rendered.append(snippet)
+                continue
+            if snippet is not original or entry.failed:
+                rendered.append(snippet.render(fmt))
+                continue
+            key = f"{prefix}:{index}"
+            text = self._rendered.get(key)
+            if text is None:
+                text = snippet.render(fmt)
+                self._rendered.set(key, text, len(text.encode("utf-8")), ttl_seconds)
+            rendered.append(text)
+        return rendered
+
+    def _question(self, content: str) -> str:
+        """What a turn asks about its context: the turn without its directives."""
+        return self.bang_command_pattern.sub(" ", self.url_pattern.sub(" ", content))
+
+    async def _select_relevant(
+        self, snippets: List[Union[str, ContextSnippet]], question: str
+    ) -> List[Union[str, ContextSnippet]]:
+        """
+        Cut large web pages down to the passages relevant to question. Pages are
+        cached whole, so each turn selects from the full text; a turn with no
+        question keeps the whole page. Ranking a large page is CPU-bound, so it
+        runs on a worker thread.
+        """
+        if not query_terms(question):
+            return snippets
+        selected = []
+        for snippet in snippets:
+            if (
+                isinstance(snippet, ContextSnippet)
+                and snippet.type == ContextType.WEBSITE
+            ):
+                text = snippet.content.get("text_content") or ""
+                if len(text) <= PASSAGE_SELECTION_MAX_CHARS:
+                    selected.append(snippet)  # fits as it is
+                    continue
+                relevant = await asyncio.to_thread(select_passages, text, question)
+                if relevant is not text:
+                    snippet = ContextSnippet(
+                        type=snippet.type,
+                        content={**snippet.content, "text_content": relevant},
+                    )
+            selected.append(snippet)
+        return selected
+
+    def _turn_cache_key(self, content: str) -> str:
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        fmt = self.snippet_format
+        return f"turn:{TURN_CACHE_VERSION}:{fmt.value}{SNIPPET_FORMAT_VERSIONS[fmt]}:{digest}"
+
+    async def _plan_directives(self, content: str) -> List[Directive]:
+        """Extract the URLs and bang commands of one user turn, in resolution order."""
+        plan: List[Directive] = []
+
+        # Extract URLs
+        urls = self._extract_urls(content)
+        if urls:
+            logger.info(f"Found {len(urls)} URLs: {urls}")
+        else:
+            logger.info("No URLs found")
+        if ContextCommand.WEBSITE in self.clients:
+            # spellings of the same page share one fetch and one cache entry
+            canonical_urls = dict.fromkeys(canonicalize_url(url) for url in urls)
+            plan.extend(
+                [
+                    Directive(
+                        ContextCommand.WEBSITE,
+                        url,
+                        cache_key=await self._cache_key(
+                            ContextCommand.WEBSITE, url, url
+                        ),
+                    )
+                    for url in canonical_urls
+                ]
+            )
+
+        # Extract Bang Commands
+        bang_commands = self._extract_bang_commands(content)
+        if bang_commands:
+            logger.info(f"Found {len(bang_commands)} bang commands: {bang_commands}")
+        else:
+            logger.info("No bang commands found")
+        if ContextCommand.BANG_COMMAND in self.clients:
+            # The command_str (e.g., "books" or "weather London") is the key for the client
+            plan.extend(
+                [
+                    Directive(
+                        ContextCommand.BANG_COMMAND,
+                        command_str,
+                        cache_key=await self._cache_key(
+                            ContextCommand.BANG_COMMAND, command_str, f"!{command_str}"
+                        ),
+                    )
+                    for command_str in bang_commands
+                ]
+            )
+
+        return plan
+
+    async def _cache_key(self, command: ContextCommand, key: str, default: str) -> str:
+        # clients may key their context by something that changes with it
+        cache_key = getattr(self.clients[command], "cache_key", None)
+        return (await cache_key(key) if cache_key is not None else None) or default
+
+    async def _resolve_directives(
+        self, directives: List[Directive], deadline: float | None = None
+    ) -> Dict[Directive, CacheEntry]:
+        """
+        Resolve unique directives concurrently, bounded by the fan-out limits.
+        Fetches still running at the deadline get a pending placeholder here and
+        finish in the background, filling the cache for the next request.
+        """
+        unique_directives = list(dict.fromkeys(directives))
+        if not unique_directives:
+            return {}
+
+        # one round trip for every cached directive, fresh or stale
+        entries_by_directive: Dict[Directive, CacheEntry] = {}
+        entries = await context_cache.get_entries(
+            [directive.cache_key for directive in unique_directives]
+        )
+        now = time.time()
+        for directive in unique_directives:
+            entry = entries[directive.cache_key]
+            if entry is None:
+                continue
+            entries_by_directive[directive] = entry
+            if entry.failed:
+                # negative entry: the source failed recently, leave it alone
+                self.stats.negative_hits += 1
+            elif not entry.is_fresh(now):
+                # stale-while-revalidate: answer now, refresh for the next caller
+                self.stats.stale_served += 1
+                self._refresh_in_background(directive, entry)
+            elif entry.should_refresh_early(self.early_refresh_beta, now):
+                self.stats.early_refreshes += 1
+                self._refresh_in_background(directive, entry)
+
+        misses = [d for d in unique_directives if d not in entries_by_directive]
+        if misses:
+            logger.info(f"Resolving {len(misses)} directive(s) concurrently")
+            tasks = {
+                asyncio.create_task(self._resolve_directive(directive)): directive
+                for directive in misses
+            }
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            # one failed directive must not discard what the others fetched
+            fetched = {
+                tasks[task]: self._failed_entry(tasks[task], task.exception())
+                if task.exception() is not None
+                else task.result()
+                for task in tasks
+                if task in done
+            }
+            entries_by_directive.update(fetched)
+            # and one pipeline to write every fetched result back
+            await context_cache.set_entries(
+                {directive.cache_key: entry for directive, entry in fetched.items()}
+            )
+
+            if pending:
+                self.stats.deadline_exceeded += 1
+                logger.warning(
+                    f"Hydration deadline passed with {len(pending)} directive(s) "
+                    "unresolved, forwarding without them"
+                )
+                for task in pending:
+                    directive = tasks[task]
+                    entries_by_directive[directive] = self._pending_entry(directive)
+                    self._finish_in_background(directive, task)
+
+        return entries_by_directive
+
+    async def _resolve_directive(
+        self, directive: Directive, previous: CacheEntry | None = None
+    ) -> CacheEntry:
+        return await context_single_flight.do(
+            directive.cache_key,
+            lambda: self._fetch_directive(directive, previous),
+            recheck=lambda: self._get_fresh_entry(directive.cache_key),
+            publish=lambda entry: context_cache.set_entries(
+                {directive.cache_key: entry}
+            ),
+        )
+
+    @staticmethod
+    async def _get_fresh_entry(cache_key: str) -> CacheEntry | None:
+        entry = (await context_cache.get_entries([cache_key]))[cache_key]
+        return entry if entry is not None and entry.is_fresh() else None
+
+    async def _fetch_directive(
+        self, directive: Directive, previous: CacheEntry | None = None
+    ) -> CacheEntry:
+        """
+        Fetch a directive's context. previous is the entry being refreshed, if
+        any: its ETag lets the client answer with not_modified instead.
+        """
+        client = self.clients[directive.command]
+        # the client's own limit first: waiting on it must not hold a shared
+        # slot that another client could use
+        async with self._client_limits[directive.command], self._concurrency_limit:
+            started = time.monotonic()
+            fetch = getattr(client, "fetch", None)
+            if fetch is None:
+                result = ContextResult(snippets=await client.get_context(directive.key))
+            elif previous is not None and previous.etag:
+                result = await fetch(directive.key, etag=previous.etag)
+            else:
+                result = await fetch(directive.key)
+            compute_seconds = time.monotonic() - started
+
+        if result.not_modified and previous is not None:
+            self.stats.revalidated += 1
+            return context_cache.make_entry(
+                previous.value,
+                compute_seconds=compute_seconds,
+                ttl_seconds=result.ttl_seconds,
+                etag=result.etag or previous.etag,
+            )
+        if not result.failed:
+            # each source decides how long its context stays fresh
+            return context_cache.make_entry(
+                result.snippets,
+                compute_seconds=compute_seconds,
+                ttl_seconds=result.ttl_seconds,
+                etag=result.etag,
+            )
+
+        # negative caching: remember the failure briefly, never as real content
+        self.stats.negative_cached += 1
+        retry_after = result.retry_after_seconds
+        logger.warning(
+            f"Fetching '{directive.key}' failed, backing off for "
+            f"{retry_after or CONTEXT_CACHE_NEGATIVE_TTL_SECONDS}s"
+        )
+        return context_cache.make_entry(
+            result.snippets,
+            compute_seconds=compute_seconds,
+            failed=True,
+            ttl_seconds=retry_after or CONTEXT_CACHE_NEGATIVE_TTL_SECONDS,
+        )
+
+    def _refresh_in_background(self, directive: Directive, current: CacheEntry):
+        async def refresh():
+            try:
+                entry = await self._resolve_directive(directive, current)
+                if entry.failed:
+                    # keep serving the content we had until the retry-after passes
+                    entry = entry.model_copy(update={"value": current.value})
+                await context_cache.set_entries({directive.cache_key: entry})
+            except Exception as e:
+                logger.error(
+                    f"Background refresh of '{directive.cache_key}' failed: {e}"
+                )
+
+        self.stats.background_refreshes += 1
+        task = asyncio.create_task(refresh())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    @staticmethod
+    def _pending_entry(directive: Directive) -> CacheEntry:
+        # never stored; failed keeps the turn out of the turn cache
+        return CacheEntry(
+            value=[PENDING_CONTEXT_SNIPPET.format(source=quoteattr(directive.key))],
+            fresh_until=0,
+            failed=True,
+        )
+
+    def _failed_entry(self, directive: Directive, error: BaseException) -> CacheEntry:
+        # negative-cached like a failed fetch, so the source gets a rest too
+        logger.error(f"Resolving '{directive.cache_key}' failed: {error!r}")
+        self.stats.negative_cached += 1
+        return context_cache.make_entry(
+            [FAILED_CONTEXT_SNIPPET.format(source=quoteattr(directive.key))],
+            failed=True,
+            ttl_seconds=CONTEXT_CACHE_NEGATIVE_TTL_SECONDS,
+        )
+
+    def _finish_in_background(self, directive: Directive, task: asyncio.Task):
+        async def finish():
+            try:
+                entry = await task
+                await context_cache.set_entries({directive.cache_key: entry})
+            except Exception as e:
+                logger.error(f"Late fetch of '{directive.cache_key}' failed: {e}")
+
+        self.stats.deferred_fetches += 1
+        background_task = asyncio.create_task(finish())
+        self._background_tasks.add(background_task)
+        background_task.add_done_callback(self._background_tasks.discard)
+
+    @staticmethod
+    def _append_snippets(original_content: str, context_snippets: List[str]) -> str:
+        if not context_snippets:
+            return original_content
+
+        # Ensure original content ends with a newline if it doesn't already, before appending snippets
+        hydrated_content = original_content
+        if hydrated_content and not hydrated_content.endswith("\n"):
+            hydrated_content += "\n"
+
+        hydrated_content += "\n" + "\n\n".join(context_snippets)
+        logger.info(
+            f"Appended a total of {len(context_snippets)} context snippets to the message"
+        )
+        return hydrated_content
+
 
 # Initialize context clients
 # website_client = WebsiteContextClient()
@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from typing import Any, Generic, NamedTuple, TypeVar
+
+from src.models.stats import CacheTierStats
+
+V = TypeVar("V")
+
+
+class _Entry(NamedTuple):
+    value: Any
+    size: int
+    expires_at: float
+
+
+class MemoryCache(Generic[V]):
+    """
+    In-process LRU cache bounded by total entry size in bytes, with a TTL per
+    entry. Not thread-safe; it is only touched from the event loop.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.stats = CacheTierStats()
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry.value
+
+    def set(self, key: str, value: V, size: int, ttl_seconds: float):
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes or ttl_seconds <= 0:
+            return  # would evict everything else, or is already expired
+        self._entries[key] = _Entry(value, size, time.monotonic() + ttl_seconds)
+        self._size += size
+        while self._size > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.stats.evictions += 1
+        self._update_gauges()
+
+    def delete(self, key: str):
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+        self._update_gauges()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+        self._update_gauges()
+
+    def _update_gauges(self):
+        self.stats.entries = len(self._entries)
+        self.stats.bytes = self._size
@@ -0,0 +1,44 @@
+import math
+import random
+import time
+
+from pydantic import BaseModel, Field
+
+from src.models.context import ContextSnippet
+
+
+class CacheEntry(BaseModel):
+    """
+    A cached value plus the metadata needed for stale-while-revalidate.
+
+    Failed entries (negative caching) hold degraded content; for them
+    fresh_until is the retry-after time before which the source is not asked
+    again, and they are never served past it. fresh_until is infinite for
+    values that only change along with their key (e.g. a file's mtime).
+    """
+
+    # structured snippets (context cache) or plain strings (turn cache)
+    value: list[str | ContextSnippet]
+    fresh_until: float  # epoch seconds; shared by every worker reading the entry
+    compute_seconds: float = 0.0  # how long producing the value took
+    failed: bool = False
+    etag: str | None = None  # validator for revalidating the value at its source
+    # the source asked for the value not to be cached; never written to a tier
+    no_store: bool = Field(default=False, exclude=True)
+
+    def is_fresh(self, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        return now < self.fresh_until
+
+    def should_refresh_early(self, beta: float, now: float | None = None) -> bool:
+        """
+        Probabilistic early expiration ("XFetch"): the closer the entry is to
+        going stale, and the longer it took to compute, the likelier we refresh
+        it now so hot keys never actually expire under load. beta <= 0 disables.
+        """
+        if beta <= 0 or self.compute_seconds <= 0:
+            return False
+        now = time.time() if now is None else now
+        # 1 - random() is in (0, 1], so the log is finite and <= 0
+        jitter = -self.compute_seconds * beta * math.log(1.0 - random.random())
+        return now + jitter >= self.fresh_until
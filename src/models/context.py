@@ -1,8 +1,6 @@
-import xml.etree.ElementTree as ET
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Dict, List, Optional, Protocol
-from xml.dom import minidom
+from typing import Any, Dict, List, Optional, Protocol, Union
 
 
 class ContextType(str, Enum):
@@ -16,6 +14,24 @@ class ContextType(str, Enum):
     # Add more types as needed
 
 
+class SnippetFormat(str, Enum):
+    """How context snippets are rendered into the prompt."""
+
+    XML = "xml"  # compact XML, no indentation
+    PRETTY_XML = "pretty_xml"  # indented XML, as to_xml has always produced
+    MARKDOWN = "markdown"
+
+
+# Bump a format's version whenever its rendering changes. Snippets are cached
+# structured and rendered per request, so only output that embeds rendered
+# snippets (the hydrated turn cache) needs to be keyed by it.
+SNIPPET_FORMAT_VERSIONS: Dict[SnippetFormat, int] = {
+    SnippetFormat.XML: 1,
+    SnippetFormat.PRETTY_XML: 1,
+    SnippetFormat.MARKDOWN: 1,
+}
+
+
 @dataclass
 class ContextSnippet:
     """Base class for context snippets."""
@@ -23,46 +39,147 @@ class ContextSnippet:
     type: ContextType
     content: Dict[str, Any]
 
+    def render(self, fmt: SnippetFormat = SnippetFormat.PRETTY_XML) -> str:
+        """Render the snippet in the given format."""
+        if fmt == SnippetFormat.XML:
+            return self._render_xml(indent_step="", newl="")
+        if fmt == SnippetFormat.MARKDOWN:
+            return self.to_markdown()
+        return self.to_xml()
+
     def to_xml(self) -> str:
-        """Convert the context snippet to XML format."""
-        # Create root element
-        root = ET.Element("context-snippet")
-        root.set("type", self.type.value)
+        """
+        Convert the context snippet to pretty-printed XML.
+
+        Rendered in one pass from a template. The output is the same as
+        serializing an ElementTree and pretty-printing it with
+        minidom.toprettyxml(indent="  ") without the XML declaration.
+        """
+        return self._render_xml(indent_step="  ", newl="\n")
 
-        # Add content elements
+    def to_markdown(self) -> str:
+        """Convert the context snippet to a markdown section."""
+        lines = [f"### Context: {self.type.value}"]
         for key, value in self.content.items():
-            if value is not None:
-                elem = ET.SubElement(root, key.replace("_", "-"))
-                if isinstance(value, dict):
-                    # Handle nested dictionaries
-                    for sub_key, sub_value in value.items():
-                        sub_elem = ET.SubElement(elem, sub_key.replace("_", "-"))
-                        sub_elem.text = str(sub_value)
-                elif isinstance(value, list):
-                    # Handle lists
-                    for item in value:
-                        if isinstance(item, dict):
-                            item_elem = ET.SubElement(elem, "item")
-                            for k, v in item.items():
-                                sub_elem = ET.SubElement(item_elem, k.replace("_", "-"))
-                                sub_elem.text = str(v)
-                        else:
-                            item_elem = ET.SubElement(elem, "item")
-                            item_elem.text = str(item)
-                else:
-                    # Simple value
-                    elem.text = str(value)
-
-        # Convert to pretty XML string
-        xml_str = ET.tostring(root, encoding="unicode")
-        pretty_xml = minidom.parseString(xml_str).toprettyxml(indent="  ")
-
-        # Remove XML declaration
-        lines = pretty_xml.split("\n")
-        if lines[0].startswith("<?xml"):
-            pretty_xml = "\n".join(lines[1:])
-
-        return pretty_xml
+            if value is None:
+                continue
+            label = key.replace("_", " ")
+            if isinstance(value, dict):
+                lines.append(f"**{label}:**")
+                lines.extend(
+                    f"- {sub_key.replace('_', ' ')}: {sub_value}"
+                    for sub_key, sub_value in value.items()
+                )
+            elif isinstance(value, list):
+                lines.append(f"**{label}:**")
+                lines.extend(f"- {item}" for item in value)
+            elif isinstance(value, str) and ("\n" in value or len(value) > 120):
+                # long text gets its own paragraph
+                lines.append(f"**{label}:**\n\n{value}")
+            else:
+                lines.append(f"**{label}:** {value}")
+        return "\n".join(lines) + "\n"
+
+    def _render_xml(self, indent_step: str, newl: str) -> str:
+        parts = [f'<context-snippet type="{_escape_xml(self.type.value)}"']
+        children = [
+            (key, value) for key, value in self.content.items() if value is not None
+        ]
+        if not children:
+            parts.append(f"/>{newl}")
+            return "".join(parts)
+
+        indent = indent_step
+        parts.append(f">{newl}")
+        for key, value in children:
+            tag = key.replace("_", "-")
+            if isinstance(value, dict):
+                # Handle nested dictionaries
+                _render_parent(parts, indent, indent_step, newl, tag, value)
+            elif isinstance(value, list):
+                # Handle lists
+                if not value:
+                    parts.append(f"{indent}<{tag}/>{newl}")
+                    continue
+                parts.append(f"{indent}<{tag}>{newl}")
+                for item in value:
+                    if isinstance(item, dict):
+                        _render_parent(
+                            parts, indent + indent_step, indent_step, newl, "item", item
+                        )
+                    else:
+                        _render_leaf(parts, indent + indent_step, newl, "item", item)
+                parts.append(f"{indent}</{tag}>{newl}")
+            else:
+                # Simple value
+                _render_leaf(parts, indent, newl, tag, value)
+        parts.append(f"</context-snippet>{newl}")
+        return "".join(parts)
+
+
+def _escape_xml(text: str) -> str:
+    # line endings are normalized the way an XML parser would, then escaped
+    # like minidom does (which includes double quotes in text)
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
+
+
+def _render_leaf(parts: List[str], indent: str, newl: str, tag: str, value: Any):
+    text = str(value)
+    if text:
+        parts.append(f"{indent}<{tag}>{_escape_xml(text)}</{tag}>{newl}")
+    else:
+        parts.append(f"{indent}<{tag}/>{newl}")
+
+
+def _render_parent(
+    parts: List[str],
+    indent: str,
+    indent_step: str,
+    newl: str,
+    tag: str,
+    values: Dict[str, Any],
+):
+    if not values:
+        parts.append(f"{indent}<{tag}/>{newl}")
+        return
+    parts.append(f"{indent}<{tag}>{newl}")
+    for key, value in values.items():
+        _render_leaf(parts, indent + indent_step, newl, key.replace("_", "-"), value)
+    parts.append(f"{indent}</{tag}>{newl}")
+
+
+def render_snippets(
+    snippets: List[Union[str, ContextSnippet]],
+    fmt: SnippetFormat = SnippetFormat.PRETTY_XML,
+) -> List[str]:
+    """Render structured snippets; pre-rendered strings pass through unchanged."""
+    return [
+        snippet if isinstance(snippet, str) else snippet.render(fmt)
+        for snippet in snippets
+    ]
+
+
+@dataclass
+class ContextResult:
+    """Snippets returned by a context client, and whether fetching them failed."""
+
+    # structured snippets, or strings already rendered by the client
+    snippets: List[Union[str, ContextSnippet]]
+    failed: bool = False  # snippets are placeholder/degraded content, not real context
+    retry_after_seconds: Optional[float] = None  # backoff the source asked for
+    # how long the snippets stay fresh: None for the cache default, 0 to not
+    # cache them, math.inf for content whose cache key changes with it
+    ttl_seconds: Optional[float] = None
+    etag: Optional[str] = None  # validator to revalidate the snippets with
+    # the source confirmed the snippets cached under etag are still current
+    not_modified: bool = False
 
 
 class ContextProvider(Protocol):
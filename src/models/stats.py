@@ -0,0 +1,97 @@
+from pydantic import BaseModel, computed_field
+
+
+class HydrationStats(BaseModel):
+    """Counters for how chat completion bodies were handled by the hydrator."""
+
+    requests: int = 0
+    fast_path: int = 0  # forwarded as raw bytes, no directive could be present
+    hydrated: int = 0  # parsed and run through get_hydrated_chat
+    stale_served: int = 0  # context served past its TTL, within the grace window
+    early_refreshes: int = 0  # fresh context picked for probabilistic early refresh
+    background_refreshes: int = 0
+    negative_cached: int = 0  # failed fetches recorded with a short TTL
+    negative_hits: int = 0  # lookups answered by a recorded failure
+    revalidated: int = 0  # stale context the source confirmed unchanged (ETag)
+    deadline_exceeded: int = 0  # chats forwarded before all their context was ready
+    deferred_fetches: int = 0  # fetches left to finish after their deadline
+
+    @computed_field
+    @property
+    def fast_path_ratio(self) -> float:
+        return self.fast_path / self.requests if self.requests else 0.0
+
+
+class SingleFlightStats(BaseModel):
+    """Counters for coalesced context fetches."""
+
+    leaders: int = 0  # fetches actually started in this process
+    coalesced: int = 0  # callers that joined an in-flight fetch
+    lock_waits: int = 0  # fetches that waited on another worker's Redis lock
+
+
+class CacheTierStats(BaseModel):
+    """Counters for one tier (in-process L1 or Redis L2) of a cache."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0  # L1 only: dropped to stay under the byte budget
+    expirations: int = 0  # L1 only: found past their TTL on lookup
+    errors: int = 0  # L2 only: failed Redis calls
+    entries: int = 0
+    bytes: int = 0
+
+    @computed_field
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class CacheCodecStats(BaseModel):
+    """Size and time spent encoding entries for, and decoding them from, Redis."""
+
+    encoded: int = 0
+    compressed: int = 0  # encoded entries large enough to be compressed
+    encoded_bytes: int = 0  # before compression
+    stored_bytes: int = 0  # after compression
+    encode_seconds: float = 0.0
+    decoded: int = 0
+    decode_seconds: float = 0.0
+    blob_writes: int = 0  # entries written as an index record plus shared blob
+    blobs_reused: int = 0  # of which the blob was already stored under another key
+
+    @computed_field
+    @property
+    def compression_ratio(self) -> float:
+        return self.encoded_bytes / self.stored_bytes if self.stored_bytes else 1.0
+
+    @computed_field
+    @property
+    def avg_encode_ms(self) -> float:
+        return self.encode_seconds * 1000 / self.encoded if self.encoded else 0.0
+
+    @computed_field
+    @property
+    def avg_decode_ms(self) -> float:
+        return self.decode_seconds * 1000 / self.decoded if self.decoded else 0.0
+
+
+class CacheStats(BaseModel):
+    l1: CacheTierStats
+    l2: CacheTierStats
+    codec: CacheCodecStats
+
+
+class CircuitBreakerStats(BaseModel):
+    """State and counters of a circuit breaker around a remote dependency."""
+
+    state: str = "closed"
+    trips: int = 0  # times the breaker opened
+    rejected: int = 0  # calls answered with degraded output while open
+    probes: int = 0  # half-open trial calls let through
+    calls: int = 0
+    failures: int = 0
+    slow_calls: int = 0
+    window_calls: int = 0  # calls in the current rolling window
+    window_bad_calls: int = 0  # of which failed or slow
@@ -0,0 +1,132 @@
+import math
+import os
+import re
+from bisect import bisect_right
+from collections import Counter
+
+from src.stopwords import STOPWORDS
+
+# most characters of a large snippet that go into the prompt
+PASSAGE_SELECTION_MAX_CHARS = int(os.getenv("PASSAGE_SELECTION_MAX_CHARS", 3000))
+# how many of the best matching passages are kept
+PASSAGE_SELECTION_TOP_K = int(os.getenv("PASSAGE_SELECTION_TOP_K", 3))
+# passages are whole paragraphs, merged until they reach this many characters
+PASSAGE_CHARS = 1000
+
+TRUNCATION_MARKER = "\n... (truncated)"
+PASSAGE_SEPARATOR = "\n[...]\n"
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+TERM = re.compile(r"\w+")
+# BM25 parameters, the usual defaults
+K1 = 1.2
+B = 0.75
+
+
+def query_terms(query: str) -> list[str]:
+    """Distinct lowercase words of query that say something about its topic."""
+    words = [word.lower() for word in TERM.findall(query)]
+    return list(
+        dict.fromkeys(word for word in words if len(word) > 1 and word not in STOPWORDS)
+    )
+
+
+def split_passages(
+    text: str, passage_chars: int = PASSAGE_CHARS
+) -> list[tuple[int, int]]:
+    """
+    Character ranges of text's passages, cut at paragraph breaks; text without
+    paragraph breaks (one long page) is cut every passage_chars instead.
+    """
+    breaks = [match.end() for match in PARAGRAPH_BREAK.finditer(text)] + [len(text)]
+    passages = []
+    start = 0
+    for end in breaks:
+        if end - start < passage_chars and end < len(text):
+            continue
+        while end - start > 2 * passage_chars:
+            passages.append((start, start + passage_chars))
+            start += passage_chars
+        if start < end:
+            passages.append((start, end))
+        start = end
+    return passages
+
+
+def score_passages(
+    text: str, passages: list[tuple[int, int]], terms: list[str]
+) -> list[float]:
+    """
+    BM25 score of each passage for terms. One regex pass over the whole text
+    finds every term occurrence; passage lengths (in characters) stand in for
+    token counts.
+    """
+    # each term is a named group, so a match says which term it was; up to two
+    # trailing word characters let "whale" match "whales"
+    alternatives = "|".join(f"(?P<t{i}>{re.escape(t)})" for i, t in enumerate(terms))
+    pattern = re.compile(rf"\b(?:{alternatives})\w{{0,2}}\b", re.IGNORECASE)
+    starts = [start for start, _ in passages]
+    term_frequencies: Counter = Counter()  # (passage, term group) -> count
+    for match in pattern.finditer(text):
+        term_frequencies[bisect_right(starts, match.start()) - 1, match.lastgroup] += 1
+
+    document_frequencies = Counter(group for _, group in term_frequencies)
+    lengths = [end - start for start, end in passages]
+    average_length = sum(lengths) / len(passages)
+    scores = [0.0] * len(passages)
+    for (passage, group), frequency in term_frequencies.items():
+        df = document_frequencies[group]
+        idf = math.log(1 + (len(passages) - df + 0.5) / (df + 0.5))
+        norm = K1 * (1 - B + B * lengths[passage] / average_length)
+        scores[passage] += idf * frequency * (K1 + 1) / (frequency + norm)
+    return scores
+
+
+def truncate(text: str, max_chars: int = PASSAGE_SELECTION_MAX_CHARS) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + TRUNCATION_MARKER
+
+
+def select_passages(
+    text: str,
+    query: str,
+    max_chars: int = PASSAGE_SELECTION_MAX_CHARS,
+    top_k: int = PASSAGE_SELECTION_TOP_K,
+) -> str:
+    """
+    Cut text down to the top_k passages most relevant to query, in document
+    order and within max_chars. Text that already fits is returned as is; text
+    with nothing matching the query is truncated instead. max_chars 0 disables
+    selection.
+    """
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    terms = query_terms(query)
+    if not terms:
+        return truncate(text, max_chars)
+
+    passages = split_passages(text)
+    scores = score_passages(text, passages, terms)
+    best = sorted(
+        (i for i, score in enumerate(scores) if score > 0),
+        key=lambda i: scores[i],
+        reverse=True,
+    )[:top_k]
+    if not best:
+        return truncate(text, max_chars)
+
+    # the best passages get the budget first, then are put back in order
+    budget = max_chars
+    kept: list[tuple[int, int]] = []
+    for i in best:
+        start, end = passages[i]
+        cost = end - start + (len(PASSAGE_SEPARATOR) if kept else 0)
+        if cost <= budget:
+            kept.append((start, end))
+            budget -= cost
+        elif not kept:
+            kept.append((start, start + budget))  # the best passage alone is too long
+            budget = 0
+    return PASSAGE_SEPARATOR.join(
+        text[start:end].strip("\n") for start, end in sorted(kept)
+    )
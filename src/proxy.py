@@ -0,0 +1,340 @@
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, MutableMapping
+
+import httpx
+import loguru
+
+from src.hydrator import ChatHydrator
+from src.upstream import UpstreamClientSettings, create_upstream_client
+
+logger = loguru.logger
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+# per-request hydration time budget in seconds, consumed by the proxy
+HYDRATION_DEADLINE_HEADER = "x-hydration-deadline"
+
+# request headers we never forward as-is (httpx recomputes them)
+DROPPED_REQUEST_HEADERS = {"host", "content-length", HYDRATION_DEADLINE_HEADER}
+# streamed bodies keep their length, so the original header stays valid
+DROPPED_STREAMED_REQUEST_HEADERS = {"host", HYDRATION_DEADLINE_HEADER}
+
+# response headers describing an encoding httpx has already undone
+DROPPED_RESPONSE_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+# largest request body we accept; 0 disables the limit
+PROXY_MAX_BODY_BYTES = int(os.getenv("PROXY_MAX_BODY_BYTES", 100 * 1024 * 1024))
+# stream non-chat request bodies to the upstream instead of buffering them
+PROXY_STREAM_REQUEST_BODIES = os.getenv(
+    "PROXY_STREAM_REQUEST_BODIES", "true"
+).strip().lower() in ("1", "true", "yes", "on")
+
+
+class ClientDisconnect(Exception):
+    """Raised when the downstream client goes away while we read its request."""
+
+
+class BodyTooLarge(Exception):
+    """Raised when a request body exceeds the configured maximum size."""
+
+
+class ProxyApp:
+    """
+    Pure ASGI application that forwards every request it receives to the LLM
+    upstream, hydrating chat completion bodies on the way through.
+    """
+
+    def __init__(
+        self,
+        base_url: str | None,
+        hydrator: ChatHydrator,
+        settings: UpstreamClientSettings | None = None,
+        max_body_size: int = PROXY_MAX_BODY_BYTES,
+        stream_request_bodies: bool = PROXY_STREAM_REQUEST_BODIES,
+    ):
+        self.base_url = base_url
+        self.hydrator = hydrator
+        self.settings = settings or UpstreamClientSettings.from_env()
+        self.max_body_size = max_body_size
+        self.stream_request_bodies = stream_request_bodies
+        self.client: httpx.AsyncClient | None = None
+
+    async def startup(self):
+        # one pooled client for the lifetime of the app so keep-alive connections
+        # (and their TLS sessions) to the upstream are reused across requests
+        if self.client is None:
+            self.client = create_upstream_client(self.settings)
+
+    async def shutdown(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return
+
+        response_started = False
+
+        async def tracked_send(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self._proxy(scope, receive, tracked_send)
+        except ClientDisconnect:
+            logger.info("Client disconnected before the request body was read")
+        except BodyTooLarge as e:
+            logger.warning(f"Rejecting request: {e}")
+            if not response_started:
+                await send_json(
+                    send,
+                    413,
+                    {"error": {"message": str(e), "type": "proxy_error"}},
+                )
+        except httpx.RequestError as e:
+            error_message = str(e)
+            logger.error(f"Error forwarding request: {error_message}")
+            if not response_started:
+                await send_json(
+                    send,
+                    502,
+                    {
+                        "error": {
+                            "message": f"Error connecting to OpenAI: {error_message}",
+                            "type": "proxy_error",
+                        }
+                    },
+                )
+        except Exception as e:
+            logger.exception(f"Unexpected error in proxy: {str(e)}")
+            if not response_started:
+                await send_json(
+                    send,
+                    500,
+                    {
+                        "error": {
+                            "message": f"Proxy error: {str(e)}",
+                            "type": "proxy_error",
+                        }
+                    },
+                )
+
+    async def _proxy(self, scope: Scope, receive: Receive, send: Send):
+        # created on first use when the app is served without its lifespan
+        await self.startup()
+
+        method: str = scope["method"]
+        path: str = scope["path"]
+        query: bytes = scope["query_string"]
+
+        logger.info(f"Proxying {method} {path} to: {self.base_url}{path}")
+
+        # Special handling for chat completions
+        should_modify_request = path.endswith("/chat/completions")
+
+        # only chat completion bodies are parsed; everything else (audio, files,
+        # embedding batches) is streamed to the upstream chunk by chunk so proxy
+        # memory per request stays constant regardless of payload size
+        stream_body = (
+            method != "GET" and not should_modify_request and self.stream_request_bodies
+        )
+        dropped_headers = (
+            DROPPED_STREAMED_REQUEST_HEADERS if stream_body else DROPPED_REQUEST_HEADERS
+        )
+        headers = [
+            (name.decode("latin-1"), value.decode("latin-1"))
+            for name, value in scope["headers"]
+            if name.decode("latin-1").lower() not in dropped_headers
+        ]
+
+        declared_length = get_content_length(scope)
+        if self.max_body_size and (declared_length or 0) > self.max_body_size:
+            raise BodyTooLarge(
+                f"Request body of {declared_length} bytes exceeds the "
+                f"{self.max_body_size} byte limit"
+            )
+
+        kwargs: dict[str, Any] = {}
+        if stream_body:
+            kwargs["content"] = stream_request_body(receive, self.max_body_size)
+        elif method != "GET":
+            body = await read_body(receive, self.max_body_size)
+            kwargs["content"] = body
+            if should_modify_request:
+                try:
+                    kwargs["content"] = await self.hydrator.get_hydrated_body(
+                        body, deadline_seconds=get_hydration_deadline(scope)
+                    )
+                except Exception:
+                    # forward the original bytes untouched
+                    logger.exception("Error hydrating body")
+
+        target_url = f"{self.base_url}{path}"
+        if query:
+            target_url += f"?{query.decode('latin-1')}"
+
+        # Send with stream=True so the upstream body is relayed as it arrives
+        # instead of being read in full before we start responding
+        upstream_request = self.client.build_request(
+            method, target_url, headers=headers, **kwargs
+        )
+        response = await self.client.send(upstream_request, stream=True)
+        try:
+            logger.info(f"Received response with status {response.status_code}")
+
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": response.status_code,
+                    "headers": [
+                        (name.encode("latin-1"), value.encode("latin-1"))
+                        for name, value in response.headers.multi_items()
+                        if name.lower() not in DROPPED_RESPONSE_HEADERS
+                    ],
+                }
+            )
+
+            chunks = response.aiter_bytes()
+            if response.headers.get("content-type", "").startswith("text/event-stream"):
+                chunks = iter_sse_events(chunks)
+
+            await relay_until_disconnect(
+                augment_response(chunks, should_modify_request), receive, send
+            )
+        finally:
+            # runs on normal completion, upstream errors and client disconnects
+            await response.aclose()
+
+
+def get_content_length(scope: Scope) -> int | None:
+    for name, value in scope["headers"]:
+        if name.lower() == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+def get_hydration_deadline(scope: Scope) -> float | None:
+    """Seconds from the X-Hydration-Deadline header, None if absent or invalid."""
+    for name, value in scope["headers"]:
+        if name.lower() == HYDRATION_DEADLINE_HEADER.encode("latin-1"):
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                logger.warning(
+                    f"Ignoring invalid {HYDRATION_DEADLINE_HEADER}: {value!r}"
+                )
+                return None
+    return None
+
+
+async def stream_request_body(
+    receive: Receive, max_size: int = 0
+) -> AsyncIterator[bytes]:
+    """Yield request body chunks as they arrive, enforcing max_size (0 = no limit)."""
+    received = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ClientDisconnect()
+        chunk = message.get("body", b"")
+        received += len(chunk)
+        if max_size and received > max_size:
+            raise BodyTooLarge(f"Request body exceeds the {max_size} byte limit")
+        if chunk:
+            yield chunk
+        more_body = message.get("more_body", False)
+
+
+async def read_body(receive: Receive, max_size: int = 0) -> bytes:
+    return b"".join([chunk async for chunk in stream_request_body(receive, max_size)])
+
+
+async def relay_until_disconnect(
+    body_stream: AsyncIterator[bytes], receive: Receive, send: Send
+):
+    """Send body chunks downstream, stopping as soon as the client disconnects."""
+
+    async def relay():
+        async for chunk in body_stream:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def wait_for_disconnect():
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    relay_task = asyncio.create_task(relay())
+    disconnect_task = asyncio.create_task(wait_for_disconnect())
+    try:
+        done, _ = await asyncio.wait(
+            {relay_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED
+        )
+        if relay_task not in done:
+            logger.info("Client disconnected, stopping upstream relay")
+    finally:
+        for task in (relay_task, disconnect_task):
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(relay_task, disconnect_task, return_exceptions=True)
+    if relay_task.done() and not relay_task.cancelled():
+        # surface upstream read errors to the caller
+        relay_task.result()
+
+
+async def send_json(send: Send, status_code: int, content: Any):
+    body = json.dumps(content).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def iter_sse_events(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Re-frame a byte stream so each yielded chunk is one complete SSE event."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        while True:
+            # events are terminated by a blank line; accept LF and CRLF framing
+            lf_end = buffer.find(b"\n\n")
+            crlf_end = buffer.find(b"\r\n\r\n")
+            if lf_end == -1 and crlf_end == -1:
+                break
+            if crlf_end != -1 and (lf_end == -1 or crlf_end < lf_end):
+                end = crlf_end + 4
+            else:
+                end = lf_end + 2
+            yield buffer[:end]
+            buffer = buffer[end:]
+    if buffer:
+        yield buffer
+
+
+async def augment_response(response_stream, should_modify=False):
+    async for chunk in response_stream:
+        # Only modify if it's a chat completion response and modification is enabled
+        if should_modify:
+            # You can add your response modification logic here if needed
+            pass
+        yield chunk
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from loguru import logger
+
+from src.cache import CacheWrapper
+from src.models.stats import SingleFlightStats
+
+T = TypeVar("T")
+
+# coordinate misses across workers through a short Redis lock
+CONTEXT_FETCH_LOCK_ENABLED = os.getenv(
+    "CONTEXT_FETCH_LOCK_ENABLED", "false"
+).strip().lower() in ("1", "true", "yes", "on")
+# how long a worker may hold the fetch lock before it expires on its own
+CONTEXT_FETCH_LOCK_TTL_SECONDS = float(os.getenv("CONTEXT_FETCH_LOCK_TTL_SECONDS", 30))
+# how long other workers wait for the lock holder's result before fetching anyway
+CONTEXT_FETCH_LOCK_WAIT_SECONDS = float(
+    os.getenv("CONTEXT_FETCH_LOCK_WAIT_SECONDS", 30)
+)
+CONTEXT_FETCH_LOCK_POLL_SECONDS = 0.1
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces concurrent calls for the same key into one in-flight call.
+
+    In-process, every caller for a key awaits the same task. When a lock cache
+    is given, the first worker to miss also takes a short Redis lock; other
+    workers poll the cache for its result instead of fetching themselves.
+    """
+
+    def __init__(
+        self,
+        lock_cache: CacheWrapper | None = None,
+        lock_ttl_seconds: float = CONTEXT_FETCH_LOCK_TTL_SECONDS,
+        lock_wait_seconds: float = CONTEXT_FETCH_LOCK_WAIT_SECONDS,
+        poll_interval_seconds: float = CONTEXT_FETCH_LOCK_POLL_SECONDS,
+    ):
+        self.lock_cache = lock_cache
+        self.lock_ttl_seconds = lock_ttl_seconds
+        self.lock_wait_seconds = lock_wait_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.stats = SingleFlightStats()
+        self._in_flight: dict[str, asyncio.Task] = {}
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        recheck: Callable[[], Awaitable[T | None]] | None = None,
+        publish: Callable[[T], Awaitable[None]] | None = None,
+    ) -> T:
+        """
+        Run fn for key unless a call for key is already in flight, in which case
+        wait for and share its result. recheck looks the result up in the shared
+        cache while another worker holds the lock; publish writes our result
+        there before we release the lock, so waiters can find it.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.stats.leaders += 1
+            task = asyncio.create_task(self._run(key, fn, recheck, publish))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.stats.coalesced += 1
+            logger.info(f"Joining in-flight fetch for '{key}'")
+        # shield so one caller going away does not cancel the shared fetch
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # mark the exception retrieved even if every caller went away
+            task.exception()
+
+    async def _run(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        recheck: Callable[[], Awaitable[T | None]] | None,
+        publish: Callable[[T], Awaitable[None]] | None,
+    ) -> T:
+        if self.lock_cache is None:
+            return await fn()
+
+        ttl_ms = int(self.lock_ttl_seconds * 1000)
+        token = await self.lock_cache.acquire_lock(key, ttl_ms)
+        if token is None:
+            self.stats.lock_waits += 1
+            result = await self._wait_for_holder(key, recheck)
+            if result is not None:
+                return result
+            # holder failed or is too slow, fetch ourselves
+            token = await self.lock_cache.acquire_lock(key, ttl_ms)
+
+        try:
+            result = await fn()
+            if publish is not None:
+                await publish(result)
+            return result
+        finally:
+            if token is not None:
+                await self.lock_cache.release_lock(key, token)
+
+    async def _wait_for_holder(
+        self, key: str, recheck: Callable[[], Awaitable[T | None]] | None
+    ) -> T | None:
+        logger.info(f"Another worker is fetching '{key}', waiting for its result")
+        deadline = time.monotonic() + self.lock_wait_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval_seconds)
+            if recheck is not None:
+                result = await recheck()
+                if result is not None:
+                    return result
+            if not await self.lock_cache.is_locked(key):
+                return await recheck() if recheck is not None else None
+        return None
@@ -0,0 +1,7 @@
+# common English words that say little about what a passage is about; left out
+# of book searches and passage ranking unless a query has nothing else
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have he her his i in is it its"
+    " me my not of on or she so that the their them they this to was we were what"
+    " when where which who why will with you your".split()
+)
@@ -0,0 +1,86 @@
+import importlib.util
+import os
+
+import httpx
+from loguru import logger
+from pydantic import BaseModel
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class UpstreamClientSettings(BaseModel):
+    """Pool and timeout settings for the shared client used to reach LLM_BASE_URL."""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    connect_timeout: float = 10.0
+    read_timeout: float = 120.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> "UpstreamClientSettings":
+        defaults = cls()
+        return cls(
+            max_connections=int(
+                os.getenv("UPSTREAM_MAX_CONNECTIONS", defaults.max_connections)
+            ),
+            max_keepalive_connections=int(
+                os.getenv(
+                    "UPSTREAM_MAX_KEEPALIVE_CONNECTIONS",
+                    defaults.max_keepalive_connections,
+                )
+            ),
+            keepalive_expiry=float(
+                os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", defaults.keepalive_expiry)
+            ),
+            http2=_env_bool("UPSTREAM_HTTP2", defaults.http2),
+            connect_timeout=float(
+                os.getenv("UPSTREAM_CONNECT_TIMEOUT", defaults.connect_timeout)
+            ),
+            read_timeout=float(
+                os.getenv("UPSTREAM_READ_TIMEOUT", defaults.read_timeout)
+            ),
+            write_timeout=float(
+                os.getenv("UPSTREAM_WRITE_TIMEOUT", defaults.write_timeout)
+            ),
+            pool_timeout=float(
+                os.getenv("UPSTREAM_POOL_TIMEOUT", defaults.pool_timeout)
+            ),
+        )
+
+
+def create_upstream_client(settings: UpstreamClientSettings) -> httpx.AsyncClient:
+    """Build the long-lived, pooled client shared by every proxied request."""
+    http2 = settings.http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning(
+            "UPSTREAM_HTTP2 is enabled but the 'h2' package is not installed. "
+            "Falling back to HTTP/1.1."
+        )
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.max_connections,
+        max_keepalive_connections=settings.max_keepalive_connections,
+        keepalive_expiry=settings.keepalive_expiry,
+    )
+    timeout = httpx.Timeout(
+        connect=settings.connect_timeout,
+        read=settings.read_timeout,
+        write=settings.write_timeout,
+        pool=settings.pool_timeout,
+    )
+    logger.info(
+        f"Creating upstream client (http2={http2}, "
+        f"max_connections={settings.max_connections}, "
+        f"max_keepalive={settings.max_keepalive_connections})"
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
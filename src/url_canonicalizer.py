@@ -0,0 +1,88 @@
+import fnmatch
+import os
+from typing import Sequence
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from and never change
+# the page. Comma separated; * matches any suffix, e.g. "utm_*".
+DEFAULT_TRACKING_PARAMS = (
+    "utm_*,fbclid,gclid,dclid,gbraid,wbraid,msclkid,yclid,mc_cid,mc_eid,"
+    "igshid,_ga,_gl,ref_src,ref_url,spm,si"
+)
+URL_TRACKING_PARAMS = [
+    param.strip().lower()
+    for param in os.getenv("URL_TRACKING_PARAMS", DEFAULT_TRACKING_PARAMS).split(",")
+    if param.strip()
+]
+
+# characters that end a sentence around a URL rather than belong to it
+TRAILING_PUNCTUATION = ".,;:!?'\"*"
+CLOSING_BRACKETS = {")": "(", "]": "[", "}": "{", ">": "<"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def trim_trailing_punctuation(url: str) -> str:
+    """
+    Strip punctuation a URL picked up from the surrounding prose, e.g.
+    "(see https://x.com/a)." -> "https://x.com/a". Closing brackets are kept
+    when the URL itself opened them, as in Wikipedia's "Python_(language)".
+    """
+    while url:
+        last = url[-1]
+        if last in TRAILING_PUNCTUATION:
+            url = url[:-1]
+        elif last in CLOSING_BRACKETS and url.count(last) > url.count(
+            CLOSING_BRACKETS[last]
+        ):
+            url = url[:-1]
+        else:
+            break
+    return url
+
+
+def is_tracking_param(name: str, tracking_params: Sequence[str]) -> bool:
+    name = name.lower()
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in tracking_params)
+
+
+def canonicalize_url(
+    url: str, tracking_params: Sequence[str] = URL_TRACKING_PARAMS
+) -> str:
+    """
+    Reduce the spellings of one page to a single cache key: trailing
+    punctuation trimmed, scheme and host lowercased, default port, fragment
+    and tracking parameters dropped, remaining parameters sorted by name and
+    trailing slashes removed.
+    """
+    url = trim_trailing_punctuation(url)
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url  # not something we can take apart safely
+
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").rstrip(".")
+    if ":" in netloc:
+        netloc = f"[{netloc}]"  # IPv6 literal
+    if parts.username is not None or parts.password is not None:
+        # userinfo is case-sensitive, keep it as written
+        netloc = f"{parts.netloc.rpartition('@')[0]}@{netloc}"
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+
+    # "/a/" and "/a" (and "" and "/") name the same page
+    path = parts.path.rstrip("/")
+
+    # parameters are filtered and sorted as written, never re-encoded
+    params = [
+        param
+        for param in parts.query.split("&")
+        if param
+        and not is_tracking_param(
+            unquote_plus(param.partition("=")[0]), tracking_params
+        )
+    ]
+    query = "&".join(sorted(params, key=lambda param: param.partition("=")[0]))
+
+    return urlunsplit((scheme, netloc, path, query, ""))
@@ -1,15 +1,26 @@
+import asyncio
+import math
 import os
-from unittest.mock import MagicMock, mock_open, patch
+from unittest.mock import MagicMock, patch
 
 import pytest
 
-from src.clients.bang_command_handler_client import BangCommandHandlerClient
+from src.book_search import BookSearchIndex
+from src.clients.bang_command_handler_client import (
+    BANG_BOOKS_LIST_TTL_SECONDS,
+    BANG_SEARCH_TTL_SECONDS,
+    BangCommandHandlerClient,
+    CommandFailed,
+    _select_book_passages,
+)
 from src.models.context import CommandContextSnippet
 
 # Test data
 TEST_BOOKS_DIR = "./test_books_temp/"
 BOOK1_CONTENT = "This is The Great Gatsby."
 BOOK2_CONTENT = "This is Moby Dick."
+# where book detail commands read a whole book
+READ_RANGE = "src.clients.bang_command_handler_client.read_range"
 
 
 @pytest.fixture
@@ -177,16 +188,12 @@ class TestBangCommandHandlerClientGetBookDetail:
         client.available_book_files = ["The Great Gatsby.txt", "Moby Dick.txt"]
 
         mock_file_content = "This is the full content of The Great Gatsby."
-        with patch(
-            "builtins.open", mock_open(read_data=mock_file_content)
-        ) as mocked_open_file:
+        with patch(READ_RANGE, return_value=mock_file_content) as mocked_read:
             # Test exact match (case-insensitive for query part, original filename for retrieval)
             snippet = await client._handle_get_book_detail_command(["the great gatsby"])
 
-            mocked_open_file.assert_called_once_with(
-                os.path.join(TEST_BOOKS_DIR, "The Great Gatsby.txt"),
-                "r",
-                encoding="utf-8",
+            mocked_read.assert_called_once_with(
+                os.path.join(TEST_BOOKS_DIR, "The Great Gatsby.txt"), 0
             )
             assert isinstance(snippet, CommandContextSnippet)
             assert snippet.content["command_query"] == "!book the great gatsby"
@@ -201,13 +208,11 @@ class TestBangCommandHandlerClientGetBookDetail:
         client.available_book_files = ["Moby Dick.txt"]
 
         mock_file_content = "Call me Ishmael."
-        with patch(
-            "builtins.open", mock_open(read_data=mock_file_content)
-        ) as mocked_open_file:
+        with patch(READ_RANGE, return_value=mock_file_content) as mocked_read:
             snippet = await client._handle_get_book_detail_command(["moby dick.txt"])
 
-            mocked_open_file.assert_called_once_with(
-                os.path.join(TEST_BOOKS_DIR, "Moby Dick.txt"), "r", encoding="utf-8"
+            mocked_read.assert_called_once_with(
+                os.path.join(TEST_BOOKS_DIR, "Moby Dick.txt"), 0
             )
             assert (
                 f"Content for Moby Dick.txt:\n\n{mock_file_content}"
@@ -219,13 +224,11 @@ class TestBangCommandHandlerClientGetBookDetail:
         client.available_book_files = ["Another Book.txt"]
 
         mock_file_content = "Details about another book."
-        with patch(
-            "builtins.open", mock_open(read_data=mock_file_content)
-        ) as mocked_open_file:
+        with patch(READ_RANGE, return_value=mock_file_content) as mocked_read:
             snippet = await client._handle_get_book_detail_command(["another book"])
 
-            mocked_open_file.assert_called_once_with(
-                os.path.join(TEST_BOOKS_DIR, "Another Book.txt"), "r", encoding="utf-8"
+            mocked_read.assert_called_once_with(
+                os.path.join(TEST_BOOKS_DIR, "Another Book.txt"), 0
             )
             assert (
                 f"Content for Another Book.txt:\n\n{mock_file_content}"
@@ -237,17 +240,13 @@ class TestBangCommandHandlerClientGetBookDetail:
         client.available_book_files = ["UPPERCASE BOOK.txt"]
 
         mock_file_content = "Content of uppercase book."
-        with patch(
-            "builtins.open", mock_open(read_data=mock_file_content)
-        ) as mocked_open_file:
+        with patch(READ_RANGE, return_value=mock_file_content) as mocked_read:
             snippet = await client._handle_get_book_detail_command(
                 ["uppercase book"]
             )  # Query is lowercase
 
-            mocked_open_file.assert_called_once_with(
-                os.path.join(TEST_BOOKS_DIR, "UPPERCASE BOOK.txt"),
-                "r",
-                encoding="utf-8",
+            mocked_read.assert_called_once_with(
+                os.path.join(TEST_BOOKS_DIR, "UPPERCASE BOOK.txt"), 0
             )
             assert (
                 f"Content for UPPERCASE BOOK.txt:\n\n{mock_file_content}"
@@ -271,14 +270,15 @@ class TestBangCommandHandlerClientGetBookDetail:
         client, _, _, _ = client_with_mocks
         client.available_book_files = ["error_book.txt"]
 
-        with patch("builtins.open", mock_open()) as mocked_open_file:
-            mocked_open_file.side_effect = IOError("Cannot read file")
-            snippet = await client._handle_get_book_detail_command(
-                ["error_book"]
-            )  # Exact match for filename part
+        with patch(READ_RANGE, side_effect=IOError("Cannot read file")) as mocked_read:
+            with pytest.raises(CommandFailed) as failed:
+                await client._handle_get_book_detail_command(
+                    ["error_book"]
+                )  # Exact match for filename part
+            snippet = failed.value.snippet
 
-            mocked_open_file.assert_called_once_with(
-                os.path.join(TEST_BOOKS_DIR, "error_book.txt"), "r", encoding="utf-8"
+            mocked_read.assert_called_once_with(
+                os.path.join(TEST_BOOKS_DIR, "error_book.txt"), 0
             )
             assert (
                 "Error reading content for book 'error_book.txt'"
@@ -293,12 +293,15 @@ class TestBangCommandHandlerClientGetBookDetail:
         client, _, _, _ = client_with_mocks
         client.available_book_files = ["ghost_book.txt"]
 
-        with patch("builtins.open", mock_open()) as mocked_open_file:
-            mocked_open_file.side_effect = FileNotFoundError("File vanished")
-            snippet = await client._handle_get_book_detail_command(["ghost_book"])
-
-            mocked_open_file.assert_called_once_with(
-                os.path.join(TEST_BOOKS_DIR, "ghost_book.txt"), "r", encoding="utf-8"
+        with patch(
+            READ_RANGE, side_effect=FileNotFoundError("File vanished")
+        ) as mocked_read:
+            with pytest.raises(CommandFailed) as failed:
+                await client._handle_get_book_detail_command(["ghost_book"])
+            snippet = failed.value.snippet
+
+            mocked_read.assert_called_once_with(
+                os.path.join(TEST_BOOKS_DIR, "ghost_book.txt"), 0
             )
             assert (
                 "Error: Book file 'ghost_book.txt' was matched but could not be found on disk."
@@ -306,6 +309,22 @@ class TestBangCommandHandlerClientGetBookDetail:
             )
             assert snippet.content["source"] == "LocalBookFile"
 
+    async def test_get_book_detail_reads_on_a_worker_thread(
+        self, client_with_mocks, mocker
+    ):
+        client, _, _, _ = client_with_mocks
+        client.available_book_files = ["Moby Dick.txt"]
+        to_thread = mocker.spy(asyncio, "to_thread")
+
+        with patch(READ_RANGE, return_value="Call me Ishmael."):
+            await client._handle_get_book_detail_command(["moby dick", "whale"])
+
+        to_thread.assert_called_once_with(
+            _select_book_passages,
+            os.path.join(TEST_BOOKS_DIR, "Moby Dick.txt"),
+            "whale",
+        )
+
     async def test_get_book_detail_match_content_truncation(self, client_with_mocks):
         client, _, _, _ = client_with_mocks
         client.available_book_files = ["long_story.txt"]
@@ -313,15 +332,249 @@ class TestBangCommandHandlerClientGetBookDetail:
         long_content = "a" * 4000
         expected_truncated_content = ("a" * 3000) + "\n... (truncated)"
 
-        with patch(
-            "builtins.open", mock_open(read_data=long_content)
-        ) as mocked_open_file:
+        with patch(READ_RANGE, return_value=long_content) as mocked_read:
             snippet = await client._handle_get_book_detail_command(["long_story"])
 
-            mocked_open_file.assert_called_once_with(
-                os.path.join(TEST_BOOKS_DIR, "long_story.txt"), "r", encoding="utf-8"
+            mocked_read.assert_called_once_with(
+                os.path.join(TEST_BOOKS_DIR, "long_story.txt"), 0
             )
             assert (
                 f"Content for long_story.txt:\n\n{expected_truncated_content}"
                 == snippet.content["result_text"]
             )
+
+
+@pytest.fixture
+def books_dir(tmp_path, monkeypatch):
+    """A real books directory, for tests that need files with mtimes."""
+    (tmp_path / "gatsby.txt").write_text(BOOK1_CONTENT)
+    monkeypatch.setenv("BOOKS_DIR_PATH", str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.asyncio
+class TestBangCommandHandlerClientCaching:
+    async def test_cache_key_changes_when_the_book_does(self, books_dir):
+        client = BangCommandHandlerClient()
+
+        key = await client.cache_key("book Gatsby")
+        assert key.startswith("!book Gatsby|gatsby.txt:")
+        assert await client.cache_key("b gatsby.txt") != key
+        assert await client.cache_key("book Gatsby") == key
+
+        (books_dir / "gatsby.txt").write_text(BOOK1_CONTENT + " Revised.")
+        os.utime(books_dir / "gatsby.txt", ns=(1, 1))
+        assert await client.cache_key("book Gatsby") != key
+
+    async def test_book_directory_is_checked_on_a_worker_thread(
+        self, books_dir, mocker
+    ):
+        client = BangCommandHandlerClient()
+        client.book_catalog.poll_seconds = 60
+        to_thread = mocker.spy(asyncio, "to_thread")
+
+        await client._refresh_book_directory()
+        await client._refresh_book_directory()  # within the poll interval
+
+        to_thread.assert_called_once_with(client.book_catalog.refresh)
+
+    async def test_cache_key_is_default_when_no_book_matches(self, books_dir):
+        client = BangCommandHandlerClient()
+
+        assert await client.cache_key("books") is None
+        assert await client.cache_key("book unknown") is None
+        assert await client.cache_key("testcmd gatsby") is None
+
+    async def test_fetch_reports_command_ttls(self, books_dir):
+        client = BangCommandHandlerClient()
+
+        assert (await client.fetch("book gatsby")).ttl_seconds == math.inf
+        assert (await client.fetch("books gatsby")).ttl_seconds == math.inf
+        assert (await client.fetch("books")).ttl_seconds == BANG_BOOKS_LIST_TTL_SECONDS
+        assert (await client.fetch("testcmd")).ttl_seconds is None
+
+    async def test_fetch_does_not_pin_a_failed_book_read(self, books_dir):
+        client = BangCommandHandlerClient()
+
+        with patch("builtins.open", side_effect=IOError("Cannot read file")):
+            result = await client.fetch("book gatsby")
+
+        # negatively cached, not kept for as long as the file is unchanged
+        assert result.failed
+        assert result.ttl_seconds is None
+        assert "Cannot read file" in result.snippets[0].content["result_text"]
+
+
+@pytest.mark.asyncio
+class TestBangCommandHandlerClientSections:
+    async def test_book_sections_are_read_by_chapter(self, books_dir):
+        (books_dir / "gatsby.txt").write_text(
+            "Chapter 1\n\nIn my younger years.\n"
+            + "." * 300
+            + "\nChapter 2\n\nAbout half-way.\n"
+        )
+        client = BangCommandHandlerClient()
+
+        snippet = await client._handle_get_book_detail_command(["gatsby", "ch", "2"])
+
+        assert snippet.content["result_text"] == (
+            "Content for gatsby.txt (chapter 2, Chapter 2):\n\nChapter 2\n\nAbout half-way.\n"
+        )
+        # the section selector is not part of the title
+        assert (await client.cache_key("book gatsby ch 2")).startswith(
+            "!book gatsby ch 2|gatsby.txt:"
+        )
+
+    async def test_missing_sections_point_at_the_toc(self, books_dir):
+        client = BangCommandHandlerClient()
+
+        snippet = await client._handle_get_book_detail_command(["gatsby", "ch", "9"])
+
+        assert "Chapter 9 not found" in snippet.content["result_text"]
+        assert "!book gatsby toc" in snippet.content["result_text"]
+
+
+@pytest.mark.asyncio
+class TestBangCommandHandlerClientSearch:
+    async def test_search_returns_passages_with_byte_ranges(self, books_dir, tmp_path):
+        client = BangCommandHandlerClient()
+        client.book_search = BookSearchIndex(
+            str(books_dir), str(tmp_path / "index" / "books.sqlite3")
+        )
+        client.book_search.sync(client.available_book_files)
+
+        result = await client.fetch("search gatsby")
+
+        text = result.snippets[0].content["result_text"]
+        assert text.startswith("Top passages for 'gatsby'")
+        assert f"1. gatsby.txt bytes 0-{len(BOOK1_CONTENT) - 1}" in text
+        assert result.ttl_seconds == BANG_SEARCH_TTL_SECONDS
+        client.book_search.close()
+
+    async def test_search_answers_while_books_are_indexed(
+        self, books_dir, tmp_path, mocker
+    ):
+        client = BangCommandHandlerClient()
+        client.book_search = BookSearchIndex(
+            str(books_dir), str(tmp_path / "index" / "books.sqlite3")
+        )
+        # indexing has started but not finished
+        mocker.patch.object(client.book_search, "sync_in_background")
+        mocker.patch.object(
+            BookSearchIndex, "indexing", new_callable=mocker.PropertyMock
+        ).return_value = True
+
+        result = await client.fetch("search gatsby")
+
+        text = result.snippets[0].content["result_text"]
+        assert "still being indexed" in text
+        assert result.ttl_seconds == 0
+        client.book_search.sync_in_background.assert_called_once()
+        client.book_search.close()
+
+    async def test_search_without_terms_shows_usage(self, books_dir):
+        client = BangCommandHandlerClient()
+
+        snippet = await client._handle_search_command([])
+
+        assert snippet.content["result_text"].startswith("Usage: !search")
+
+
+@pytest.mark.asyncio
+class TestBangCommandHandlerClientPassages:
+    @pytest.fixture
+    def long_book(self, books_dir):
+        paragraphs = [f"Paragraph {i}. " + "Days went by. " * 100 for i in range(30)]
+        paragraphs[12] += "Nick Carraway rented a house."
+        (books_dir / "The Great Gatsby.txt").write_text("\n\n".join(paragraphs))
+        return books_dir
+
+    async def test_trailing_words_pick_the_passages(self, long_book):
+        client = BangCommandHandlerClient()
+
+        snippet = await client._handle_get_book_detail_command(
+            ["the", "great", "gatsby", "who", "is", "Nick"]
+        )
+
+        text = snippet.content["result_text"]
+        assert text.startswith(
+            "Content for The Great Gatsby.txt (passages relevant to 'who is Nick'):\n\n"
+            "Paragraph 12."
+        )
+        assert "Nick Carraway" in text
+        assert "Paragraph 0." not in text
+
+    async def test_books_delegates_the_question_too(self, long_book):
+        client = BangCommandHandlerClient()
+
+        snippet = await client._handle_list_books_command(
+            ["The Great Gatsby", "Nick", "Carraway"]
+        )
+
+        assert "Nick Carraway" in snippet.content["result_text"]
+
+    async def test_longest_title_prefix_wins(self, long_book):
+        (long_book / "The Great.txt").write_text("A shorter title.")
+        client = BangCommandHandlerClient()
+
+        assert client._resolve_book_args(["the", "great", "gatsby", "nick"]) == (
+            "The Great Gatsby.txt",
+            ["nick"],
+        )
+        assert client._resolve_book_args(["the", "great", "nick"]) == (
+            "The Great.txt",
+            ["nick"],
+        )
+        assert client._resolve_book_args(["unknown", "title"]) == (
+            None,
+            ["unknown", "title"],
+        )
+
+
+@pytest.mark.asyncio
+class TestBangCommandHandlerClientFuzzyTitles:
+    async def test_close_titles_resolve_to_the_book(self, books_dir):
+        (books_dir / "War and Peace.txt").write_text("Natasha danced.")
+        client = BangCommandHandlerClient()
+
+        snippet = await client._handle_get_book_detail_command(["war", "peace"])
+        typo = await client._handle_get_book_detail_command(["war", "and", "paece"])
+
+        assert (
+            snippet.content["result_text"]
+            == "Content for War and Peace.txt:\n\nNatasha danced."
+        )
+        assert typo.content["source"] == "LocalBookFile:War and Peace.txt"
+        assert client._resolve_book_args(["war", "peace", "who", "is", "Natasha"]) == (
+            "War and Peace.txt",
+            ["who", "is", "Natasha"],
+        )
+
+    async def test_long_questions_only_try_title_length_prefixes(
+        self, books_dir, mocker
+    ):
+        (books_dir / "War and Peace.txt").write_text("Natasha danced.")
+        client = BangCommandHandlerClient()
+        fuzzy_resolve = mocker.spy(client.book_catalog, "fuzzy_resolve")
+        question = "who does Natasha dance with at her first ball and why".split()
+
+        book_file, rest = client._resolve_book_args(["war", "peace", *question])
+
+        assert (book_file, rest) == ("War and Peace.txt", question)
+        # the longest title has three words, so at most four leading words
+        assert fuzzy_resolve.call_count == 4
+
+    async def test_unresolved_titles_get_a_shortlist(self, books_dir):
+        (books_dir / "Emma Part One.txt").write_text("One.")
+        (books_dir / "Emma Part Two.txt").write_text("Two.")
+        client = BangCommandHandlerClient()
+
+        snippet = await client._handle_get_book_detail_command(["emma", "part"])
+
+        text = snippet.content["result_text"]
+        assert text.startswith(
+            "Book matching query 'emma part' not found. Did you mean"
+        )
+        assert "- Emma Part One.txt" in text
+        assert "- Emma Part Two.txt" in text
+        assert "gatsby.txt" not in text
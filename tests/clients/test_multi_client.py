@@ -0,0 +1,171 @@
+import httpx
+import pytest
+
+from src.circuit_breaker import CircuitBreaker
+from src.clients.multi_client import (
+    MultiClient,
+    _parse_cache_control,
+    _parse_retry_after,
+)
+
+
+@pytest.fixture
+def api_transport(mocker):
+    """Route MultiClient's httpx calls through a MockTransport handler."""
+
+    def install(handler):
+        real_client = httpx.AsyncClient
+        mocker.patch(
+            "src.clients.multi_client.httpx.AsyncClient",
+            lambda *args, **kwargs: real_client(transport=httpx.MockTransport(handler)),
+        )
+
+    return install
+
+
+@pytest.mark.asyncio
+async def test_fetch_returns_snippet_on_success(api_transport):
+    api_transport(
+        lambda request: httpx.Response(
+            200,
+            json={
+                "url": "https://example.com",
+                "content": "Hello",
+                "title": "Example",
+            },
+        )
+    )
+
+    result = await MultiClient("http://api").fetch("https://example.com")
+
+    assert not result.failed
+    assert len(result.snippets) == 1
+    # structured, rendered later by the hydrator
+    assert result.snippets[0].content["text_content"] == "Hello"
+
+
+@pytest.mark.asyncio
+async def test_fetch_marks_http_errors_as_failed_with_retry_after(api_transport):
+    api_transport(lambda request: httpx.Response(503, headers={"Retry-After": "12"}))
+
+    result = await MultiClient("http://api").fetch("https://example.com")
+
+    assert result.failed
+    assert result.retry_after_seconds == 12
+    assert "fallback content" in result.snippets[0].content["text_content"]
+
+
+@pytest.mark.asyncio
+async def test_fetch_marks_connection_errors_as_failed(api_transport):
+    def refuse(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    api_transport(refuse)
+
+    result = await MultiClient("http://api").fetch("https://example.com")
+
+    assert result.failed
+    assert result.retry_after_seconds is None
+    # get_context keeps returning the fallback content
+    assert (
+        "fallback content"
+        in (await MultiClient("http://api").get_context("https://example.com"))[0]
+    )
+
+
+def test_parse_retry_after():
+    assert _parse_retry_after("30") == 30
+    assert _parse_retry_after(None) is None
+    assert _parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") is None
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_skips_the_api(api_transport):
+    calls = []
+
+    def unavailable(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    api_transport(unavailable)
+    client = MultiClient(
+        "http://api", breaker=CircuitBreaker("test", min_calls=2, open_seconds=30)
+    )
+
+    for _ in range(3):
+        result = await client.fetch("https://example.com")
+        assert result.failed
+
+    # the third call was answered by the open breaker, not the API
+    assert len(calls) == 2
+    assert client.breaker.stats.trips == 1
+    assert client.breaker.stats.rejected == 1
+    assert result.retry_after_seconds == pytest.approx(30, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_trip_the_breaker(api_transport):
+    api_transport(lambda request: httpx.Response(422))
+    client = MultiClient("http://api", breaker=CircuitBreaker("test", min_calls=2))
+
+    for _ in range(3):
+        assert (await client.fetch("not a url")).failed
+
+    assert client.breaker.stats.trips == 0
+
+
+@pytest.mark.asyncio
+async def test_fetch_reports_cache_control_and_etag(api_transport):
+    api_transport(
+        lambda request: httpx.Response(
+            200,
+            headers={
+                "Cache-Control": "public, max-age=600",
+                "Age": "100",
+                "ETag": '"v1"',
+            },
+            json={"url": "https://example.com", "content": "Hello", "title": None},
+        )
+    )
+
+    result = await MultiClient("http://api").fetch("https://example.com")
+
+    assert result.ttl_seconds == 500
+    assert result.etag == '"v1"'
+
+
+@pytest.mark.asyncio
+async def test_fetch_revalidates_with_if_none_match(api_transport):
+    seen = []
+
+    def not_modified(request):
+        seen.append(request.headers.get("if-none-match"))
+        return httpx.Response(304, headers={"Cache-Control": "max-age=60"})
+
+    api_transport(not_modified)
+
+    result = await MultiClient("http://api").fetch("https://example.com", etag='"v1"')
+
+    assert seen == ['"v1"']
+    assert result.not_modified
+    assert not result.failed
+    assert result.ttl_seconds == 60
+    assert result.etag == '"v1"'
+
+
+def test_parse_cache_control():
+    assert _parse_cache_control(httpx.Headers({})) is None
+    assert _parse_cache_control(httpx.Headers({"Cache-Control": "no-store"})) == 0
+    assert _parse_cache_control(httpx.Headers({"Cache-Control": "no-cache"})) == 0
+    assert (
+        _parse_cache_control(
+            httpx.Headers({"Cache-Control": "max-age=60, s-maxage=300"})
+        )
+        == 300
+    )
+    assert (
+        _parse_cache_control(
+            httpx.Headers({"Cache-Control": "max-age=60", "Age": "90"})
+        )
+        == 0
+    )
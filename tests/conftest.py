@@ -0,0 +1,23 @@
+import pytest
+import pytest_asyncio
+
+from src.hydrator import context_cache, turn_cache
+
+# nothing listens here, so caches built during tests run on their L1 tier only
+# and never touch (or flush) a developer's Redis
+TEST_REDIS_URL = "redis://127.0.0.1:1"
+
+
+@pytest.fixture(autouse=True)
+def isolate_redis(monkeypatch):
+    monkeypatch.setenv("REDIS_URL", TEST_REDIS_URL)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def clear_hydrator_caches(monkeypatch):
+    """Module-level caches would otherwise leak results between tests."""
+    for cache in (context_cache, turn_cache):
+        await cache.close()
+        monkeypatch.setattr(cache, "redis_url", TEST_REDIS_URL)
+        cache._l1.clear()
+    yield
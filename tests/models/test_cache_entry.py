@@ -0,0 +1,27 @@
+from src.models.cache_entry import CacheEntry
+
+
+def test_is_fresh_until_fresh_until():
+    entry = CacheEntry(value=["x"], fresh_until=100.0)
+
+    assert entry.is_fresh(now=99.9)
+    assert not entry.is_fresh(now=100.0)
+
+
+def test_early_refresh_disabled_without_beta_or_compute_time():
+    entry = CacheEntry(value=["x"], fresh_until=100.0, compute_seconds=5.0)
+
+    assert not entry.should_refresh_early(beta=0, now=99.9)
+    assert not CacheEntry(value=["x"], fresh_until=100.0).should_refresh_early(
+        beta=1.0, now=99.9
+    )
+
+
+def test_early_refresh_likelier_close_to_expiry():
+    entry = CacheEntry(value=["x"], fresh_until=100.0, compute_seconds=2.0)
+
+    near = sum(entry.should_refresh_early(beta=1.0, now=99.5) for _ in range(2000))
+    far = sum(entry.should_refresh_early(beta=1.0, now=80.0) for _ in range(2000))
+
+    assert near > 1000  # P = 1 - e^-0.25 ~ 0.78
+    assert far < 10  # P = e^-10, effectively never
@@ -0,0 +1,120 @@
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+
+import pytest
+
+from src.models.context import (
+    CommandContextSnippet,
+    ContextSnippet,
+    ContextType,
+    SnippetFormat,
+    WebsiteContextSnippet,
+    render_snippets,
+)
+
+
+def reference_to_xml(snippet: ContextSnippet) -> str:
+    """The ElementTree + minidom rendering to_xml used to do."""
+    root = ET.Element("context-snippet")
+    root.set("type", snippet.type.value)
+    for key, value in snippet.content.items():
+        if value is not None:
+            elem = ET.SubElement(root, key.replace("_", "-"))
+            if isinstance(value, dict):
+                for sub_key, sub_value in value.items():
+                    sub_elem = ET.SubElement(elem, sub_key.replace("_", "-"))
+                    sub_elem.text = str(sub_value)
+            elif isinstance(value, list):
+                for item in value:
+                    item_elem = ET.SubElement(elem, "item")
+                    if isinstance(item, dict):
+                        for k, v in item.items():
+                            sub_elem = ET.SubElement(item_elem, k.replace("_", "-"))
+                            sub_elem.text = str(v)
+                    else:
+                        item_elem.text = str(item)
+            else:
+                elem.text = str(value)
+
+    xml_str = ET.tostring(root, encoding="unicode")
+    pretty_xml = minidom.parseString(xml_str).toprettyxml(indent="  ")
+    lines = pretty_xml.split("\n")
+    if lines[0].startswith("<?xml"):
+        pretty_xml = "\n".join(lines[1:])
+    return pretty_xml
+
+
+@pytest.mark.parametrize(
+    "snippet",
+    [
+        WebsiteContextSnippet(
+            url="https://example.com/?a=1&b=2",
+            text_content="Hello <world> & \"friends\" 'too'",
+            title="Example",
+        ),
+        WebsiteContextSnippet(url="https://example.com", text_content="", title=None),
+        WebsiteContextSnippet(
+            url="https://example.com",
+            text_content="  line one\r\nline two\rline three\n\n\tindented  ",
+            title="Ünïcødé — 日本語 🚀",
+        ),
+        CommandContextSnippet(
+            command_query="!books ch 1", result_text="]]> <![CDATA[x]]>", source="books"
+        ),
+        ContextSnippet(
+            type=ContextType.DOCUMENT,
+            content={
+                "meta": {"page_count": 3, "author_name": "A & B", "empty": ""},
+                "tags": ["one", "<two>", 3, ""],
+                "sections": [{"section_title": "Intro", "page": 1}, {}],
+                "nothing": [],
+                "no_meta": {},
+                "skipped": None,
+            },
+        ),
+        ContextSnippet(type=ContextType.CODE, content={}),
+        ContextSnippet(type=ContextType.CODE, content={"only_none": None}),
+    ],
+)
+def test_to_xml_matches_minidom_pretty_printing(snippet):
+    assert snippet.to_xml() == reference_to_xml(snippet)
+
+
+def test_to_xml_handles_book_sized_content():
+    text = "It was a dark & stormy <night>.\n" * 50_000
+    snippet = CommandContextSnippet(
+        command_query="!books detail novel", result_text=text, source="books"
+    )
+
+    assert snippet.to_xml() == reference_to_xml(snippet)
+
+
+def test_compact_xml_drops_pretty_printing_whitespace():
+    snippet = WebsiteContextSnippet(
+        url="https://e.com", text_content="a < b", title=None
+    )
+
+    assert snippet.render(SnippetFormat.XML) == (
+        '<context-snippet type="website"><url>https://e.com</url>'
+        "<text-content>a &lt; b</text-content></context-snippet>"
+    )
+    assert snippet.render(SnippetFormat.PRETTY_XML) == snippet.to_xml()
+
+
+def test_markdown_rendering():
+    snippet = CommandContextSnippet(
+        command_query="!books", result_text="one\ntwo", source="books"
+    )
+
+    assert snippet.render(SnippetFormat.MARKDOWN) == (
+        "### Context: command_result\n"
+        "**command query:** !books\n"
+        "**result text:**\n\none\ntwo\n"
+        "**source:** books\n"
+    )
+
+
+def test_render_snippets_passes_strings_through():
+    snippet = WebsiteContextSnippet(url="https://e.com", text_content="hi", title=None)
+
+    assert render_snippets(["<raw/>", snippet]) == ["<raw/>", snippet.to_xml()]
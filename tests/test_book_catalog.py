@@ -0,0 +1,174 @@
+import os
+import time
+
+import pytest
+
+from src import book_catalog
+from src.book_catalog import BookCatalog, normalize_book_name, title_trigrams
+
+
+def _age(path, seconds=60):
+    """Backdate path's mtime so the catalog trusts it."""
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+@pytest.fixture
+def books_dir(tmp_path):
+    (tmp_path / "Moby Dick.txt").write_text("Call me Ishmael.")
+    (tmp_path / "notes.md").write_text("not a book")
+    _age(tmp_path)
+    return tmp_path
+
+
+def test_normalize_book_name():
+    assert normalize_book_name("Moby Dick.TXT") == "moby dick"
+    assert normalize_book_name("moby dick") == "moby dick"
+
+
+def test_matches_normalized_names(books_dir):
+    catalog = BookCatalog(str(books_dir))
+    catalog.scan()
+
+    assert catalog.files == ("Moby Dick.txt",)
+    assert catalog.match("moby dick") == "Moby Dick.txt"
+    assert catalog.match("MOBY DICK.txt") == "Moby Dick.txt"
+    assert catalog.match("notes") is None
+    assert catalog.match("") is None
+
+
+def test_refresh_only_rescans_when_the_directory_changes(books_dir, mocker):
+    catalog = BookCatalog(str(books_dir), poll_seconds=0)
+    catalog.scan()
+    listdir = mocker.spy(os, "listdir")
+
+    catalog.refresh()
+    assert listdir.call_count == 0
+
+    (books_dir / "Emma.txt").write_text("Emma Woodhouse...")
+    _age(books_dir, 30)
+    catalog.refresh()
+
+    assert listdir.call_count == 1
+    assert catalog.match("emma") == "Emma.txt"
+
+
+def test_recently_modified_directories_are_rescanned(books_dir, mocker):
+    catalog = BookCatalog(str(books_dir), poll_seconds=0)
+    os.utime(books_dir)  # could still change within this mtime tick
+    catalog.scan()
+    listdir = mocker.spy(os, "listdir")
+
+    catalog.refresh()
+
+    assert listdir.call_count == 1
+
+
+def test_recently_modified_directories_are_rescanned_until_they_settle(
+    books_dir, mocker
+):
+    catalog = BookCatalog(str(books_dir), poll_seconds=0)
+    os.utime(books_dir)
+    catalog.scan()
+    _age(books_dir)
+    catalog.refresh()  # the mtime has settled since: one last rescan
+    listdir = mocker.spy(os, "listdir")
+
+    catalog.refresh()
+
+    assert listdir.call_count == 0
+
+
+def test_refresh_is_rate_limited(books_dir, mocker):
+    catalog = BookCatalog(str(books_dir), poll_seconds=60)
+    catalog.refresh()
+    stat = mocker.spy(os, "stat")
+
+    catalog.refresh()
+
+    assert stat.call_count == 0
+
+
+def test_missing_directory_has_no_books(tmp_path):
+    catalog = BookCatalog(str(tmp_path / "missing"), poll_seconds=0)
+    catalog.refresh()
+
+    assert catalog.files == ()
+    assert catalog.match("anything") is None
+
+
+def test_missing_directory_is_rescanned_once_it_appears(tmp_path, mocker):
+    books_dir = tmp_path / "books"
+    catalog = BookCatalog(str(books_dir), poll_seconds=0)
+    catalog.refresh()
+    isdir = mocker.spy(os.path, "isdir")
+
+    catalog.refresh()
+    assert isdir.call_count == 0
+
+    books_dir.mkdir()
+    (books_dir / "Emma.txt").write_text("Emma Woodhouse...")
+    catalog.refresh()
+
+    assert catalog.match("emma") == "Emma.txt"
+
+
+def test_title_trigrams_ignore_case_punctuation_and_extension():
+    assert title_trigrams("War_and_Peace.txt") == title_trigrams("war-and-peace")
+    assert "  w" in title_trigrams("War")
+
+
+def test_fuzzy_match_ranks_similar_titles():
+    catalog = BookCatalog("unused")
+    catalog.replace(["War and Peace.txt", "Moby Dick.txt", "Peace Talks.txt"])
+
+    matches = catalog.fuzzy_match("war peace")
+
+    assert [match.file for match in matches][:2] == [
+        "War and Peace.txt",
+        "Peace Talks.txt",
+    ]
+    assert matches[0].score > matches[1].score
+    assert catalog.fuzzy_match("") == []
+
+
+def test_fuzzy_resolve_needs_a_confident_match():
+    catalog = BookCatalog("unused")
+    catalog.replace(["War and Peace.txt", "Moby Dick.txt", "Dick Tracy.txt"])
+
+    assert catalog.fuzzy_resolve("moby dik").file == "Moby Dick.txt"
+    assert catalog.fuzzy_resolve("war peace").file == "War and Peace.txt"
+    assert catalog.fuzzy_resolve("zeppelin") is None
+
+    catalog.replace(["Emma Part One.txt", "Emma Part Two.txt"])
+    assert catalog.fuzzy_resolve("emma part") is None  # ambiguous
+
+
+def test_fuzzy_resolutions_are_remembered_per_catalog(mocker):
+    catalog = BookCatalog("unused")
+    catalog.replace(["War and Peace.txt", "Moby Dick.txt"])
+    fuzzy_match = mocker.patch(
+        "src.book_catalog._fuzzy_match", wraps=book_catalog._fuzzy_match
+    )
+
+    assert catalog.fuzzy_resolve("war peace").file == "War and Peace.txt"
+    assert catalog.fuzzy_resolve("War, Peace").file == "War and Peace.txt"
+    assert fuzzy_match.call_count == 1
+
+    catalog.replace(["War and Peace.txt", "Moby Dick.txt", "War of Peace.txt"])
+    assert catalog.fuzzy_resolve("war peace") is None  # now ambiguous
+    assert fuzzy_match.call_count == 2
+    assert catalog.max_title_words == 3
+
+
+def test_trigram_index_follows_the_catalog(books_dir):
+    catalog = BookCatalog(str(books_dir), poll_seconds=0)
+    catalog.scan()
+    assert catalog.fuzzy_resolve("moby dik").file == "Moby Dick.txt"
+
+    (books_dir / "Moby Dick.txt").rename(books_dir / "Mobile Homes.txt")
+    _age(books_dir, 30)
+    catalog.refresh()
+
+    assert catalog.fuzzy_resolve("moby dik") is None
+    assert catalog.fuzzy_resolve("mobile home").file == "Mobile Homes.txt"
@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+
+import pytest
+
+from src.book_search import (
+    PASSAGE_MAX_BYTES,
+    PASSAGE_TARGET_BYTES,
+    BookSearchIndex,
+    excerpt,
+    split_passages,
+    to_match_query,
+)
+
+
+@pytest.fixture
+def books_dir(tmp_path):
+    books = tmp_path / "books"
+    books.mkdir()
+    (books / "moby.txt").write_text(
+        "Call me Ishmael.\n\n" + "The whale swam on. " * 80 + "\n\nThe harpoon flew.\n"
+    )
+    (books / "emma.txt").write_text("Emma Woodhouse, handsome, clever, and rich.\n")
+    return books
+
+
+@pytest.fixture
+def index(books_dir, tmp_path):
+    index = BookSearchIndex(str(books_dir), str(tmp_path / "index.sqlite3"))
+    yield index
+    index.close()
+
+
+def test_split_passages_cuts_at_paragraph_breaks():
+    paragraph = b"word " * (PASSAGE_TARGET_BYTES // 5 + 1) + b"\n\n"
+    data = paragraph * 3 + b"tail"
+
+    passages = list(split_passages(data))
+
+    assert passages[0] == (0, len(paragraph))
+    assert passages[-1][1] == len(data)
+    assert b"".join(data[start:end] for start, end in passages) == data
+
+
+def test_split_passages_caps_passages_without_paragraphs():
+    line = b"line of text\n"
+    data = line * (PASSAGE_MAX_BYTES // 4)
+
+    passages = list(split_passages(data))
+
+    # cut at the first line break past the cap
+    assert all(
+        PASSAGE_MAX_BYTES <= end - start < PASSAGE_MAX_BYTES + len(line)
+        for start, end in passages[:-1]
+    )
+    assert len(passages) > 1
+
+
+def test_match_query_quotes_every_term():
+    assert to_match_query('whale "harpoon" NEAR(') == '"whale" OR "harpoon" OR "NEAR"'
+    assert to_match_query("AND OR") == '"AND" OR "OR"'
+    assert to_match_query("?!") is None
+    # stopwords only count when there is nothing else to search for
+    assert to_match_query("the whale of it") == '"whale"'
+    assert to_match_query("to be or not") == '"to" OR "be" OR "or" OR "not"'
+
+
+def test_excerpt_starts_near_the_first_matching_word():
+    text = " ".join(f"w{i}" for i in range(100)) + " Whales\n"
+
+    assert excerpt(text, ["whale"]).startswith("...w92 w93")
+    assert excerpt("Call me\n  Ishmael.", ["ishmael"]) == "Call me Ishmael."
+    assert excerpt(text, []).endswith("w31...")
+
+
+def test_search_ranks_passages_by_bm25(index):
+    index.sync(["moby.txt", "emma.txt"])
+
+    hits = index.search("whale harpoon")
+
+    assert [hit.file for hit in hits] == ["moby.txt", "moby.txt"]
+    assert hits[0].score >= hits[1].score > 0
+    assert "whale" in hits[0].excerpt
+    # stemmed: "whales" finds "whale"
+    assert index.search("whales")[0].file == "moby.txt"
+    assert index.search("handsome")[0].file == "emma.txt"
+    assert index.search("zeppelin") == []
+
+
+def test_hits_point_at_the_passage_in_the_book(index, books_dir):
+    index.sync(["moby.txt"])
+
+    hit = index.search("harpoon")[0]
+
+    data = (books_dir / "moby.txt").read_bytes()
+    assert b"The harpoon flew." in data[hit.start : hit.end]
+
+
+def test_sync_only_reindexes_changed_books(index, books_dir, mocker):
+    index.sync(["moby.txt", "emma.txt"])
+    index_book = mocker.spy(index, "_index_book")
+
+    (books_dir / "emma.txt").write_text("Emma married Mr. Knightley.\n")
+    os.utime(books_dir / "emma.txt", ns=(1, 1))
+    index.sync(["moby.txt", "emma.txt"], force=True)
+
+    assert [call.args[0] for call in index_book.call_args_list] == ["emma.txt"]
+    assert index.search("Knightley")[0].file == "emma.txt"
+    assert index.search("Woodhouse") == []
+
+
+def test_search_leaves_out_common_words_when_rarer_ones_match(index, books_dir, mocker):
+    (books_dir / "whales.txt").write_text("A whale, a whale!\n")
+    index.sync(["moby.txt", "emma.txt", "whales.txt"])
+    mocker.patch("src.book_search.BOOK_SEARCH_COMMON_TERM_PASSAGES", 1)
+
+    # "whale" is in two passages, "handsome" in a single one
+    assert [hit.file for hit in index.search("whale handsome")] == ["emma.txt"]
+    # but a query with nothing rarer still searches for it
+    assert index.search("whale")[0].file == "moby.txt"
+
+
+def test_index_is_rebuilt_once_dead_passages_pile_up(index, books_dir):
+    index.sync(["moby.txt", "emma.txt"])
+    index.sync(["emma.txt"])
+
+    # moby's passages outnumber emma's, so the next sync starts afresh
+    assert index._writer.execute("SELECT * FROM index_state").fetchone() == (2,)
+    index.sync(["emma.txt"], force=True)
+
+    assert index._writer.execute("SELECT * FROM index_state").fetchone() == (0,)
+    assert index.search("whale") == []
+    assert index.search("Emma")[0].file == "emma.txt"
+
+
+def test_sync_drops_removed_books(index):
+    index.sync(["moby.txt", "emma.txt"])
+
+    index.sync(["moby.txt"])
+
+    assert index.search("Emma") == []
+
+
+def test_index_persists_across_restarts(index, books_dir, tmp_path, mocker):
+    index.sync(["moby.txt", "emma.txt"])
+    index.close()
+
+    reopened = BookSearchIndex(str(books_dir), str(tmp_path / "index.sqlite3"))
+    index_book = mocker.spy(reopened, "_index_book")
+    reopened.sync(["moby.txt", "emma.txt"])
+
+    assert index_book.call_count == 0
+    assert reopened.search("Ishmael")[0].file == "moby.txt"
+    reopened.close()
+
+
+def wait_for_sync(index):
+    deadline = time.monotonic() + 5
+    while index.indexing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not index.indexing
+
+
+def test_sync_in_background_indexes_on_a_worker_thread(index):
+    index.sync_in_background(["moby.txt", "emma.txt"])
+    wait_for_sync(index)
+
+    assert index.search("Ishmael")[0].file == "moby.txt"
+
+
+def test_search_does_not_wait_for_a_running_sync(index):
+    index.sync(["moby.txt"])
+    hits = []
+
+    # a sync in progress holds the write lock for as long as it indexes
+    with index._write_lock:
+        searcher = threading.Thread(target=lambda: hits.extend(index.search("whale")))
+        searcher.start()
+        searcher.join(timeout=2)
+
+    assert not searcher.is_alive()
+    assert hits[0].file == "moby.txt"
+
+
+def test_search_before_anything_is_indexed_finds_nothing(index):
+    assert index.search("whale") == []
@@ -0,0 +1,181 @@
+import os
+
+import pytest
+
+from src.book_sections import (
+    BookSectionError,
+    SectionRequest,
+    build_index,
+    get_book_index,
+    parse_section_request,
+    read_range,
+    read_section,
+)
+
+BOOK = (
+    "MOBY-DICK\n"
+    "\n"
+    "CONTENTS\n"
+    "CHAPTER 1. Loomings.\n"
+    "CHAPTER 2. The Carpet-Bag.\n"
+    "\n"
+    "CHAPTER 1. Loomings.\n"
+    "\n"
+    "Call me Ishmael. " + "Some years ago, never mind how long. " * 8 + "\n"
+    "Part of the time I sailed.\n"
+    "\n"
+    "CHAPTER 2. The Carpet-Bag.\n"
+    "\n"
+    "I stuffed a shirt or two into my old carpet-bag — café au lait.\n"
+)
+
+
+@pytest.fixture
+def book(tmp_path):
+    path = tmp_path / "moby.txt"
+    path.write_text(BOOK, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        (["moby", "toc"], (["moby"], SectionRequest("toc"))),
+        (
+            ["moby", "dick", "ch", "3"],
+            (["moby", "dick"], SectionRequest("chapter", 3, 3)),
+        ),
+        (["moby", "lines", "10-20"], (["moby"], SectionRequest("lines", 10, 20))),
+        (["moby", "bytes", "7"], (["moby"], SectionRequest("bytes", 7, 7))),
+        (["moby", "dick"], (["moby", "dick"], None)),
+        (["toc"], (["toc"], None)),
+        (["moby", "ch", "x"], (["moby", "ch", "x"], None)),
+    ],
+)
+def test_parse_section_request(args, expected):
+    assert parse_section_request(args) == expected
+
+
+def test_index_skips_the_table_of_contents(book):
+    index = get_book_index(book)
+
+    assert [h.title for h in index.headings] == [
+        "CHAPTER 1. Loomings.",
+        "CHAPTER 2. The Carpet-Bag.",
+    ]
+    # "Part of the time..." is prose, not a heading
+    assert all(h.kind == "chapter" for h in index.headings)
+    assert index.line_count == BOOK.count("\n")
+
+
+def test_index_skips_a_contents_list_followed_by_a_preface():
+    body = "Some years ago, never mind how long precisely. " * 6 + "\n"
+    text = (
+        "CONTENTS\n"
+        "\n"
+        "CHAPTER I. The Start\n"
+        "CHAPTER II. The Middle\n"
+        "CHAPTER III. The End\n"
+        "\n"
+        "PREFACE\n"
+        "\n" + body + "\n"
+        "CHAPTER I. The Start\n"
+        "\n" + body + "\n"
+        "CHAPTER II. The Middle\n"
+        "\n" + body + "\n"
+        "CHAPTER III. The End\n"
+        "\n" + body
+    ).encode()
+    index = build_index(text, (0, 0))
+
+    chapters = index.chapters()
+    assert [h.title for h in chapters] == [
+        "CHAPTER I. The Start",
+        "CHAPTER II. The Middle",
+        "CHAPTER III. The End",
+    ]
+    assert chapters[0].offset == text.index(b"CHAPTER I.", text.index(b"PREFACE"))
+
+
+def test_chapter_numbers_restarting_in_each_book_are_kept():
+    body = b"It was the best of times, it was the worst of times. " * 5 + b"\n\n"
+    text = (
+        b"BOOK ONE: 1805\n\nCHAPTER I\n\n"
+        + body
+        + b"CHAPTER II\n\n"
+        + body
+        + b"BOOK TWO: 1806\n\nCHAPTER I\n\n"
+        + body
+        + b"CHAPTER II\n\n"
+        + body
+    )
+    index = build_index(text, (0, 0))
+
+    assert [h.title for h in index.headings] == [
+        "BOOK ONE: 1805",
+        "CHAPTER I",
+        "CHAPTER II",
+        "BOOK TWO: 1806",
+        "CHAPTER I",
+        "CHAPTER II",
+    ]
+
+
+def test_index_is_built_once_per_file_version(book):
+    first = get_book_index(book)
+    assert get_book_index(book) is first
+
+    with open(book, "a", encoding="utf-8") as f:
+        f.write("More.\n")
+    os.utime(book, ns=(1, 1))
+
+    assert get_book_index(book) is not first
+
+
+def test_reads_chapters_up_to_the_next_heading(book):
+    label, text = read_section(book, SectionRequest("chapter", 1, 1))
+
+    assert label == "chapter 1, CHAPTER 1. Loomings."
+    assert text.startswith("CHAPTER 1. Loomings.\n\nCall me Ishmael.")
+    assert text.endswith("Part of the time I sailed.\n\n")
+
+    _, last = read_section(book, SectionRequest("chapter", 2, 2))
+    assert last.endswith("café au lait.\n")
+
+
+def test_reads_line_and_byte_ranges(book):
+    _, lines = read_section(book, SectionRequest("lines", 1, 3))
+    _, data = read_section(book, SectionRequest("bytes", 0, 4))
+
+    assert lines == "MOBY-DICK\n\nCONTENTS\n"
+    assert data == "MOBY-"
+
+
+def test_toc_lists_chapters_with_line_numbers(book):
+    _, toc = read_section(book, SectionRequest("toc"))
+
+    assert toc == (
+        "- ch 1: CHAPTER 1. Loomings. (line 7)\n"
+        "- ch 2: CHAPTER 2. The Carpet-Bag. (line 12)"
+    )
+
+
+def test_missing_sections_raise(book):
+    with pytest.raises(BookSectionError, match="2 chapter"):
+        read_section(book, SectionRequest("chapter", 3, 3))
+    with pytest.raises(BookSectionError):
+        read_section(book, SectionRequest("lines", 500, 600))
+
+
+def test_read_range_does_not_split_characters(book):
+    raw = BOOK.encode("utf-8")
+    inside_e_acute = raw.index("é".encode("utf-8")) + 1
+
+    assert read_range(book, inside_e_acute, len(raw)) == " au lait.\n"
+    assert read_range(book, len(raw), len(raw) + 10) == ""
+
+
+def test_markdown_headings_are_sections_when_there_are_no_chapters():
+    index = build_index(b"# Intro\n" + b"a\n" * 150 + b"## Usage\nb\n", (0, 0))
+
+    assert [h.title for h in index.chapters()] == ["Intro", "Usage"]
@@ -0,0 +1,291 @@
+import asyncio
+import json
+import math
+
+import pytest
+
+from src.cache import (
+    CACHE_NO_EXPIRY_RETENTION_SECONDS,
+    STORE_BLOB_SCRIPT,
+    CacheWrapper,
+)
+from src.cache_codec import CODEC_REF
+from src.models.context import CommandContextSnippet, WebsiteContextSnippet
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def get(self, key):
+        self.commands.append(("get", key))
+
+    def pttl(self, key):
+        self.commands.append(("pttl", key))
+
+    def setex(self, key, ttl, value):
+        self.commands.append(("setex", key, ttl, value))
+
+    def eval(self, script, numkeys, *keys_and_args):
+        assert script == STORE_BLOB_SCRIPT
+        self.commands.append(("store_blob", *keys_and_args))
+
+    async def execute(self):
+        self.redis.pipelines.append(self.commands)
+        replies = []
+        for command in self.commands:
+            if command[0] == "get":
+                replies.append(self.redis.store.get(command[1]))
+            elif command[0] == "pttl":
+                replies.append(30_000 if command[1] in self.redis.store else -2)
+            elif command[0] == "store_blob":
+                replies.append(self.redis.store_blob(*command[1:]))
+            else:
+                self.redis.store[command[1]] = command[3]
+                replies.append(True)
+        return replies
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store: dict[str, bytes] = {}
+        self.refs: dict[str, int] = {}
+        self.pipelines: list[list] = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def store_blob(self, key, record, ttl, digest, blob, blob_prefix, refs_prefix):
+        """What STORE_BLOB_SCRIPT does, minus expiry."""
+        old = self.store.get(key)
+        self.store[key] = record
+        old_digest = old[1:65].decode() if old and old[0] == CODEC_REF else None
+        if old_digest != digest:
+            self.refs[digest] = self.refs.get(digest, 0) + 1
+            if old_digest:
+                self.refs[old_digest] -= 1
+                if self.refs[old_digest] <= 0:
+                    del self.store[blob_prefix + old_digest]
+                    del self.refs[old_digest]
+        if blob_prefix + digest in self.store:
+            return 1
+        self.store[blob_prefix + digest] = blob
+        return 0
+
+
+def _connected_cache(ttl_seconds=60) -> tuple[CacheWrapper, FakeRedis]:
+    cache = CacheWrapper(ttl_seconds=ttl_seconds)
+    fake = FakeRedis()
+    cache._client = fake
+    cache._connected = True
+    return cache, fake
+
+
+@pytest.mark.asyncio
+async def test_get_many_reads_all_l1_misses_in_one_round_trip():
+    cache, fake = _connected_cache()
+    fake.store["a"] = json.dumps(["snippet a"]).encode("utf-8")
+
+    result = await cache.get_many(["a", "b"])
+
+    assert result == {"a": ["snippet a"], "b": None}
+    assert len(fake.pipelines) == 1
+    assert cache.stats.l2.hits == 1
+    assert cache.stats.l2.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_l2_hits_are_promoted_to_l1():
+    cache, fake = _connected_cache()
+    fake.store["a"] = json.dumps(["snippet a"]).encode("utf-8")
+
+    await cache.get("a")
+    assert await cache.get("a") == ["snippet a"]
+
+    assert len(fake.pipelines) == 1  # second lookup never reached Redis
+    assert cache.stats.l1.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_set_many_writes_in_one_pipeline_with_ttl():
+    cache, fake = _connected_cache(ttl_seconds=42)
+
+    await cache.set_many({"a": ["1"], "b": ["2"]})
+
+    assert len(fake.pipelines) == 1
+    assert [(c[1], c[2]) for c in fake.pipelines[0]] == [("a", 42), ("b", 42)]
+    assert await cache.get("b") == ["2"]
+
+
+@pytest.mark.asyncio
+async def test_in_memory_tier_when_redis_unavailable():
+    cache = CacheWrapper()
+    cache.redis_url = "redis://127.0.0.1:1"  # nothing listens here
+
+    await cache.set_many({"a": ["1"]})
+
+    assert await cache.get_many(["a", "missing"]) == {"a": ["1"], "missing": None}
+    await cache.clear()
+    assert await cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_callers_during_the_first_connect_wait_for_it(mocker):
+    class SlowRedis(FakeRedis):
+        pings = 0
+
+        def __init__(self, connection_pool):
+            super().__init__()
+
+        async def ping(self):
+            SlowRedis.pings += 1
+            await asyncio.sleep(0.05)
+
+    mocker.patch("src.cache.redis.ConnectionPool.from_url")
+    mocker.patch("src.cache.redis.Redis", SlowRedis)
+    cache = CacheWrapper()
+
+    async def connected() -> bool:
+        await cache._connect()
+        return cache._connected
+
+    assert await asyncio.gather(connected(), connected(), connected()) == [
+        True,
+        True,
+        True,
+    ]
+    assert SlowRedis.pings == 1
+
+
+@pytest.mark.asyncio
+async def test_structured_snippets_are_stored_binary_and_read_back():
+    cache, fake = _connected_cache()
+    snippet = WebsiteContextSnippet(url="https://e.com", text_content="hi", title=None)
+
+    await cache.set_many({"a": [snippet]})
+    cache._l1.clear()  # force the read to go to Redis
+    value = await cache.get("a")
+
+    assert isinstance(fake.store["a"], bytes)
+    assert value[0].to_xml() == snippet.to_xml()
+
+
+@pytest.mark.asyncio
+async def test_large_entries_are_compressed_in_redis_and_reported():
+    cache, fake = _connected_cache()
+    cache.compression_min_bytes = 1024
+    cache.dedupe_min_bytes = 0
+    book = "It was the best of times. " * 1000
+
+    await cache.set_many({"book": [book], "small": ["x"]})
+    cache._l1.clear()
+
+    assert await cache.get("book") == [book]
+    assert len(fake.store["book"]) < len(book) / 10
+    codec = cache.stats.codec
+    assert codec.encoded == 2
+    assert codec.compressed == 1
+    assert codec.decoded == 1
+    assert codec.compression_ratio > 10
+    assert codec.encode_seconds > 0
+
+
+@pytest.mark.asyncio
+async def test_identical_large_values_are_stored_once():
+    cache, fake = _connected_cache(ttl_seconds=60)
+    cache.dedupe_min_bytes = 1024
+    book = ["Call me Ishmael. " * 500]
+
+    await cache.set_many({"!book moby": book, "!b moby": book, "small": ["x"]})
+
+    blobs = [key for key in fake.store if key.startswith("blob:")]
+    assert len(blobs) == 1
+    assert len(fake.store["!book moby"]) < 100  # just an index record
+    assert fake.store["small"][0] != CODEC_REF  # small values stay inline
+    assert cache.stats.codec.blob_writes == 2
+    assert cache.stats.codec.blobs_reused == 1
+
+    cache._l1.clear()
+    result = await cache.get_many(["!book moby", "!b moby"])
+    assert result == {"!book moby": book, "!b moby": book}
+    # one round trip for the index records, one for the shared blob
+    assert [c[0] for c in fake.pipelines[-1]] == ["get"]
+    assert cache.stats.codec.decoded == 1
+
+
+@pytest.mark.asyncio
+async def test_book_commands_spelled_differently_share_one_blob():
+    cache, fake = _connected_cache()
+    cache.dedupe_min_bytes = 1024
+    text = "Well, Prince, so Genoa and Lucca are now just family estates. " * 50
+
+    def book(command_query: str) -> list[CommandContextSnippet]:
+        return [
+            CommandContextSnippet(
+                command_query=command_query, result_text=text, source="books"
+            )
+        ]
+
+    entries = {
+        "!book war_and_peace": book("!book war_and_peace"),
+        "!books war_and_peace": book("!books war_and_peace"),
+        "!book War_And_Peace": book("!book War_And_Peace"),
+    }
+    await cache.set_many(entries)
+
+    assert len([key for key in fake.store if key.startswith("blob:")]) == 1
+    cache._l1.clear()
+    result = await cache.get_many(list(entries))
+    for key, value in entries.items():
+        assert result[key][0].content == value[0].content
+
+
+@pytest.mark.asyncio
+async def test_overwriting_a_key_releases_its_old_blob():
+    cache, fake = _connected_cache()
+    cache.dedupe_min_bytes = 1024
+
+    await cache.set_many({"page": ["old " * 500]})
+    await cache.set_many({"page": ["new " * 500]})
+
+    assert len([key for key in fake.store if key.startswith("blob:")]) == 1
+    cache._l1.clear()
+    assert await cache.get("page") == ["new " * 500]
+
+
+@pytest.mark.asyncio
+async def test_index_records_whose_blob_is_gone_are_misses():
+    cache, fake = _connected_cache()
+    cache.dedupe_min_bytes = 1024
+    await cache.set_many({"page": ["text " * 500]})
+    for key in [key for key in fake.store if key.startswith("blob:")]:
+        del fake.store[key]
+    cache._l1.clear()
+
+    assert await cache.get("page") is None
+    assert cache.stats.l2.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_entries_follow_their_own_ttl():
+    cache, fake = _connected_cache(ttl_seconds=60)
+
+    await cache.set_entries(
+        {
+            "no-store": cache.make_entry(["volatile"], ttl_seconds=0),
+            "forever": cache.make_entry(["book"], ttl_seconds=math.inf),
+        }
+    )
+
+    assert "no-store" not in fake.store
+    assert await cache.get("no-store") is None
+    [(_, key, ttl, _)] = fake.pipelines[0]
+    assert (key, ttl) == ("forever", CACHE_NO_EXPIRY_RETENTION_SECONDS)
+    assert await cache.get("forever") == ["book"]
@@ -0,0 +1,175 @@
+import json
+import math
+import os
+import time
+
+import pytest
+
+from src.cache_codec import (
+    CODEC_BINARY,
+    CODEC_REF,
+    CODEC_ZLIB,
+    CodecError,
+    compress,
+    content_digest,
+    decode_entry,
+    decode_fields,
+    decode_ref,
+    decompress,
+    encode_entry,
+    encode_fields,
+    encode_ref,
+    split_entry,
+)
+from src.models.cache_entry import CacheEntry
+from src.models.context import (
+    CommandContextSnippet,
+    ContextSnippet,
+    ContextType,
+    WebsiteContextSnippet,
+)
+
+
+def test_round_trips_strings_and_structured_snippets():
+    entry = CacheEntry(
+        value=[
+            "<pre-rendered/>",
+            WebsiteContextSnippet(
+                url="https://example.com", text_content="Hi ✓", title=None
+            ),
+            CommandContextSnippet(
+                command_query="!books", result_text="", source="books"
+            ),
+            ContextSnippet(
+                type=ContextType.DOCUMENT,
+                content={"meta": {"pages": 3}, "tags": ["a", "b"]},
+            ),
+        ],
+        fresh_until=1234.5,
+        compute_seconds=0.25,
+        failed=True,
+    )
+
+    decoded = decode_entry(encode_entry(entry))
+
+    assert decoded.fresh_until == 1234.5
+    assert decoded.compute_seconds == 0.25
+    assert decoded.failed
+    assert decoded.value[0] == "<pre-rendered/>"
+    # snippets come back as plain ContextSnippets that render identically
+    assert [s.to_xml() for s in decoded.value[1:]] == [
+        s.to_xml() for s in entry.value[1:]
+    ]
+
+
+def test_binary_is_smaller_than_pretty_xml_json():
+    snippet = WebsiteContextSnippet(
+        url="https://example.com", text_content="word " * 200, title="Example"
+    )
+    as_json = CacheEntry(value=[snippet.to_xml()], fresh_until=0).model_dump_json()
+
+    assert len(encode_entry(CacheEntry(value=[snippet], fresh_until=0))) < len(as_json)
+
+
+def test_reads_json_lists_written_before_the_binary_codec():
+    # plain lists predate entry metadata and stay fresh for their Redis TTL
+    legacy = decode_entry(json.dumps(["<older/>"]).encode(), ttl_ms=10_000)
+    assert legacy.value == ["<older/>"]
+    assert legacy.fresh_until == pytest.approx(time.time() + 10, abs=1)
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        b"\x7fnope",
+        b'{"value": ["x"], "fresh_until": 0}',
+        b"[not json",
+        encode_entry(CacheEntry(value=["x"], fresh_until=0))[:-1],
+    ],
+)
+def test_rejects_unknown_or_truncated_payloads(raw):
+    with pytest.raises(CodecError):
+        decode_entry(raw)
+
+
+def test_compresses_large_payloads_behind_a_header_byte():
+    payload = encode_entry(CacheEntry(value=["word " * 2000], fresh_until=0))
+
+    compressed = compress(payload, min_bytes=1024)
+
+    assert compressed[0] == CODEC_ZLIB
+    assert len(compressed) < len(payload) / 10
+    assert decompress(compressed) == payload
+
+
+def test_leaves_small_or_incompressible_payloads_alone():
+    small = encode_entry(CacheEntry(value=["tiny"], fresh_until=0))
+    noise = bytes([CODEC_BINARY]) + os.urandom(4096)
+
+    assert compress(small, min_bytes=1024) is small
+    assert compress(noise, min_bytes=1024) is noise
+    assert compress(noise, min_bytes=0) is noise
+    # uncompressed and pre-codec JSON payloads pass through decompress
+    assert decompress(small) is small
+    assert decompress(b'["old"]') == b'["old"]'
+
+
+def test_rejects_corrupt_compressed_payloads():
+    with pytest.raises(CodecError):
+        decompress(bytes([CODEC_ZLIB]) + b"not zlib")
+
+
+def test_split_entries_share_blobs_whatever_their_small_fields():
+    text = "Call me Ishmael. " * 100
+
+    def book_entry(command_query: str, fresh_until: float) -> CacheEntry:
+        snippet = CommandContextSnippet(
+            command_query=command_query, result_text=text, source="books"
+        )
+        return CacheEntry(value=[snippet], fresh_until=fresh_until)
+
+    payload, fields = split_entry(book_entry("!book moby", 1), 1024)
+    other_payload, other_fields = split_entry(book_entry("!books Moby", 9), 1024)
+
+    assert fields == other_fields == [text]
+    assert content_digest(encode_fields(fields)) == content_digest(
+        encode_fields(other_fields)
+    )
+    assert len(payload) < 200
+    assert b"!book moby" in payload and b"!books Moby" in other_payload
+    assert split_entry(book_entry("!book moby", 1), 0)[1] == []
+
+
+def test_index_records_round_trip():
+    entry = CacheEntry(
+        value=["big " * 300, "small"],
+        fresh_until=12.5,
+        compute_seconds=0.5,
+        etag='W/"v1"',
+    )
+    payload, fields = split_entry(entry, 1024)
+    blob = encode_fields(fields)
+    digest = content_digest(blob)
+
+    record = encode_ref(payload, digest)
+
+    assert record[0] == CODEC_REF
+    assert decode_ref(record) == (digest, payload)
+    assert decode_entry(payload, blob_fields=decode_fields(blob)) == entry
+    assert decode_ref(encode_entry(entry)) is None
+
+
+def test_rejects_index_records_without_their_blob_fields():
+    payload, _ = split_entry(CacheEntry(value=["big " * 300], fresh_until=0), 1024)
+
+    with pytest.raises(CodecError):
+        decode_entry(payload)
+    with pytest.raises(CodecError):
+        decode_fields(b"not a blob")
+
+
+def test_round_trips_etags():
+    tagged = CacheEntry(value=["same"], fresh_until=math.inf, etag='W/"v1"')
+
+    assert decode_entry(encode_entry(tagged)) == tagged
+    assert encode_entry(tagged)[0] == CODEC_BINARY
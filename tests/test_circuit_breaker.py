@@ -0,0 +1,133 @@
+import time
+
+import pytest
+
+from src.circuit_breaker import CircuitBreaker, CircuitState
+
+
+def make_breaker(**kwargs) -> CircuitBreaker:
+    settings = dict(
+        failure_ratio=0.5,
+        slow_call_seconds=5,
+        min_calls=4,
+        window_seconds=60,
+        open_seconds=30,
+    )
+    settings.update(kwargs)
+    return CircuitBreaker("test", **settings)
+
+
+def advance(mocker, seconds: float):
+    now = time.monotonic() + seconds
+    mocker.patch("src.circuit_breaker.time.monotonic", return_value=now)
+
+
+def test_opens_when_failure_ratio_is_reached():
+    breaker = make_breaker()
+    for success in (True, False, True):
+        assert breaker.allow()
+        breaker.record(success, 0.1)
+    assert breaker.state == CircuitState.CLOSED
+
+    breaker.record(False, 0.1)
+
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow()
+    assert breaker.stats.trips == 1
+    assert breaker.stats.rejected == 1
+    assert breaker.retry_after() == pytest.approx(30, abs=1)
+
+
+def test_slow_successes_count_against_the_breaker():
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record(True, 6)
+
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.stats.slow_calls == 4
+    assert breaker.stats.failures == 0
+
+
+def test_needs_min_calls_before_opening():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record(False, 0.1)
+
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_old_calls_leave_the_window(mocker):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record(False, 0.1)
+    advance(mocker, 61)
+
+    breaker.record(False, 0.1)
+
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.stats.window_calls == 1
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success(mocker):
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record(False, 0.1)
+    advance(mocker, 31)
+
+    assert breaker.state == CircuitState.HALF_OPEN
+    probe = breaker.allow()
+    assert probe.probe
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record(True, 0.1, probe)
+
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.stats.probes == 1
+    assert breaker.stats.window_calls == 0
+
+
+def test_failed_probe_opens_the_breaker_again(mocker):
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record(False, 0.1)
+    advance(mocker, 31)
+
+    probe = breaker.allow()
+    breaker.record(False, 0.1, probe)
+
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.stats.trips == 2
+
+
+def test_only_the_probe_decides_the_half_open_state(mocker):
+    breaker = make_breaker(min_calls=2)
+    permits = [breaker.allow() for _ in range(3)]
+    breaker.record(False, 0.1, permits[0])
+    breaker.record(False, 0.1, permits[1])
+    assert breaker.state == CircuitState.OPEN
+    advance(mocker, 31)
+    probe = breaker.allow()
+
+    # the third call started while closed and finishes during the probe
+    breaker.record(True, 0.1, permits[2])
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record(False, 0.1, probe)
+    assert breaker.state == CircuitState.OPEN
+
+
+def test_calls_from_before_the_breaker_closed_do_not_count(mocker):
+    breaker = make_breaker(min_calls=2)
+    stale = [breaker.allow() for _ in range(4)]
+    breaker.record(False, 0.1, stale[0])
+    breaker.record(False, 0.1, stale[1])
+    advance(mocker, 31)
+    breaker.record(True, 0.1, breaker.allow())
+    assert breaker.state == CircuitState.CLOSED
+
+    breaker.record(False, 0.1, stale[2])
+    breaker.record(False, 0.1, stale[3])
+
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.stats.window_calls == 0
+    assert breaker.stats.failures == 4
@@ -1,7 +1,20 @@
+import asyncio
+import json
+import time
+
 import pytest
 
 from src.clients.website_client import WebsiteContextClient
-from src.hydrator import ChatHydrator, ContextCommand
+from src.hydrator import ChatHydrator, ContextCommand, context_cache, turn_cache
+from src.models.cache_entry import CacheEntry
+from src.models.context import (
+    ContextResult,
+    ContextSnippet,
+    SnippetFormat,
+    WebsiteContextSnippet,
+    render_snippets,
+)
+from src.passage_selection import select_passages
 
 
 @pytest.mark.asyncio
@@ -81,3 +94,576 @@ async def test_chat_hydrator_empty_chat():
 
     # Verify empty chat is returned as is
     assert hydrated_chat == {}
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b'{"messages": [{"role": "user", "content": "see https://example.com"}]}',
+        b'{"messages": [{"role": "user", "content": "see https:\\/\\/example.com"}]}',
+        b'{"messages": [{"role": "user", "content": "!books please"}]}',
+        b'{"messages": [{"role": "user", "content": "\\u0021books please"}]}',
+    ],
+)
+def test_may_need_hydration_detects_directives(body):
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: WebsiteContextClient()})
+
+    assert hydrator.may_need_hydration(body)
+
+
+def test_may_need_hydration_skips_plain_chats():
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: WebsiteContextClient()})
+    body = (
+        b'{"messages": [{"role": "user", "content": "Hello! caf\\u00e9 time: 10:30"}]}'
+    )
+
+    assert not hydrator.may_need_hydration(body)
+
+
+@pytest.mark.asyncio
+async def test_get_hydrated_body_fast_path_returns_original_bytes():
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: WebsiteContextClient()})
+    body = b'{"messages":[{"role":"user","content":"Hello, how are you?"}]}'
+
+    result = await hydrator.get_hydrated_body(body)
+
+    assert result is body
+    assert hydrator.stats.requests == 1
+    assert hydrator.stats.fast_path == 1
+    assert hydrator.stats.fast_path_ratio == 1.0
+
+
+@pytest.mark.asyncio
+async def test_get_hydrated_body_hydrates_when_directive_present():
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: WebsiteContextClient()})
+    body = json.dumps(
+        {"messages": [{"role": "user", "content": "Check https://example.com"}]}
+    ).encode()
+
+    result = json.loads(await hydrator.get_hydrated_body(body))
+
+    assert "<context-snippet" in result["messages"][0]["content"]
+    assert hydrator.stats.hydrated == 1
+    assert hydrator.stats.fast_path == 0
+
+
+@pytest.mark.asyncio
+async def test_incremental_hydration_only_resolves_new_turns(mocker):
+    hydrator = ChatHydrator(
+        {ContextCommand.WEBSITE: WebsiteContextClient()}, incremental=True
+    )
+    spy = mocker.spy(hydrator, "_plan_directives")
+    history = [
+        {"role": "user", "content": "Look at https://example.com"},
+        {"role": "assistant", "content": "Done."},
+    ]
+
+    first = await hydrator.get_hydrated_chat({"messages": history})
+    second = await hydrator.get_hydrated_chat(
+        {
+            "messages": history
+            + [{"role": "user", "content": "And https://test.org please"}]
+        }
+    )
+
+    assert spy.call_count == 2  # one per distinct user turn, not three
+    assert second["messages"][0]["content"] == first["messages"][0]["content"]
+    assert "<context-snippet" in second["messages"][2]["content"]
+
+
+@pytest.mark.asyncio
+async def test_non_incremental_hydration_resolves_every_turn(mocker):
+    hydrator = ChatHydrator(
+        {ContextCommand.WEBSITE: WebsiteContextClient()}, incremental=False
+    )
+    spy = mocker.spy(hydrator, "_plan_directives")
+    chat = {"messages": [{"role": "user", "content": "Look at https://example.com"}]}
+
+    await hydrator.get_hydrated_chat(chat)
+    await hydrator.get_hydrated_chat(chat)
+
+    assert spy.call_count == 2
+
+
+class SlowRecordingClient:
+    """Context client that sleeps per key and tracks how many calls overlap."""
+
+    def __init__(self, delays: dict[str, float]):
+        self.delays = delays
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get_context(self, key: str) -> list[str]:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(key, 0.01))
+        finally:
+            self.in_flight -= 1
+        return [f"<snippet>{key}</snippet>"]
+
+
+@pytest.mark.asyncio
+async def test_directives_resolve_concurrently_in_deterministic_order():
+    urls = [f"https://example.com/{i}" for i in range(4)]
+    # later URLs finish first
+    client = SlowRecordingClient({url: 0.05 - i * 0.01 for i, url in enumerate(urls)})
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: client}, incremental=False)
+    chat = {"messages": [{"role": "user", "content": " ".join(urls)}]}
+
+    hydrated_chat = await hydrator.get_hydrated_chat(chat)
+
+    content = hydrated_chat["messages"][0]["content"]
+    positions = [content.index(f"<snippet>{url}</snippet>") for url in urls]
+    assert positions == sorted(positions)
+    assert client.max_in_flight == 4
+
+
+@pytest.mark.asyncio
+async def test_directive_fan_out_respects_client_limit():
+    urls = [f"https://example.com/{i}" for i in range(6)]
+    client = SlowRecordingClient({})
+    hydrator = ChatHydrator(
+        {ContextCommand.WEBSITE: client},
+        incremental=False,
+        max_concurrency=8,
+        client_concurrency={ContextCommand.WEBSITE: 2},
+    )
+    chat = {"messages": [{"role": "user", "content": " ".join(urls)}]}
+
+    await hydrator.get_hydrated_chat(chat)
+
+    assert client.max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_a_client_at_its_limit_does_not_hold_shared_slots():
+    urls = [f"https://example.com/{i}" for i in range(6)]
+    website = SlowRecordingClient({url: 0.2 for url in urls})
+    bang = SlowRecordingClient({})
+    started = time.monotonic()
+    bang_started_after = []
+
+    async def bang_get_context(key: str) -> list[str]:
+        bang_started_after.append(time.monotonic() - started)
+        return [f"<snippet>{key}</snippet>"]
+
+    bang.get_context = bang_get_context
+    hydrator = ChatHydrator(
+        {ContextCommand.WEBSITE: website, ContextCommand.BANG_COMMAND: bang},
+        incremental=False,
+        max_concurrency=4,
+        client_concurrency={
+            ContextCommand.WEBSITE: 2,
+            ContextCommand.BANG_COMMAND: 2,
+        },
+    )
+    chat = {"messages": [{"role": "user", "content": " ".join(urls) + " !testcmd"}]}
+
+    await hydrator.get_hydrated_chat(chat)
+
+    assert website.max_in_flight == 2
+    assert bang_started_after[0] < 0.1
+
+
+class CountingClient:
+    def __init__(self):
+        self.calls = []
+
+    async def get_context(self, key: str) -> list[str]:
+        self.calls.append(key)
+        return [f"<fresh>{key}</fresh>"]
+
+
+@pytest.mark.asyncio
+async def test_stale_snippets_are_served_while_refreshing_in_background():
+    url = "https://example.com/stale"
+    await context_cache.set_entries(
+        {url: CacheEntry(value=["<old>cached</old>"], fresh_until=time.time() - 1)}
+    )
+    client = CountingClient()
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: client}, incremental=False)
+
+    hydrated_chat = await hydrator.get_hydrated_chat(
+        {"messages": [{"role": "user", "content": f"Read {url}"}]}
+    )
+
+    assert "<old>cached</old>" in hydrated_chat["messages"][0]["content"]
+    assert hydrator.stats.stale_served == 1
+    await asyncio.gather(*hydrator._background_tasks)
+    assert client.calls == [url]
+    assert await context_cache.get(url) == [f"<fresh>{url}</fresh>"]
+
+
+@pytest.mark.asyncio
+async def test_fresh_snippets_are_not_refreshed_without_early_refresh():
+    url = "https://example.com/fresh"
+    await context_cache.set_entries(
+        {
+            url: CacheEntry(
+                value=["<cached/>"], fresh_until=time.time() + 60, compute_seconds=5
+            )
+        }
+    )
+    client = CountingClient()
+    hydrator = ChatHydrator(
+        {ContextCommand.WEBSITE: client}, incremental=False, early_refresh_beta=0
+    )
+
+    await hydrator.get_hydrated_chat(
+        {"messages": [{"role": "user", "content": f"Read {url}"}]}
+    )
+
+    assert client.calls == []
+    assert hydrator.stats.background_refreshes == 0
+
+
+class RaisingClient(CountingClient):
+    async def get_context(self, key: str) -> list[str]:
+        if key.endswith("/broken"):
+            raise RuntimeError("boom")
+        return await super().get_context(key)
+
+
+@pytest.mark.asyncio
+async def test_a_directive_that_raises_does_not_discard_the_others():
+    ok, broken = "https://example.com/ok", "https://example.com/broken"
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: RaisingClient()})
+
+    hydrated_chat = await hydrator.get_hydrated_chat(
+        {"messages": [{"role": "user", "content": f"Read {ok} and {broken}"}]}
+    )
+
+    content = hydrated_chat["messages"][0]["content"]
+    assert f"<fresh>{ok}</fresh>" in content
+    assert f'<failed_context source="{broken}">' in content
+    # the fetched result is still written back, the failure negatively cached
+    assert await context_cache.get(ok) == [f"<fresh>{ok}</fresh>"]
+    assert (await context_cache.get_entries([broken]))[broken].failed
+
+
+class FailingClient:
+    def __init__(self, retry_after_seconds=None):
+        self.calls = []
+        self.retry_after_seconds = retry_after_seconds
+
+    async def get_context(self, key: str) -> list[str]:
+        return (await self.fetch(key)).snippets
+
+    async def fetch(self, key: str) -> ContextResult:
+        self.calls.append(key)
+        return ContextResult(
+            snippets=[f"<fallback>{key}</fallback>"],
+            failed=True,
+            retry_after_seconds=self.retry_after_seconds,
+        )
+
+
+@pytest.mark.asyncio
+async def test_failed_fetches_are_negatively_cached():
+    url = "https://example.com/down"
+    client = FailingClient(retry_after_seconds=7)
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: client})
+    chat = {"messages": [{"role": "user", "content": f"Read {url}"}]}
+
+    first = await hydrator.get_hydrated_chat(json.loads(json.dumps(chat)))
+    second = await hydrator.get_hydrated_chat(json.loads(json.dumps(chat)))
+
+    assert f"<fallback>{url}</fallback>" in first["messages"][0]["content"]
+    assert second == first
+    # the failure is remembered, so the source is not asked again...
+    assert client.calls == [url]
+    assert hydrator.stats.negative_cached == 1
+    assert hydrator.stats.negative_hits == 1
+    # ...but only for its Retry-After, and never as fresh content
+    entry = (await context_cache.get_entries([url]))[url]
+    assert entry.failed
+    assert entry.fresh_until - time.time() == pytest.approx(7, abs=1)
+    assert await context_cache.get(url) is not None
+    # the degraded turn is not cached as hydrated
+    assert await turn_cache.get(hydrator._turn_cache_key(f"Read {url}")) is None
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_serving_stale_snippets():
+    url = "https://example.com/flaky"
+    await context_cache.set_entries(
+        {url: CacheEntry(value=["<old>cached</old>"], fresh_until=time.time() - 1)}
+    )
+    client = FailingClient()
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: client}, incremental=False)
+
+    await hydrator.get_hydrated_chat(
+        {"messages": [{"role": "user", "content": f"Read {url}"}]}
+    )
+    await asyncio.gather(*hydrator._background_tasks)
+
+    entry = (await context_cache.get_entries([url]))[url]
+    assert entry.failed
+    assert entry.value == ["<old>cached</old>"]
+
+
+class SlowClient:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = []
+
+    async def get_context(self, key: str) -> list[str]:
+        self.calls.append(key)
+        await asyncio.sleep(self.delay)
+        return [f"<slow>{key}</slow>"]
+
+
+@pytest.mark.asyncio
+async def test_deadline_forwards_partial_context_and_finishes_in_background():
+    url = "https://example.com/slow"
+    client = SlowClient(delay=0.2)
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: client}, deadline_seconds=0.05)
+    chat = {"messages": [{"role": "user", "content": f"Read {url}"}]}
+
+    started = time.monotonic()
+    hydrated_chat = await hydrator.get_hydrated_chat(json.loads(json.dumps(chat)))
+
+    assert time.monotonic() - started < 0.15
+    content = hydrated_chat["messages"][0]["content"]
+    assert f'<pending_context source="{url}">' in content
+    assert "<slow>" not in content
+    assert hydrator.stats.deadline_exceeded == 1
+    # the partial turn is not reused...
+    assert await turn_cache.get(hydrator._turn_cache_key(f"Read {url}")) is None
+
+    # ...and the late fetch fills the cache for the next request
+    await asyncio.gather(*hydrator._background_tasks)
+    assert await context_cache.get(url) == [f"<slow>{url}</slow>"]
+    hydrated_chat = await hydrator.get_hydrated_chat(json.loads(json.dumps(chat)))
+    assert f"<slow>{url}</slow>" in hydrated_chat["messages"][0]["content"]
+    assert client.calls == [url]
+
+
+@pytest.mark.asyncio
+async def test_per_request_deadline_overrides_the_default():
+    url = "https://example.com/slow-but-awaited"
+    hydrator = ChatHydrator(
+        {ContextCommand.WEBSITE: SlowClient(delay=0.05)}, deadline_seconds=0.01
+    )
+
+    hydrated_chat = await hydrator.get_hydrated_chat(
+        {"messages": [{"role": "user", "content": f"Read {url}"}]},
+        deadline_seconds=0,
+    )
+
+    assert f"<slow>{url}</slow>" in hydrated_chat["messages"][0]["content"]
+    assert hydrator.stats.deadline_exceeded == 0
+
+
+class StructuredClient:
+    def __init__(self):
+        self.calls = []
+
+    async def get_context(self, key: str) -> list[str]:
+        return render_snippets((await self.fetch(key)).snippets)
+
+    async def fetch(self, key: str) -> ContextResult:
+        self.calls.append(key)
+        return ContextResult(
+            snippets=[WebsiteContextSnippet(url=key, text_content="Hi", title=None)]
+        )
+
+
+@pytest.mark.asyncio
+async def test_cached_snippets_are_rendered_in_the_configured_format():
+    url = "https://example.com/formats"
+    client = StructuredClient()
+    chat = {"messages": [{"role": "user", "content": f"Read {url}"}]}
+
+    pretty = ChatHydrator({ContextCommand.WEBSITE: client})
+    markdown = ChatHydrator(
+        {ContextCommand.WEBSITE: client}, snippet_format=SnippetFormat.MARKDOWN
+    )
+    pretty_chat = await pretty.get_hydrated_chat(json.loads(json.dumps(chat)))
+    markdown_chat = await markdown.get_hydrated_chat(json.loads(json.dumps(chat)))
+
+    assert '<context-snippet type="website">\n' in pretty_chat["messages"][0]["content"]
+    assert f"**url:** {url}" in markdown_chat["messages"][0]["content"]
+    # one fetch: the structured snippet in the cache serves every format
+    assert client.calls == [url]
+    assert pretty._turn_cache_key("x") != markdown._turn_cache_key("x")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_bytes, renders", [(1 << 20, 1), (0, 2)])
+async def test_rendered_snippets_are_reused_within_their_own_budget(
+    mocker, max_bytes, renders
+):
+    url = "https://example.com/rendered"
+    hydrator = ChatHydrator(
+        {ContextCommand.WEBSITE: StructuredClient()},
+        incremental=False,
+        render_cache_max_bytes=max_bytes,
+    )
+    spy = mocker.spy(ContextSnippet, "to_xml")
+
+    for _ in range(2):
+        await hydrator.get_hydrated_chat(
+            {"messages": [{"role": "user", "content": url}]}
+        )
+
+    assert spy.call_count == renders
+    # the cached snippet itself holds no rendered copy
+    assert vars((await context_cache.get(url))[0]).keys() == {"type", "content"}
+
+
+@pytest.mark.asyncio
+async def test_spellings_of_one_url_share_a_fetch():
+    client = CountingClient()
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: client})
+
+    await hydrator.get_hydrated_chat(
+        {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": "See https://Example.com/a/ (or https://example.com/a#top).",
+                },
+                {
+                    "role": "user",
+                    "content": "Also https://example.com/a?utm_source=chat",
+                },
+            ]
+        }
+    )
+
+    assert client.calls == ["https://example.com/a"]
+
+
+class ValidatingClient:
+    def __init__(self, ttl_seconds=None):
+        self.calls = []
+        self.ttl_seconds = ttl_seconds
+
+    async def get_context(self, key: str) -> list[str]:
+        return (await self.fetch(key)).snippets
+
+    async def fetch(self, key: str, etag: str | None = None) -> ContextResult:
+        self.calls.append((key, etag))
+        if etag == "v1":
+            return ContextResult(snippets=[], ttl_seconds=60, not_modified=True)
+        return ContextResult(
+            snippets=[f"<fresh>{key}</fresh>"], ttl_seconds=self.ttl_seconds, etag="v1"
+        )
+
+
+@pytest.mark.asyncio
+async def test_stale_snippets_are_revalidated_with_their_etag():
+    url = "https://example.com/etag"
+    await context_cache.set_entries(
+        {
+            url: CacheEntry(
+                value=["<old>cached</old>"], fresh_until=time.time() - 1, etag="v1"
+            )
+        }
+    )
+    client = ValidatingClient()
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: client}, incremental=False)
+
+    await hydrator.get_hydrated_chat(
+        {"messages": [{"role": "user", "content": f"Read {url}"}]}
+    )
+    await asyncio.gather(*hydrator._background_tasks)
+
+    assert client.calls == [(url, "v1")]
+    assert hydrator.stats.revalidated == 1
+    # the cached value is kept, fresh for the lifetime the source gave
+    entry = (await context_cache.get_entries([url]))[url]
+    assert entry.value == ["<old>cached</old>"]
+    assert entry.etag == "v1"
+    assert entry.fresh_until - time.time() == pytest.approx(60, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_uncacheable_snippets_are_fetched_every_time():
+    url = "https://example.com/no-store"
+    client = ValidatingClient(ttl_seconds=0)
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: client})
+    chat = {"messages": [{"role": "user", "content": f"Read {url}"}]}
+
+    await hydrator.get_hydrated_chat(json.loads(json.dumps(chat)))
+    await hydrator.get_hydrated_chat(json.loads(json.dumps(chat)))
+
+    assert client.calls == [(url, None), (url, None)]
+    assert await turn_cache.get(hydrator._turn_cache_key(f"Read {url}")) is None
+
+
+class KeyedClient(CountingClient):
+    async def cache_key(self, key: str) -> str | None:
+        return f"{key}|v2"
+
+
+@pytest.mark.asyncio
+async def test_clients_can_choose_the_cache_key():
+    url = "https://example.com/keyed"
+    client = KeyedClient()
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: client})
+
+    await hydrator.get_hydrated_chat(
+        {"messages": [{"role": "user", "content": f"Read {url}"}]}
+    )
+
+    assert client.calls == [url]
+    assert await context_cache.get(f"{url}|v2") == [f"<fresh>{url}</fresh>"]
+    assert await context_cache.get(url) is None
+
+
+class LargePageClient:
+    def __init__(self):
+        paragraphs = [f"Section {i}. " + "Routine content. " * 80 for i in range(20)]
+        paragraphs[9] += "The release date is in June."
+        self.text = "\n\n".join(paragraphs)
+
+    async def get_context(self, key: str) -> list[str]:
+        return render_snippets((await self.fetch(key)).snippets)
+
+    async def fetch(self, key: str) -> ContextResult:
+        return ContextResult(
+            snippets=[
+                WebsiteContextSnippet(url=key, text_content=self.text, title=None)
+            ]
+        )
+
+
+@pytest.mark.asyncio
+async def test_large_pages_are_cut_to_the_passages_the_turn_asks_about():
+    url = "https://example.com/long"
+    client = LargePageClient()
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: client})
+
+    asked = await hydrator.get_hydrated_chat(
+        {"messages": [{"role": "user", "content": f"When is the release date? {url}"}]}
+    )
+    plain = await hydrator.get_hydrated_chat(
+        {"messages": [{"role": "user", "content": url}]}
+    )
+
+    asked_content = asked["messages"][0]["content"]
+    assert "Section 9." in asked_content
+    assert "Section 0." not in asked_content
+    assert len(asked_content) < len(client.text) / 3
+    # without a question the whole page is kept
+    assert "Section 0." in plain["messages"][0]["content"]
+    assert "Section 19." in plain["messages"][0]["content"]
+    # the page is cached whole, and only cut down when rendered
+    assert (await context_cache.get(url))[0].content["text_content"] == client.text
+
+
+@pytest.mark.asyncio
+async def test_large_pages_are_cut_on_a_worker_thread(mocker):
+    url = "https://example.com/long"
+    client = LargePageClient()
+    hydrator = ChatHydrator({ContextCommand.WEBSITE: client})
+    to_thread = mocker.spy(asyncio, "to_thread")
+
+    await hydrator.get_hydrated_chat(
+        {"messages": [{"role": "user", "content": f"When is the release date? {url}"}]}
+    )
+
+    to_thread.assert_any_call(select_passages, client.text, mocker.ANY)
@@ -0,0 +1,49 @@
+import time
+
+from src.memory_cache import MemoryCache
+
+
+def test_get_returns_value_and_counts_hits_and_misses():
+    cache = MemoryCache(max_bytes=100)
+    cache.set("a", "value", size=5, ttl_seconds=60)
+
+    assert cache.get("a") == "value"
+    assert cache.get("b") is None
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+
+
+def test_least_recently_used_entries_are_evicted_to_fit_byte_budget():
+    cache = MemoryCache(max_bytes=10)
+    cache.set("a", "a", size=4, ttl_seconds=60)
+    cache.set("b", "b", size=4, ttl_seconds=60)
+    cache.get("a")  # a is now more recent than b
+    cache.set("c", "c", size=4, ttl_seconds=60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "a"
+    assert cache.get("c") == "c"
+    assert cache.stats.evictions == 1
+    assert cache.stats.bytes == 8
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache = MemoryCache(max_bytes=100)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.set("a", "value", size=1, ttl_seconds=5)
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 6)
+
+    assert cache.get("a") is None
+    assert cache.stats.expirations == 1
+    assert cache.stats.entries == 0
+
+
+def test_entries_larger_than_budget_are_not_stored():
+    cache = MemoryCache(max_bytes=10)
+    cache.set("small", "s", size=5, ttl_seconds=60)
+    cache.set("huge", "h", size=11, ttl_seconds=60)
+
+    assert cache.get("huge") is None
+    assert cache.get("small") == "s"
@@ -0,0 +1,75 @@
+from src.passage_selection import (
+    PASSAGE_SEPARATOR,
+    TRUNCATION_MARKER,
+    query_terms,
+    score_passages,
+    select_passages,
+    split_passages,
+)
+
+
+def _paragraph(i: int, extra: str = "") -> str:
+    return f"Paragraph {i}. " + "Nothing much happened that day. " * 40 + extra
+
+
+BOOK = "\n\n".join(
+    _paragraph(i, "Natasha danced at the ball." if i in (3, 30) else "")
+    for i in range(40)
+)
+
+
+def test_query_terms_drop_stopwords_and_duplicates():
+    assert query_terms("Who is Natasha, and who is NATASHA's brother?") == [
+        "natasha",
+        "brother",
+    ]
+
+
+def test_small_text_is_returned_as_is():
+    assert select_passages("short text", "anything") == "short text"
+
+
+def test_selects_matching_passages_in_document_order():
+    selected = select_passages(BOOK, "who is Natasha", max_chars=5000, top_k=3)
+
+    parts = selected.split(PASSAGE_SEPARATOR)
+    assert len(parts) == 2
+    assert parts[0].startswith("Paragraph 3.")
+    assert parts[1].startswith("Paragraph 30.")
+    assert len(selected) <= 5000
+
+
+def test_rarer_terms_weigh_more():
+    passages = split_passages(BOOK)
+
+    scores = score_passages(BOOK, passages, ["natasha", "happened"])
+
+    best = max(range(len(passages)), key=scores.__getitem__)
+    assert BOOK[passages[best][0] :].startswith(("Paragraph 3.", "Paragraph 30."))
+
+
+def test_best_passage_is_cut_to_the_cap():
+    selected = select_passages(BOOK, "Natasha", max_chars=100)
+
+    assert len(selected) == 100
+    assert selected.startswith("Paragraph 3.")
+
+
+def test_unmatched_or_empty_questions_truncate():
+    assert (
+        select_passages(BOOK, "zeppelin", max_chars=50) == BOOK[:50] + TRUNCATION_MARKER
+    )
+    assert select_passages(BOOK, "who is it", max_chars=50) == (
+        BOOK[:50] + TRUNCATION_MARKER
+    )
+    assert select_passages(BOOK, "Natasha", max_chars=0) == BOOK
+
+
+def test_text_without_paragraphs_is_split_evenly():
+    text = "word " * 1000
+
+    passages = split_passages(text, passage_chars=1000)
+
+    assert passages[0] == (0, 1000)
+    assert passages[-1][1] == len(text)
+    assert all(end - start <= 2000 for start, end in passages)
@@ -0,0 +1,257 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from src.proxy import (
+    ProxyApp,
+    iter_sse_events,
+    relay_until_disconnect,
+    stream_request_body,
+)
+
+
+class RecordingHydrator:
+    def __init__(self):
+        self.calls = []
+        self.deadlines = []
+
+    async def get_hydrated_body(self, body, deadline_seconds=None):
+        chat = json.loads(body)
+        self.calls.append(chat)
+        self.deadlines.append(deadline_seconds)
+        hydrated = dict(chat)
+        hydrated["hydrated"] = True
+        return json.dumps(hydrated).encode("utf-8")
+
+
+async def _aiter(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def _make_proxy(handler, hydrator=None):
+    proxy = ProxyApp(
+        base_url="http://upstream", hydrator=hydrator or RecordingHydrator()
+    )
+    proxy.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return proxy
+
+
+@pytest.mark.asyncio
+async def test_proxy_hydrates_chat_completions():
+    seen = {}
+
+    async def handler(request: httpx.Request):
+        seen["url"] = str(request.url)
+        seen["body"] = json.loads(request.content)
+        return httpx.Response(200, json={"choices": []})
+
+    hydrator = RecordingHydrator()
+    proxy = _make_proxy(handler, hydrator)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=proxy), base_url="http://proxy"
+    ) as client:
+        response = await client.post(
+            "/v1/chat/completions?x=1",
+            json={"messages": [{"role": "user", "content": "hi"}]},
+        )
+
+    assert response.status_code == 200
+    assert response.json() == {"choices": []}
+    assert seen["url"] == "http://upstream/v1/chat/completions?x=1"
+    assert seen["body"]["hydrated"] is True
+    assert len(hydrator.calls) == 1
+    assert hydrator.deadlines == [None]
+
+
+@pytest.mark.asyncio
+async def test_proxy_passes_hydration_deadline_header_to_hydrator():
+    seen = {}
+
+    async def handler(request: httpx.Request):
+        seen["headers"] = request.headers
+        return httpx.Response(200, json={"choices": []})
+
+    hydrator = RecordingHydrator()
+    proxy = _make_proxy(handler, hydrator)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=proxy), base_url="http://proxy"
+    ) as client:
+        for deadline in ("2.5", "soon"):
+            await client.post(
+                "/v1/chat/completions",
+                json={"messages": [{"role": "user", "content": "hi"}]},
+                headers={"X-Hydration-Deadline": deadline},
+            )
+
+    assert hydrator.deadlines == [2.5, None]
+    # the header is for the proxy only
+    assert "x-hydration-deadline" not in seen["headers"]
+
+
+@pytest.mark.asyncio
+async def test_proxy_forwards_other_bodies_untouched():
+    seen = {}
+
+    async def handler(request: httpx.Request):
+        seen["body"] = request.content
+        return httpx.Response(201, content=b"ok")
+
+    hydrator = RecordingHydrator()
+    proxy = _make_proxy(handler, hydrator)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=proxy), base_url="http://proxy"
+    ) as client:
+        response = await client.post("/v1/audio/transcriptions", content=b"\x00\x01")
+
+    assert response.status_code == 201
+    assert seen["body"] == b"\x00\x01"
+    assert hydrator.calls == []
+
+
+@pytest.mark.asyncio
+async def test_proxy_returns_502_when_upstream_unreachable():
+    async def handler(request: httpx.Request):
+        raise httpx.ConnectError("boom", request=request)
+
+    proxy = _make_proxy(handler)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=proxy), base_url="http://proxy"
+    ) as client:
+        response = await client.get("/v1/models")
+
+    assert response.status_code == 502
+    assert response.json()["error"]["type"] == "proxy_error"
+
+
+@pytest.mark.asyncio
+async def test_proxy_creates_its_client_when_served_without_lifespan(mocker):
+    async def handler(request: httpx.Request):
+        return httpx.Response(200, json={"data": []})
+
+    create = mocker.patch(
+        "src.proxy.create_upstream_client",
+        return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    proxy = ProxyApp(base_url="http://upstream", hydrator=RecordingHydrator())
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=proxy), base_url="http://proxy"
+    ) as client:
+        first = await client.get("/v1/models")
+        second = await client.get("/v1/models")
+    await proxy.shutdown()
+
+    assert (first.status_code, second.status_code) == (200, 200)
+    # one pooled client, reused by later requests
+    create.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_iter_sse_events_reframes_split_events():
+    chunks = [b'data: {"a"', b': 1}\n\ndata: {"b": 2}\n', b"\ndata: [DONE]\n\n"]
+
+    events = [event async for event in iter_sse_events(_aiter(chunks))]
+
+    assert events == [
+        b'data: {"a": 1}\n\n',
+        b'data: {"b": 2}\n\n',
+        b"data: [DONE]\n\n",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_iter_sse_events_handles_crlf_and_trailing_data():
+    chunks = [b"data: one\r\n\r\ndata: tail"]
+
+    events = [event async for event in iter_sse_events(_aiter(chunks))]
+
+    assert events == [b"data: one\r\n\r\n", b"data: tail"]
+
+
+@pytest.mark.asyncio
+async def test_relay_stops_when_client_disconnects():
+    sent = []
+    upstream_closed = asyncio.Event()
+
+    async def endless_upstream():
+        try:
+            while True:
+                yield b"data: tick\n\n"
+                await asyncio.sleep(0.01)
+        finally:
+            upstream_closed.set()
+
+    async def receive():
+        await asyncio.sleep(0.05)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await asyncio.wait_for(
+        relay_until_disconnect(endless_upstream(), receive, send), timeout=1
+    )
+
+    assert sent, "expected some chunks before the disconnect"
+    assert upstream_closed.is_set()
+
+
+@pytest.mark.asyncio
+async def test_proxy_streams_non_chat_bodies_with_original_length():
+    seen = {}
+
+    async def handler(request: httpx.Request):
+        seen["content_length"] = request.headers.get("content-length")
+        seen["body"] = await request.aread()
+        return httpx.Response(200, content=b"ok")
+
+    proxy = _make_proxy(handler)
+    payload = b"x" * 50_000
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=proxy), base_url="http://proxy"
+    ) as client:
+        response = await client.post("/v1/files", content=payload)
+
+    assert response.status_code == 200
+    assert seen["body"] == payload
+    assert seen["content_length"] == str(len(payload))
+
+
+@pytest.mark.asyncio
+async def test_stream_request_body_yields_chunks_as_received():
+    messages = [
+        {"type": "http.request", "body": b"one", "more_body": True},
+        {"type": "http.request", "body": b"two", "more_body": False},
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    chunks = [chunk async for chunk in stream_request_body(receive)]
+
+    assert chunks == [b"one", b"two"]
+
+
+@pytest.mark.asyncio
+async def test_proxy_rejects_bodies_over_the_limit():
+    async def handler(request: httpx.Request):
+        await request.aread()
+        return httpx.Response(200)
+
+    proxy = _make_proxy(handler)
+    proxy.max_body_size = 10
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=proxy), base_url="http://proxy"
+    ) as client:
+        declared = await client.post("/v1/files", content=b"x" * 11)
+
+        async def undeclared_body():
+            yield b"x" * 6
+            yield b"x" * 6
+
+        streamed = await client.post("/v1/files", content=undeclared_body())
+
+    assert declared.status_code == 413
+    assert streamed.status_code == 413
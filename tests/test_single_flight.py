@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from src.single_flight import SingleFlight
+
+
+class CountingFetch:
+    def __init__(self, result="value", delay=0.02, error: Exception | None = None):
+        self.calls = 0
+        self.result = result
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class FakeLockCache:
+    """Lock cache where another worker already holds every lock."""
+
+    def __init__(self):
+        self.locked = True
+        self.values: dict[str, str] = {}
+
+    async def acquire_lock(self, name, ttl_ms):
+        return None if self.locked else "token"
+
+    async def release_lock(self, name, token):
+        self.locked = False
+
+    async def is_locked(self, name):
+        return self.locked
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_for_same_key_share_one_fetch():
+    flight = SingleFlight()
+    fetch = CountingFetch()
+
+    results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(10)))
+
+    assert results == ["value"] * 10
+    assert fetch.calls == 1
+    assert flight.stats.leaders == 1
+    assert flight.stats.coalesced == 9
+
+
+@pytest.mark.asyncio
+async def test_different_keys_fetch_independently():
+    flight = SingleFlight()
+    fetch = CountingFetch()
+
+    await asyncio.gather(flight.do("a", fetch), flight.do("b", fetch))
+
+    assert fetch.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_not_remembered():
+    flight = SingleFlight()
+    failing = CountingFetch(error=RuntimeError("down"))
+
+    results = await asyncio.gather(
+        flight.do("k", failing), flight.do("k", failing), return_exceptions=True
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert failing.calls == 1
+    # the next call after a failure starts a fresh fetch
+    assert await flight.do("k", CountingFetch(result="ok")) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_fetch():
+    flight = SingleFlight()
+    fetch = CountingFetch(delay=0.05)
+
+    first = asyncio.create_task(flight.do("k", fetch))
+    second = asyncio.create_task(flight.do("k", fetch))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "value"
+    assert fetch.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_waits_for_other_worker_holding_the_lock():
+    lock_cache = FakeLockCache()
+    flight = SingleFlight(
+        lock_cache=lock_cache, lock_wait_seconds=1, poll_interval_seconds=0.01
+    )
+    fetch = CountingFetch(result="ours")
+
+    async def other_worker_finishes():
+        await asyncio.sleep(0.03)
+        lock_cache.values["k"] = "theirs"
+
+    asyncio.create_task(other_worker_finishes())
+
+    async def recheck():
+        return lock_cache.values.get("k")
+
+    result = await flight.do("k", fetch, recheck=recheck)
+
+    assert result == "theirs"
+    assert fetch.calls == 0
+    assert flight.stats.lock_waits == 1
@@ -0,0 +1,31 @@
+import httpx
+import pytest
+
+from src.upstream import UpstreamClientSettings, create_upstream_client
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("UPSTREAM_HTTP2", "true")
+    monkeypatch.setenv("UPSTREAM_READ_TIMEOUT", "42.5")
+
+    settings = UpstreamClientSettings.from_env()
+
+    assert settings.max_connections == 7
+    assert settings.http2 is True
+    assert settings.read_timeout == 42.5
+    # untouched values keep their defaults
+    assert settings.connect_timeout == UpstreamClientSettings().connect_timeout
+
+
+@pytest.mark.asyncio
+async def test_create_upstream_client_applies_timeouts():
+    settings = UpstreamClientSettings(connect_timeout=1.0, read_timeout=2.0)
+
+    client = create_upstream_client(settings)
+    try:
+        assert isinstance(client, httpx.AsyncClient)
+        assert client.timeout.connect == 1.0
+        assert client.timeout.read == 2.0
+    finally:
+        await client.aclose()
@@ -0,0 +1,65 @@
+import pytest
+
+from src.url_canonicalizer import canonicalize_url, trim_trailing_punctuation
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://x.com/a",
+        "https://x.com/a/",
+        "https://X.com/a#frag",
+        "https://x.com/a?utm_source=newsletter&utm_medium=email",
+        "https://x.com/a?fbclid=abc123",
+        "HTTPS://x.com:443/a",
+        "https://x.com/a).",
+        "https://x.com/a,",
+    ],
+)
+def test_spellings_of_one_page_share_a_key(url):
+    assert canonicalize_url(url) == "https://x.com/a"
+
+
+def test_keeps_meaningful_query_parameters_sorted_and_unencoded():
+    assert (
+        canonicalize_url("https://x.com/s?q=a+b%20c&utm_campaign=x&page=2&flag")
+        == "https://x.com/s?flag&page=2&q=a+b%20c"
+    )
+    # repeated parameters keep their relative order
+    assert canonicalize_url("https://x.com/?b=2&a=1&b=1") == "https://x.com?a=1&b=2&b=1"
+
+
+def test_tracking_parameters_are_configurable():
+    assert (
+        canonicalize_url("https://x.com/?ref=home&utm_source=x", ["ref"])
+        == "https://x.com?utm_source=x"
+    )
+
+
+def test_keeps_ports_userinfo_and_ipv6_hosts():
+    assert canonicalize_url("http://x.com:8080/a") == "http://x.com:8080/a"
+    assert canonicalize_url("http://x.com:80/a") == "http://x.com/a"
+    assert canonicalize_url("https://User:Pw@X.com/") == "https://User:Pw@x.com"
+    assert canonicalize_url("https://[::1]:8443/a/") == "https://[::1]:8443/a"
+
+
+@pytest.mark.parametrize(
+    "url, trimmed",
+    [
+        ("https://x.com/a.", "https://x.com/a"),
+        ("https://x.com/a?!", "https://x.com/a"),
+        ("https://x.com/a)", "https://x.com/a"),
+        ("https://en.wikipedia.org/wiki/Python_(language)", None),
+        (
+            "https://en.wikipedia.org/wiki/Python_(language)).",
+            "https://en.wikipedia.org/wiki/Python_(language)",
+        ),
+        ("https://x.com/a.html", None),
+    ],
+)
+def test_trim_trailing_punctuation(url, trimmed):
+    assert trim_trailing_punctuation(url) == (trimmed or url)
+
+
+def test_leaves_unparseable_urls_alone():
+    assert canonicalize_url("https://x.com:notaport/a") == "https://x.com:notaport/a"